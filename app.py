@@ -1,31 +1,46 @@
 import os
-import sys
 import json
 import streamlit as st
-from datetime import datetime
 from streamlit_autorefresh import st_autorefresh
+from event_store import EVENT_DB_PATH, EventView, get_store
+from job_queue import DEAD, DONE, IMAGE_JOB, PENDING, PRIORITY_HIGH, PRIORITY_NORMAL, RUNNING, get_queue, image_job_key
+from metrics import get_metrics
+import thumbnails
 
 DB_DIR = "data_source/dynamodb_anomaly_data"
 PDF_DIR = "data_source/s3_work_instruction_pdf"
-DATA_FILE = f"{DB_DIR}/dummy_safety_events_2025.json" # 이벤트 JSON 데이터 파일 경로 (예시)
-
-def save_json_event(data, filepath:str=DATA_FILE):
-    # 기존 데이터 로드 또는 빈 리스트
-    if os.path.exists(filepath):
-        with open(filepath, "r", encoding="utf-8") as f:
-            try:
-                existing_data = json.load(f)
-            except json.JSONDecodeError:
-                existing_data = []
-    else:
-        existing_data = []
-
-    # 데이터 추가 및 저장
-    existing_data.append(data)
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(existing_data, f, indent=2, ensure_ascii=False)
-
-    return filepath
+JOB_REFRESH_MS = 3000 # 분석 대기 작업이 있을 때 새로고침 주기
+STREAM_REFRESH_MS = 1000 # 분석 진행 중(답변 생성 중)일 때 새로고침 주기
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "10")) # 카메라별 한 페이지에 표시할 이벤트 수
+
+def save_json_event(data, db_path:str=str(EVENT_DB_PATH)):
+    # eventId 기준 멱등 기록 (이미 존재하면 무시)
+    get_store(db_path).put_item(data)
+    return db_path
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def thumbnail_path(img_path: str, mtime: float) -> str:
+    # thumbKey 가 없는 이전 이벤트용: 원본에서 썸네일을 만들어(내용 해시 캐시) 경로를 반환
+    return thumbnails.thumb_path(thumbnails.make_thumbnail_for_file(img_path))
+
+def event_image_path(evt):
+    # 원본 이미지의 로컬 경로 (객체 저장소에 올라온 이미지는 버킷/키로 찾음)
+    key = evt.get("imageS3Key")
+    if key and evt.get("imageS3Bucket"):
+        from object_store import get_object_store
+        return get_object_store().path(evt["imageS3Bucket"], key)
+    return key
+
+def event_thumbnail(evt, img_path: str) -> str:
+    thumb_key = evt.get("thumbKey")
+    if thumb_key and os.path.exists(thumbnails.thumb_path(thumb_key)):
+        return thumbnails.thumb_path(thumb_key)
+    return thumbnail_path(img_path, os.path.getmtime(img_path))
+
+@st.cache_resource
+def get_event_view() -> EventView:
+    # 세션/rerun 간에 공유되는 이벤트 뷰 (저장소 version 이후 변경분만 읽어 반영)
+    return EventView(get_store())
 
 
 # 페이지 기본 설정
@@ -34,76 +49,87 @@ st.set_page_config(page_title="SafeGuard AI Dashboard", layout="wide")
 st.title("📹 SafeGuard AI Dashboard")
 st.write("카메라별 실시간 상태, 이벤트 발생이력 및 AI 분석 리포트를 확인합니다.")
 
-# 1. 이벤트 데이터 불러오기 (로컬 JSON 파일)
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        events = json.load(f)
-else:
-    st.error(f"데이터 파일을 찾을 수 없습니다: {DATA_FILE}")
-    st.stop()
-
-# JSON 데이터가 리스트 형식의 이벤트 모음이라고 가정
-if not isinstance(events, list):
-    st.error("이벤트 데이터 형식이 올바르지 않습니다. 리스트 형태여야 합니다.")
-    st.stop()
-
-# 문자열 타임스탬프를 datetime으로 변환하여 정렬 (최신 이벤트 먼저)
-for evt in events:
-    try:
-        evt_time = datetime.fromisoformat(evt["ts"].replace("Z", "+00:00"))
-    except Exception:
-        evt_time = datetime.min
-    evt["__parsed_time"] = evt_time
-
-
-# 이벤트를 시간 기준으로 내림차순 정렬 (최신순)
-events.sort(key=lambda x: x["__parsed_time"], reverse=True)
-
+# 1. 이벤트 데이터 불러오기 (캐시된 뷰에 신규/갱신 이벤트만 반영)
+events_view = get_event_view()
+events_view.refresh()
+partitions = events_view.partitions() # [(pk, deviceId), ...]
 
 # 2. 사이드바 - 필터 위젯
-camera_list = ["(전체)"] + sorted({ evt["deviceId"] for evt in events })
-severity_list = ["(전체)"] + sorted({ evt["severity"] for evt in events })
+camera_list = ["(전체)"] + sorted({ cam for _, cam in partitions })
+severity_list = ["(전체)"] + events_view.severities()
 
 # 이벤트 감지 (예시생성)
 st.sidebar.header("이벤트 생성")
-with st.spinner("분석 중입니다... 잠시만 기다려 주세요."):
-    if st.sidebar.button("이벤트 감지하기"):
-        # 이벤트 감지 함수 호출
-        import lambda_function_event
-        response = lambda_function_event.generate_event_data()
-        st.success(f"이벤트가 감지되었습니다.")
-
-        print(response)
-        print(response["content"])
-        print(response["content"]["item"])
-        # EventBridge에 이벤트 전송후 RAG Pipeline 실행
-        sys.path.append(os.path.abspath("ecs-rag-pipeline"))
-        import workflow
-        workflow.run_rag_pipeline(response["content"]["item"])
-        st.write(f"분석완료하였습니다. ")    
-        try:
-            st.rerun()
-        except AttributeError:
-            st.experimental_rerun()
+stream_high = st.sidebar.checkbox("HIGH 이벤트는 우선 분석 (실시간 표시)", value=True)
+if st.sidebar.button("이벤트 감지하기"):
+    # 이벤트 감지 함수 호출
+    import lambda_function_event
+    response = lambda_function_event.generate_event_data()
+    content = response["content"]
+    item = content["item"]
+    st.success(f"이벤트가 감지되었습니다.")
+
+    # 고위험 이벤트는 우선순위를 올려 먼저 처리하고, 생성 중인 답변은 작업 진행 상황(progress)으로 표시
+    urgent = stream_high and item["severity"] == "HIGH"
+    priority = PRIORITY_HIGH if urgent else PRIORITY_NORMAL
+    if content.get("imageRecord"):
+        # S3 업로드 알림 → 작업 큐 → 워커가 썸네일/이미지 분석 후 (analyze 면) RAG 분석 작업 등록
+        job_id = get_queue().enqueue_image(item["eventId"], content["imageRecord"], content["analyze"], priority)
+        st.sidebar.info(f"이미지 분석 작업이 등록되었습니다. (job {job_id}{', 우선 처리' if urgent else ''})")
+    elif not content["analyze"]:
+        # 진행 중인 인시던트에 합쳐진 이벤트는 다시 분석하지 않음
+        st.sidebar.info(f"기존 인시던트에 병합되었습니다. (eventId {item['eventId']}, "
+                        f"{item.get('incident', {}).get('count', 1)}건)")
+    else:
+        # EventBridge(작업 큐)에 이벤트 전송 → ECS 워커가 RAG Pipeline 실행
+        job_id = get_queue().enqueue(item, priority=priority)
+        st.sidebar.info(f"분석 작업이 등록되었습니다. (job {job_id}{', 우선 처리' if urgent else ''})")
+
+# 분석 작업 현황 (진행 중인 작업이 있으면 주기적으로 새로고침)
+job_counts = get_queue().counts()
+st.sidebar.caption(
+    f"분석 대기 {job_counts.get(PENDING, 0)} · 진행 {job_counts.get(RUNNING, 0)} · "
+    f"완료 {job_counts.get(DONE, 0)} · 실패(DLQ) {job_counts.get(DEAD, 0)}"
+)
+if job_counts.get(RUNNING, 0):
+    # 워커가 생성 중인 답변을 기록하므로 짧은 주기로 갱신
+    st_autorefresh(interval=STREAM_REFRESH_MS, key="job_refresh")
+    for job in get_queue().recent(limit=5, statuses=[RUNNING]):
+        payload = job["payload"]
+        with st.container(border=True):
+            if payload.get("kind") == IMAGE_JOB:
+                st.markdown(f"**이미지 분석 중** · eventId {payload.get('eventId')}")
+                continue
+            st.markdown(f"**AI 분석 중** · {payload.get('eventType')} ({payload.get('deviceId')}, {payload.get('severity')})")
+            st.write((job["progress"] or "") + " ▌")
+elif job_counts.get(PENDING, 0):
+    st_autorefresh(interval=JOB_REFRESH_MS, key="job_refresh")
+
+# 단계별 처리 시간 (최근 24시간, 워커/업로드/대시보드 실행 모두 포함)
+with st.expander("⏱️ 단계별 처리 시간 (p50 / p95 / p99)", expanded=False):
+    stage_summary = get_metrics().summary()
+    if stage_summary:
+        st.dataframe(stage_summary, hide_index=True, use_container_width=True)
+    else:
+        st.write("계측된 처리 기록이 없습니다.")
 
 # 파일업로드
 st.sidebar.header("임베딩")
 uploaded_file = st.sidebar.file_uploader("작업지시서를 업로드해주세요.", type=["pdf"], key="pdf_uploader")  
 
-# 업로드된 파일 처리  
-import lambda_function_embedding 
+# 업로드된 파일 처리 (임베딩 모듈은 import 가 무거우므로 업로드가 있을 때만 로드)
 if uploaded_file is not None:  
+    import lambda_function_embedding
     file_name = uploaded_file.name 
+    data = uploaded_file.getvalue()
+    # 작업지시서 보관용으로 저장하되, 임베딩은 메모리의 바이트에서 바로 파싱
     save_path = os.path.join(PDF_DIR, file_name)    
     with open(save_path, "wb") as f:  
-        f.write(uploaded_file.read()) 
+        f.write(data) 
 
-    event = {
-        "file_name": file_name
-    }     
      # 로딩 상태 표시  
     with st.spinner("파일을 저장하는 중입니다... 잠시만 기다려 주세요."):
-        response = lambda_function_embedding.lambda_handler(event, None)     
+        response = lambda_function_embedding.ingest_upload(file_name, data)     
     st.session_state.pop("pdf_uploader", None)
     st.sidebar.info("임베딩 완료! 새 파일을 선택하세요.")
     st.write(f"파일이 성공적으로 임베딩되었습니다: {response}")  
@@ -117,25 +143,21 @@ st.sidebar.header("필터")
 camera_filter = st.sidebar.selectbox("카메라 선택", camera_list)
 severity_filter = st.sidebar.selectbox("심각도 선택", severity_list)
 
-# 선택한 필터를 적용하여 이벤트 목록 필터링
-filtered_events = []
-
-for evt in events:
-    if camera_filter != "(전체)" and evt["deviceId"] != camera_filter:
-        continue
-    if severity_filter != "(전체)" and evt["severity"] != severity_filter:
+# 선택한 필터를 적용하여 카메라(pk)별로 최신순 조회
+severity_cond = {} if severity_filter == "(전체)" else {"severity": severity_filter}
+cameras = {}
+for pk, cam in partitions:
+    if camera_filter != "(전체)" and cam != camera_filter:
         continue
-    filtered_events.append(evt)
+    cam_events = events_view.query(pk, filters=severity_cond)
+    if cam_events:
+        cameras[cam] = cam_events
 
-# 3. 대시보드 내용 - 카메라별 섹션 출력
-if not filtered_events:
+# 3. 대시보드 내용 - 카메라별 섹션 출력 (최근 이벤트가 있는 카메라 먼저)
+if not cameras:
     st.write("선택된 조건에 해당하는 이벤트가 없습니다.")
 else:
-    # 필터된 이벤트들을 카메라별로 그룹화
-    cameras = {}
-    for evt in filtered_events:
-        cam = evt["deviceId"]
-        cameras.setdefault(cam, []).append(evt)
+    cameras = dict(sorted(cameras.items(), key=lambda kv: kv[1][0]["sk"], reverse=True))
     # 각 카메라별로 섹션 생성
     for cam, cam_events in cameras.items():
         # 카메라 섹션 헤더
@@ -144,27 +166,43 @@ else:
         latest_time = latest_evt["ts"]
         latest_sev = latest_evt["severity"]
         # 상태에 따라 텍스트에 색상 마크다운 적용
-        status_color = {"ACTIVATE": "🟢", "DEACTIVATE": "🟠"}
+        status_color = {"ACTIVATE": "🟢", "IMAGE_ATTACHED": "🟢", "DEACTIVATE": "🟠"}
         status_text = status_color.get(latest_status, latest_status)
         # 심각도에 따라 텍스트 적용
         sev_color = {"HIGH": "**HIGH**", "MEDIUM": "**MEDIUM**", "LOW": "**LOW**"}
         sev_text = sev_color.get(latest_sev, latest_sev)
         st.markdown(f"### 카메라[{status_text}] **{cam}** - 최근 이벤트: {latest_time} ({sev_text})")
-        # 카메라 이벤트 이력 나열
-        for evt in cam_events:
+        # 카메라 이벤트 이력 나열 (페이지 단위)
+        page_count = (len(cam_events) + PAGE_SIZE - 1) // PAGE_SIZE
+        page = 1
+        if page_count > 1:
+            page = st.number_input(
+                f"페이지 (총 {len(cam_events)}건, {page_count}페이지)",
+                min_value=1, max_value=page_count, value=1, step=1, key=f"page_{cam}",
+            )
+        for evt in cam_events[(page - 1) * PAGE_SIZE : page * PAGE_SIZE]:
             t = evt["ts"].replace("T", " ").replace("Z", "")
             event_type = evt.get("eventType", "")
             sev = evt.get("severity", "")
             msg = evt.get("message", "")
 
-            # 한 줄 요약 정보
-            st.write(f"- **[{t}] {event_type}** (심각도: {sev}) - {msg}")
+            # 한 줄 요약 정보 (합쳐진 버스트는 건수와 마지막 시각 표시)
+            incident = evt.get("incident") or {}
+            burst = (f" · {incident['count']}건, 마지막 {incident['lastTs'].replace('T', ' ').replace('Z', '')}"
+                     if incident.get("count", 1) > 1 else "")
+            st.write(f"- **[{t}] {event_type}** (심각도: {sev}{burst}) - {msg}")
             # 세부 정보 (AI 분석 리포트 등) expander로 표시
             with st.expander("자세히 보기", expanded=False):
                 # AI 분석 리포트 존재 여부 확인
                 advisor = evt.get("ragAdvisor")
                 if advisor:
                     st.write(advisor)
+                    timings = evt.get("timings")
+                    if timings:
+                        stages = " · ".join(f"{k} {v['ms']:.0f}ms" for k, v in timings.items()
+                                            if isinstance(v, dict) and "ms" in v)
+                        st.caption(f"{stages} · 합계 {timings['totalMs']:.0f}ms · "
+                                   f"토큰 {timings['tokens']} · ${timings['costUsd']:.4f}")
                     # st.write("**AI 권고 조치 계획:**")
                     # # Action Plan 단계별 표시
                     # for step in advisor.get("actionPlan", []):
@@ -177,11 +215,26 @@ else:
                     # if citations:
                     #     st.write(f"*참고 지침:* {', '.join(citations)}")
                 else:
-                    st.write("AI 분석 정보가 없습니다.")
-                # 관련 이미지 표시
-                img_path = evt.get("imageS3Key")
+                    job = get_queue().latest_for_event(evt["eventId"])
+                    image_job = None if job else get_queue().latest_for_event(image_job_key(evt["eventId"]))
+                    if image_job and image_job["status"] in (PENDING, RUNNING):
+                        st.write(f"이미지 분석 후 AI 분석이 시작됩니다... ({image_job['status']})")
+                    elif job and job["status"] in (PENDING, RUNNING):
+                        st.write(f"AI 분석 중입니다... ({job['status']}, 시도 {job['attempts']}/{job['max_attempts']})")
+                        if job["progress"]:
+                            st.write(job["progress"] + " ▌")
+                    elif job and job["status"] == DEAD:
+                        st.write("AI 분석에 실패했습니다. (DLQ)")
+                    else:
+                        st.write("AI 분석 정보가 없습니다.")
+                # 관련 이미지 표시 (기본은 썸네일, 원본은 요청 시에만 전송)
+                img_path = event_image_path(evt)
                 if img_path and os.path.exists(img_path):
-                    st.image(img_path, caption=f"이벤트 ID {evt.get('eventId')} 관련 이미지")
+                    caption = f"이벤트 ID {evt.get('eventId')} 관련 이미지"
+                    if st.toggle("원본 보기", key=f"full_{evt['eventId']}"):
+                        st.image(img_path, caption=caption)
+                    else:
+                        st.image(event_thumbnail(evt, img_path), caption=caption)
 
 
 
@@ -0,0 +1,106 @@
+'''
+Lambda 핸들러와 대시보드의 콜드 스타트(새 프로세스에서의 import / 첫 실행) 시간을 측정합니다.
+
+각 대상은 매번 새 파이썬 프로세스에서 측정하며, 반복 측정의 중앙값을 기록합니다.
+기준값 파일과 비교해 허용 범위를 넘으면 종료 코드 1 로 끝나므로 CI 에서 회귀를 잡을 수 있습니다.
+
+    python benchmarks/cold_start.py                                   # 측정 결과 출력
+    python benchmarks/cold_start.py --save benchmarks/cold_start_baseline.json
+    python benchmarks/cold_start.py --baseline benchmarks/cold_start_baseline.json --tolerance 0.5
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 대상 이름 -> 새 프로세스에서 시간을 잴 코드
+TARGETS = {
+    "lambda_function_event": "import lambda_function_event",
+    "lambda_function_embedding": "import lambda_function_embedding",
+    "chat": "import chat",
+    "workflow": "import workflow",
+    # 대시보드 첫 화면: 스크립트 전체를 한 번 실행 (업로드/분석 없이)
+    "app_first_run": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "AppTest.from_file('app.py', default_timeout=120).run()"
+    ),
+}
+
+_RUNNER = """
+import sys, time
+sys.path[:0] = [{root!r}, {pipeline!r}]
+started = time.perf_counter()
+exec(compile({code!r}, "<cold-start>", "exec"))
+print(time.perf_counter() - started)
+"""
+
+
+# Fucntions
+def measure(code: str) -> float:
+    runner = _RUNNER.format(root=str(ROOT), pipeline=str(ROOT / "ecs-rag-pipeline"), code=code)
+    out = subprocess.run(
+        [sys.executable, "-c", runner], cwd=ROOT, env=os.environ.copy(),
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+def run(targets: List[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in targets:
+        samples = [measure(TARGETS[name]) for _ in range(repeat)]
+        results[name] = {
+            "medianSec": round(statistics.median(samples), 3),
+            "minSec": round(min(samples), 3),
+            "maxSec": round(max(samples), 3),
+        }
+        print(f"{name:28s} median {results[name]['medianSec']:.3f}s  "
+              f"(min {results[name]['minSec']:.3f}s, max {results[name]['maxSec']:.3f}s)")
+    return results
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                tolerance: float, slack: float) -> List[str]:
+    failed = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        limit = baseline[name]["medianSec"] * (1 + tolerance) + slack
+        if result["medianSec"] > limit:
+            failed.append(f"{name}: {result['medianSec']:.3f}s > {limit:.3f}s "
+                          f"(baseline {baseline[name]['medianSec']:.3f}s)")
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the handlers and the dashboard")
+    parser.add_argument("targets", nargs="*", help=f"subset of {', '.join(TARGETS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown")
+    parser.add_argument("--slack", type=float, default=0.05, help="allowed absolute slowdown in seconds")
+    args = parser.parse_args()
+
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+
+    results = run(args.targets or list(TARGETS), args.repeat)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        failed = regressions(results, baseline, args.tolerance, args.slack)
+        for line in failed:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
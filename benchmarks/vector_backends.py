@@ -0,0 +1,206 @@
+'''
+Chroma 와 FAISS 벡터 저장소(faiss_store.py)의 색인 시간, 메모리, 질의 지연을 비교합니다.
+
+합성 벡터(군집이 있는 정규화 벡터)를 크기별로 만들어 각 저장소에 색인한 뒤, 새 프로세스에서 열어
+multi_query_search 와 같은 모양(질의 3개 배치, k=4)으로 필터 없는 / eventType 필터 질의를 보냅니다.
+색인과 질의는 각각 별도 프로세스에서 실행해 메모리(RSS)를 따로 잽니다. 질의 프로세스의 RssFile 은
+mmap 으로 공유되는 페이지, RssAnon 은 프로세스마다 따로 드는 메모리입니다.
+
+    python benchmarks/vector_backends.py                                  # 10k / 100k, 기본 백엔드
+    python benchmarks/vector_backends.py --sizes 10000 100000 1000000 --dim 256
+    python benchmarks/vector_backends.py --backends chroma faiss:Flat "faiss:IVF{nlist},PQ64x4fs" --json out.json
+
+1M x 1024 차원(Titan v2)은 벡터만 4GB 이므로 메모리가 작은 환경에서는 --dim 을 줄여서 측정하세요.
+FAISS 인덱스 문자열의 {nlist} 는 크기에 맞춰 4*sqrt(N) 으로 바뀝니다.
+'''
+
+import argparse
+import json
+import math
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT)]
+
+DEFAULT_BACKENDS = ["chroma", "faiss:Flat", "faiss:HNSW32", "faiss:IVF{nlist},PQ32x4fs"]
+EVENT_TYPES = 5        # 행마다 et_<n> 태그 하나 (필터 질의용)
+CLUSTERS = 256
+LATENT_DIM = 32
+BUILD_BATCH = 5000     # chromadb 의 최대 배치 크기(5461) 이하
+
+
+# Fucntions
+def _vectors(seed: int, start: int, count: int, dim: int) -> Any:
+    import numpy as np
+    # 같은 (seed, 위치) 는 항상 같은 벡터: 색인 프로세스와 정답(recall) 계산이 따로 만들어도 일치
+    # 실제 문장 임베딩처럼 고유 차원이 낮도록: LATENT_DIM 차원의 군집을 dim 차원으로 투영 + 작은 잡음
+    base = np.random.default_rng(seed)
+    centers = base.normal(size=(CLUSTERS, LATENT_DIM)).astype("float32")
+    projection = base.normal(size=(LATENT_DIM, dim)).astype("float32")
+    rng = np.random.default_rng([seed, start])
+    latent = centers[rng.integers(0, CLUSTERS, count)] + rng.normal(scale=0.5, size=(count, LATENT_DIM))
+    x = latent.astype("float32") @ projection + rng.normal(scale=0.5, size=(count, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def _batches(size: int, dim: int, seed: int) -> Iterator[Tuple[List[str], Any, List[str], List[Dict[str, Any]]]]:
+    for start in range(0, size, BUILD_BATCH):
+        count = min(BUILD_BATCH, size - start)
+        ids = [f"chunk-{i:08d}" for i in range(start, start + count)]
+        metas = [{"sourceDoc": "synthetic.pdf", f"et_{i % EVENT_TYPES}": True} for i in range(start, start + count)]
+        yield ids, _vectors(seed, start, count, dim), [f"synthetic chunk {i}" for i in range(start, start + count)], metas
+
+def _memory() -> Dict[str, float]:
+    fields = {}
+    with open("/proc/self/status", encoding="utf-8") as fp:
+        for line in fp:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM", "RssAnon", "RssFile"):
+                fields[key] = round(int(value.split()[0]) / 1024, 1)  # MB
+    return fields
+
+def _dir_size(path: str) -> float:
+    return round(sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file()) / 2**20, 1)
+
+def _open(backend: str, path: str, read_only: bool) -> Any:
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=path)
+        return client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+    from faiss_store import FaissVectorStore
+    return FaissVectorStore(path, embeddings=None, read_only=read_only, index_spec=backend.split(":", 1)[1])
+
+def build(backend: str, path: str, size: int, dim: int, seed: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    store = _open(backend, path, read_only=False)
+    for ids, vectors, texts, metas in _batches(size, dim, seed):
+        if backend == "chroma":
+            store.add(ids=ids, embeddings=vectors.tolist(), documents=texts, metadatas=metas)
+        else:
+            store.add_embeddings(ids, vectors, texts, metas)
+    if backend != "chroma":
+        store.persist()
+    return {"buildSec": round(time.perf_counter() - started, 2), "diskMb": _dir_size(path),
+            "buildPeakRssMb": _memory().get("VmHWM")}
+
+def _exact_top_k(queries: Any, size: int, dim: int, seed: int, k: int) -> List[set]:
+    import numpy as np
+    best_scores = np.full((len(queries), k), -np.inf, dtype="float32")
+    best_ids = np.zeros((len(queries), k), dtype="int64")
+    for start in range(0, size, BUILD_BATCH):
+        count = min(BUILD_BATCH, size - start)
+        scores = queries @ _vectors(seed, start, count, dim).T
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + count), (len(queries), count))], axis=1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        best_scores, best_ids = np.take_along_axis(scores, order, 1), np.take_along_axis(ids, order, 1)
+    return [{f"chunk-{i:08d}" for i in row} for row in best_ids]
+
+def query(backend: str, path: str, size: int, dim: int, seed: int, n_queries: int, batch: int,
+          k: int) -> Dict[str, Any]:
+    baseline = _memory()
+    started = time.perf_counter()
+    store = _open(backend, path, read_only=True)
+    open_ms = (time.perf_counter() - started) * 1000
+    after_open = _memory()
+
+    queries = _vectors(seed, size, n_queries, dim)  # 같은 군집에서 뽑은, 색인에 없는 벡터
+    results: Dict[str, Any] = {"openMs": round(open_ms, 1)}
+    found: List[List[str]] = []
+    for label, where in (("unfiltered", None), ("filtered", {"et_0": True})):
+        latencies = []
+        for i in range(0, n_queries, batch):
+            part = queries[i:i + batch]
+            started = time.perf_counter()
+            result = store.query(query_embeddings=part.tolist() if backend == "chroma" else part, n_results=k,
+                                 where=where, include=["documents", "metadatas", "distances"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            if where is None:
+                found += result["ids"]
+        latencies.sort()
+        results[f"{label}P50Ms"] = round(statistics.median(latencies), 2)
+        results[f"{label}P95Ms"] = round(latencies[int(0.95 * (len(latencies) - 1))], 2)
+
+    exact = _exact_top_k(queries, size, dim, seed, k)
+    results[f"recall@{k}"] = round(sum(len(set(f) & e) for f, e in zip(found, exact)) / (k * n_queries), 3)
+    after = _memory()
+    results.update({
+        "openRssMb": round(after_open["VmRSS"] - baseline["VmRSS"], 1),
+        "queryRssAnonMb": after["RssAnon"],
+        "queryRssFileMb": after["RssFile"],  # mmap (프로세스 간 공유 가능)
+    })
+    return results
+
+def _run_worker(*args: Any) -> Dict[str, Any]:
+    # 색인/질의를 새 프로세스에서 실행해 import 와 메모리 측정을 분리
+    out = subprocess.run([sys.executable, __file__, "--worker", json.dumps(args)], cwd=ROOT,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "worker failed")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def run(backends: List[str], sizes: List[int], dim: int, n_queries: int, batch: int, k: int,
+        seed: int) -> List[Dict[str, Any]]:
+    rows = []
+    for size in sizes:
+        for backend in backends:
+            backend = backend.replace("{nlist}", str(max(1, int(4 * math.sqrt(size)))))
+            workdir = tempfile.mkdtemp(prefix="vector-bench-")
+            row: Dict[str, Any] = {"backend": backend, "size": size, "dim": dim}
+            try:
+                row.update(_run_worker("build", backend, workdir, size, dim, seed))
+                row.update(_run_worker("query", backend, workdir, size, dim, seed, n_queries, batch, k))
+            except RuntimeError as e:
+                row["error"] = str(e)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            rows.append(row)
+            print(_format(row), flush=True)
+    return rows
+
+def _format(row: Dict[str, Any]) -> str:
+    head = f"{row['backend']:22s} {row['size']:>9,d}"
+    if "error" in row:
+        return f"{head}  ERROR {row['error']}"
+    recall = next(v for key, v in row.items() if key.startswith("recall@"))
+    return (f"{head}  build {row['buildSec']:8.2f}s  disk {row['diskMb']:8.1f}MB  open {row['openMs']:8.1f}ms  "
+            f"p50 {row['unfilteredP50Ms']:7.2f}ms  p95 {row['unfilteredP95Ms']:7.2f}ms  "
+            f"filtered p50 {row['filteredP50Ms']:7.2f}ms  recall {recall:.3f}  "
+            f"rss anon {row['queryRssAnonMb']:7.1f}MB file {row['queryRssFileMb']:7.1f}MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chroma vs FAISS vector backend benchmark")
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=3, help="query vectors per call (planner queries)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write results to a JSON file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        stage, *params = json.loads(args.worker)
+        print(json.dumps((build if stage == "build" else query)(*params)))
+        return
+
+    unknown = [b for b in args.backends if b != "chroma" and not b.startswith("faiss:")]
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(unknown)} (use chroma or faiss:<index_factory spec>)")
+
+    rows = run(args.backends, args.sizes, args.dim, args.queries, args.batch, args.k, args.seed)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+'''
+디스크 기반 LRU 캐시와, 이를 이용해 임베딩 결과를 재사용하는 Embeddings 래퍼입니다.
+
+임베딩은 (모델 ID, 정규화된 텍스트의 SHA-256) 을 키로 SQLite 파일에 저장되므로
+같은 PDF 를 다시 업로드하거나 같은 질의를 다시 보내도 Bedrock 을 호출하지 않습니다.
+'''
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+from metrics import estimate_cost, estimate_tokens, observe
+
+# Configuration
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./data_source/embedding_cache/embeddings.db")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+BUSY_TIMEOUT_SEC = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key         TEXT PRIMARY KEY,
+    value       BLOB NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache (last_access);
+"""
+
+
+# Fucntions
+def normalize_text(text: str) -> str:
+    # 유니코드 정규화 + 공백 정리 (PDF 재추출 시 생기는 공백 차이를 같은 키로 취급)
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_key(namespace: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class DiskLRUCache:
+    """key → bytes 를 저장하는 SQLite LRU 캐시. max_entries 를 넘으면 가장 오래 안 쓴 항목부터 지웁니다."""
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SEC)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        conn = self._conn()
+        unique = list(dict.fromkeys(keys))
+        # SQLite 바인딩 변수 제한을 넘지 않도록 나눠서 조회
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE cache SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+        with self._stats_lock:
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?)",
+                [(k, sqlite3.Binary(v), now) for k, v in items.items()],
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                logging.info("Evicted %d entries from %s", overflow, self.path)
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many({key: value})
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / total, 4) if total else 0.0,
+            "entries": self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0],
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """다른 Embeddings 앞에 놓여 캐시에 없는 텍스트만 실제 모델로 보냅니다."""
+
+    def __init__(self, embedder: Embeddings, model_id: str,
+                 cache: Optional[DiskLRUCache] = None) -> None:
+        self.embedder = embedder
+        self.model_id = model_id
+        self.cache = cache or DiskLRUCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES)
+
+    @staticmethod
+    def _encode(vector: Iterable[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vec = array("f")
+        vec.frombytes(blob)
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        keys = [content_key(self.model_id, t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        # 캐시에 없는 텍스트만 (배치 내 중복 제거 후) 모델 호출
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embedder.embed_documents(list(missing.values()))
+            fresh = {key: self._encode(vec) for key, vec in zip(missing, vectors)}
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        logging.info("embedding cache: %d texts, %d embedded", len(texts), len(missing))
+        # 캐시 조회 + (필요 시) 모델 호출까지 포함한 시간, 캐시 적중 수
+        observe("embed_documents", time.perf_counter() - started, items=len(texts), hits=len(texts) - len(missing),
+                cost=estimate_cost(self.model_id, sum(estimate_tokens(t) for t in missing.values())))
+        return [self._decode(cached[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = content_key(self.model_id, text)
+        blob = self.cache.get(key)
+        if blob is None:
+            vector = self.embedder.embed_query(text)
+            self.cache.put(key, self._encode(vector))
+            return list(vector)
+        return self._decode(blob)
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
@@ -0,0 +1,116 @@
+'''
+작업지시서 청크에 이벤트 유형(eventType)·구역(roiId)·원본 문서 메타데이터를 붙입니다.
+
+- 파일 이름: FIRE_ALERT_Work_Instruction.pdf → 문서 전체가 FIRE_ALERT
+- 제목(heading): 짧은 줄에 나온 유형은 그 청크에 붙습니다. 파일 이름으로 유형을 알 수 없는 문서
+  ("1. 위험구역 침입 (DANGER_ZONE_INTRUSION) 대응" 처럼 여러 유형을 담은 작업지시서)는
+  제목에 나온 유형이 다음 제목이 나올 때까지 이어지는 청크에도 적용됩니다.
+- 본문: 구역 ID/이름(TANK-AREA-A, "Loading Bay" 등)이 나오면 해당 roiId 를 붙입니다.
+
+Chroma 메타데이터는 리스트를 담을 수 없으므로 유형/구역마다 불리언 키(et_*, roi_*)를 두고
+검색 시 where 필터로 사용합니다. 태깅 규칙이 바뀌면 TAG_VERSION 을 올려 재색인되게 합니다.
+'''
+
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from event_constants import EVENT_TYPES, ROI_IDS
+
+# Configuration
+TAG_VERSION = 1
+EVENT_TYPE_KEY_PREFIX = "et_"
+ROI_KEY_PREFIX = "roi_"
+HEADING_MAX_CHARS = 80  # 이보다 짧은 줄만 제목으로 간주
+
+
+
+# Fucntions
+def _name_pattern(identifier: str) -> str:
+    # FIRE_ALERT / FIRE ALERT / Fire-Alert / TANK-AREA-A / Tank Area A 를 모두 허용
+    parts = re.split(r"[_\-\s]+", identifier)
+    return r"(?<![A-Za-z0-9])" + r"[_\-\s]*".join(re.escape(p) for p in parts) + r"(?![A-Za-z0-9])"
+
+_EVENT_TYPE_PATTERNS = {et: re.compile(_name_pattern(et), re.IGNORECASE) for et in EVENT_TYPES}
+_ROI_PATTERNS = {roi: re.compile(_name_pattern(roi), re.IGNORECASE) for roi in ROI_IDS}
+
+
+def find_event_types(text: str) -> List[str]:
+    return [et for et, pattern in _EVENT_TYPE_PATTERNS.items() if pattern.search(text)]
+
+def find_rois(text: str) -> List[str]:
+    return [roi for roi, pattern in _ROI_PATTERNS.items() if pattern.search(text)]
+
+def heading_event_types(text: str) -> List[str]:
+    """제목으로 보이는 짧은 줄에 나온 유형들 (마지막 제목의 유형이 뒤에 오도록 등장 순서 유지)."""
+    found: List[str] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and len(line) <= HEADING_MAX_CHARS:
+            for et in find_event_types(line):
+                if et in found:
+                    found.remove(et)
+                found.append(et)
+    return found
+
+def event_type_key(event_type: str) -> str:
+    return EVENT_TYPE_KEY_PREFIX + event_type
+
+def roi_key(roi_id: str) -> str:
+    return ROI_KEY_PREFIX + roi_id
+
+def tag_metadata(source_doc: str, event_types: Iterable[str], rois: Iterable[str]) -> Dict[str, object]:
+    event_types, rois = sorted(set(event_types)), sorted(set(rois))
+    metadata: Dict[str, object] = {
+        "sourceDoc": source_doc,
+        "eventTypes": ",".join(event_types),
+        "roiIds": ",".join(rois),
+        "tagVersion": TAG_VERSION,
+    }
+    metadata.update({event_type_key(et): True for et in event_types})
+    metadata.update({roi_key(roi): True for roi in rois})
+    return metadata
+
+
+class DocumentTagger:
+    """
+    문서별 상태(현재 제목의 유형)를 유지하며 청크를 순서대로 태깅합니다.
+    iter_chunks 처럼 파일·페이지 순서로 청크가 들어온다고 가정합니다.
+    """
+
+    def __init__(self) -> None:
+        self._section: Dict[str, Optional[str]] = {}
+        self._file_types: Dict[str, Set[str]] = {}
+
+    def tag(self, name: str, text: str) -> Dict[str, object]:
+        if name not in self._file_types:
+            stem = os.path.splitext(os.path.basename(name))[0]
+            self._file_types[name] = set(find_event_types(stem))
+            self._section[name] = None
+
+        headings = heading_event_types(text)
+        event_types = set(self._file_types[name]) | set(headings)
+        if not self._file_types[name]:
+            # 청크 안에서 새 제목이 시작되기 전 부분은 이전 제목의 유형에 속함
+            if self._section[name]:
+                event_types.add(self._section[name])
+            if headings:
+                self._section[name] = headings[-1]
+
+        rois = set(find_rois(os.path.basename(name))) | set(find_rois(text))
+        return tag_metadata(os.path.basename(name), event_types, rois)
+
+
+def event_filters(event: Dict[str, object]) -> List[Optional[Dict[str, object]]]:
+    """
+    이벤트에 맞는 Chroma where 필터 목록 (좁은 것부터).
+    마지막 None 은 전체 검색 (태그가 없거나 결과가 부족할 때의 fallback).
+    """
+    event_type, roi_id = event.get("eventType"), event.get("roiId")
+    filters: List[Optional[Dict[str, object]]] = []
+    if event_type in EVENT_TYPES:
+        if roi_id in ROI_IDS:
+            filters.append({"$and": [{event_type_key(event_type): True}, {roi_key(roi_id): True}]})
+        filters.append({event_type_key(event_type): True})
+    filters.append(None)
+    return filters
@@ -0,0 +1,136 @@
+'''
+RAG 어드바이저 응답 캐시입니다.
+
+같은 eventType/roiId/severity 조합의 이벤트가 반복되면 message 만 조금 다를 뿐 같은 답이 나오므로,
+- 시그니처와 (정규화한) message 가 모두 같으면 저장된 ragAdvisor 를 그대로 쓰고
+- 아니면 시그니처가 같은 캐시 항목 중 이벤트 임베딩의 코사인 유사도가 임계값 이상인 것을 씁니다.
+  (심각도나 구역이 다른 이벤트의 답은 절대 재사용하지 않음)
+항목은 TTL 과 LRU 로 정리되며, 작업지시서 컬렉션이 바뀌면(collection_version 변경) 전부 무효화됩니다.
+'''
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configuration
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+Signature = Tuple[str, str, str]
+CacheKey = Tuple[Signature, str]
+
+
+# Fucntions
+def event_signature(event: Dict[str, Any]) -> Signature:
+    return (event.get("eventType", ""), event.get("roiId", ""), event.get("severity", ""))
+
+def normalize_message(message: Any) -> str:
+    # 대소문자/공백 차이만 있는 message 는 같은 것으로 취급
+    return " ".join(str(message or "").lower().split())
+
+def cache_key(event: Dict[str, Any]) -> CacheKey:
+    return event_signature(event), normalize_message(event.get("message"))
+
+def event_text(event: Dict[str, Any]) -> str:
+    # 유사도 비교용 텍스트: 식별자/시각을 빼고 상황을 설명하는 필드만 사용
+    return " | ".join(str(event.get(k, "")) for k in ("eventType", "roiId", "severity", "message"))
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    event_id: str
+    vector: List[float]
+    created: float
+
+
+class AnswerCache:
+    """프로세스 내 LRU + TTL 캐시. 조회 결과는 (answer, source, 원본 eventId) 입니다."""
+
+    def __init__(self, embed: Callable[[str], List[float]],
+                 collection_version: Callable[[], Any],
+                 ttl: float = ANSWER_CACHE_TTL_SEC,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 threshold: float = ANSWER_CACHE_SIMILARITY) -> None:
+        self.embed = embed
+        self.collection_version = collection_version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = {"exact": 0, "similar": 0}
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, CachedAnswer]" = OrderedDict()
+        self._version = collection_version()
+        self._lock = threading.Lock()
+
+    def _check_version(self) -> None:
+        version = self.collection_version()
+        if version != self._version:
+            logging.info("work-instruction collection changed, clearing %d cached answers", len(self._entries))
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self, now: float) -> None:
+        for key in [k for k, e in self._entries.items() if now - e.created > self.ttl]:
+            del self._entries[key]
+
+    def lookup(self, event: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+        key = cache_key(event)
+        sig = key[0]
+        with self._lock:
+            self._check_version()
+            self._expire(time.time())
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return entry.answer, "exact", entry.event_id
+
+            # 유사도 비교는 eventType/roiId/severity 가 모두 같은 항목끼리만
+            candidates = [(k, e) for k, e in self._entries.items() if k[0] == sig]
+        if not candidates:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        vector = self.embed(event_text(event))
+        best_key, best, score = None, None, -1.0
+        for k, e in candidates:
+            sim = cosine(vector, e.vector)
+            if sim > score:
+                best_key, best, score = k, e, sim
+
+        with self._lock:
+            if best is not None and score >= self.threshold and best_key in self._entries:
+                self._entries.move_to_end(best_key)
+                self.hits["similar"] += 1
+                logging.info("answer cache near match %.3f: %s -> %s", score, key, best_key)
+                return best.answer, "similar", best.event_id
+            self.misses += 1
+        return None
+
+    def store(self, event: Dict[str, Any], answer: str) -> None:
+        entry = CachedAnswer(answer, event.get("eventId", ""), self.embed(event_text(event)), time.time())
+        with self._lock:
+            self._check_version()
+            key = cache_key(event)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": dict(self.hits), "misses": self.misses}
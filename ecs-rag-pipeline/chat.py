@@ -1,17 +1,17 @@
-import boto3
 import os
 import json
 import re
 import logging
 
-from typing import Iterable, List, Tuple, Set, Any
-from pydantic.v1 import BaseModel, Field
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_aws.embeddings import BedrockEmbeddings
-from langchain_chroma import Chroma
-from langchain_aws import ChatBedrock
-from botocore.config import Config
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Set, Any
+from langchain_core.documents import Document
 from dotenv import load_dotenv 
+from doc_tags import event_filters
+from provider_config import use_local_provider
+from metrics import timed
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,10 +23,15 @@ def getenv(key: str, default: str) -> str:
 
 os.environ['AWS_BEARER_TOKEN_BEDROCK'] = getenv('BEDROCK_API_KEY', '')
 
-VECTOR_DIR = getenv("VECTOR_DIR", "./data_source/opensearch_vector_store")
+LOCAL_PROVIDER = use_local_provider()  # BEDROCK_PROVIDER=local 이면 AWS 없이 로컬 대체 모델 사용 (local_providers.py)
+# 로컬 해시 임베딩은 Titan 벡터와 섞이면 안 되므로 별도 디렉토리가 기본값
+VECTOR_DIR = getenv("VECTOR_DIR", "./data_source/local_vector_store" if LOCAL_PROVIDER else "./data_source/opensearch_vector_store")
+VECTOR_BACKEND = getenv("VECTOR_BACKEND", "chroma").lower()  # chroma | faiss (faiss_store.py, <VECTOR_DIR>/faiss)
+RETRIEVAL_SERVICE_URL = getenv("RETRIEVAL_SERVICE_URL", "")  # 설정하면 공유 검색 서비스 사용 (retrieval_service.py)
 AWS_REGION = getenv("AWS_REGION", "ap-northeast-2")
 PROFILE_NAME = getenv("PROFILE_NAME", "default")
 COLLECTION_NAME = getenv("COLLECTION_NAME", "work_instructions")
+MANIFEST_NAME = "ingest_manifest.json"  # lambda_function_embedding 이 수집할 때마다 갱신
 MODEL_IDS = {
     "titan_embedding_v2": "amazon.titan-embed-text-v2:0",
     "claude_3_5_sonnet": "anthropic.claude-3-5-sonnet-20240620-v1:0",
@@ -34,24 +39,52 @@ MODEL_IDS = {
 }
 
 # AWS clients / Embedding model
-_session = (
-    boto3.Session(profile_name=PROFILE_NAME, region_name=AWS_REGION)
-    if PROFILE_NAME
-    else boto3.Session(region_name=AWS_REGION)
-)
-
-_bedrock_client = _session.client(
-    "bedrock-runtime",
-    region_name=AWS_REGION,
-    config=Config( retries={"max_attempts": 30})
-)
-EMBEDDER = BedrockEmbeddings(model_id=MODEL_IDS["titan_embedding_v2"], client=_bedrock_client)
+# boto3 / langchain_aws / langchain_chroma 는 import 만으로 수 초가 걸리므로 처음 사용할 때 생성하고 재사용
+@lru_cache(maxsize=None)
+def get_bedrock_client():
+    import boto3
+    from botocore.config import Config
+
+    session = (
+        boto3.Session(profile_name=PROFILE_NAME, region_name=AWS_REGION)
+        if PROFILE_NAME
+        else boto3.Session(region_name=AWS_REGION)
+    )
+    return session.client(
+        "bedrock-runtime",
+        region_name=AWS_REGION,
+        # 스로틀링은 ConcurrentEmbeddings 의 AIMD 백오프가 처리 (30회 재시도는 수 분간 멈춤을 유발)
+        config=Config(retries={"max_attempts": 3, "mode": "adaptive"})
+    )
+
+@lru_cache(maxsize=None)
+def get_embedder():
+    from disk_cache import CachedEmbeddings
+    from embedding_executor import ConcurrentEmbeddings
+
+    if LOCAL_PROVIDER:
+        from local_providers import HashEmbeddings
+        base_embedder = HashEmbeddings()
+    else:
+        from langchain_aws.embeddings import BedrockEmbeddings
+        base_embedder = BedrockEmbeddings(model_id=MODEL_IDS["titan_embedding_v2"], client=get_bedrock_client())
+
+    # 수집(ingestion)과 같은 디스크 캐시를 공유하므로 반복 질의는 Bedrock 을 호출하지 않음
+    # (로컬 모델은 캐시 키가 겹치지 않도록 모델 ID 앞에 local: 을 붙임)
+    return CachedEmbeddings(
+        ConcurrentEmbeddings(base_embedder),
+        model_id=("local:" if LOCAL_PROVIDER else "") + MODEL_IDS["titan_embedding_v2"],
+    )
 
 # Fucntions
 def get_chat(model:str = "claude_3_5_haiku"):
     bedrock_region =  AWS_REGION
     modelId = MODEL_IDS[model]
     maxOutputTokens = 5120 # 4k
+    if LOCAL_PROVIDER:
+        from local_providers import ScriptedChatModel, load_script
+        logging.info(f'local scripted chat model for modelId: {modelId}')
+        return ScriptedChatModel(model_id=modelId, script=load_script())
     logging.info(f'bedrock_region: {bedrock_region}, modelId: {modelId}, maxOutputTokens: {maxOutputTokens}')
 
     STOP_SEQUENCE = "\n\nHuman:" 
@@ -64,51 +97,112 @@ def get_chat(model:str = "claude_3_5_haiku"):
         "stop_sequences": [STOP_SEQUENCE]
     }
 
+    from langchain_aws import ChatBedrock
     return ChatBedrock(
-                    client=_bedrock_client,
+                    client=get_bedrock_client(),
                     region_name=AWS_REGION,
                     model_id=modelId,
                     model_kwargs=parameters,
                 )
 
 def build_or_load_chroma(persist_directory: str = VECTOR_DIR):
+    if RETRIEVAL_SERVICE_URL:
+        # 인덱스는 검색 서비스 프로세스에만 한 벌 있고, 여기서는 질의 벡터만 보냄
+        from retrieval_service import RemoteVectorStore
+        return RemoteVectorStore(RETRIEVAL_SERVICE_URL, get_embedder())
+    if VECTOR_BACKEND == "faiss":
+        # 수집이 쓴 인덱스를 읽기 전용 mmap 으로 열어 워커 프로세스끼리 페이지를 공유
+        from faiss_store import FaissVectorStore
+        return FaissVectorStore(os.path.join(persist_directory, "faiss"), get_embedder(), read_only=True)
+    from langchain_chroma import Chroma
     return Chroma(
             collection_name=COLLECTION_NAME,
             persist_directory=persist_directory,
-            embedding_function=EMBEDDER,
+            embedding_function=get_embedder(),
         )
 
-contentList = []
-def check_duplication(docs):
-    global contentList
-    length_original = len(docs)
-    
-    updated_docs = []
-    logging.info(f"length of relevant_docs: {len(docs)}")
-    for doc in docs:            
-        if doc[0].page_content in contentList:
-            logging.info(f"duplicated")
-            continue
-        contentList.append(doc[0].page_content)
-        updated_docs.append(doc)          
-    length_updated_docs = len(updated_docs)
+def collection_version(vector_dir: str = VECTOR_DIR) -> int:
+    """Changes whenever ingestion rewrites the manifest (used to invalidate answer caches)."""
+    try:
+        return os.stat(os.path.join(vector_dir, MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def multi_query_search(
+    vectorstore: "Chroma",
+    queries: List[str],
+    k: int = 4,
+    rrf_k: int = 60,
+    where: Dict[str, Any] | None = None,
+    query_vectors: List[List[float]] | None = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Retrieve for several queries at once: one batched embedding call, one collection query with
+    all query vectors (optionally restricted by a metadata *where* filter), then merge by chunk id
+    with reciprocal rank fusion. Returns (doc, fused_score) sorted by fused score, highest first.
+    """
+    if not queries:
+        return []
+    if query_vectors is None:
+        query_vectors = vectorstore.embeddings.embed_documents(queries)
+    # FaissVectorStore / RemoteVectorStore 는 chromadb 컬렉션과 같은 query() 를 직접 제공
+    collection = getattr(vectorstore, "_collection", vectorstore)
+    with timed(f"{VECTOR_BACKEND}_query", items=len(queries)):
+        result = collection.query(
+            query_embeddings=query_vectors,
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
 
-    if length_original == length_updated_docs:
-        logging.info(f"no duplication")
-    else:
-        logging.info(f"length of updated relevant_docs: {length_updated_docs}")
-    
-    return updated_docs
+    fused: Dict[str, List[Any]] = {}  # id -> [Document, score]
+    for ids, texts, metas in zip(result["ids"], result["documents"], result["metadatas"]):
+        for rank, (doc_id, text, meta) in enumerate(zip(ids, texts, metas)):
+            entry = fused.setdefault(doc_id, [Document(page_content=text, metadata=meta or {}, id=doc_id), 0.0])
+            entry[1] += 1.0 / (rrf_k + rank + 1)
+
+    logging.info("multi-query search%s: %d queries -> %d unique chunks",
+                 f" ({where})" if where else "", len(queries), len(fused))
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda x: x[1], reverse=True)
+
+def event_filtered_search(
+    vectorstore: "Chroma",
+    queries: List[str],
+    event: Dict[str, Any],
+    k: int = 4,
+    rrf_k: int = 60,
+) -> List[Tuple[Document, float]]:
+    """
+    multi_query_search pre-filtered on the event's eventType/roiId chunk tags (doc_tags).
+    Filters are tried from narrowest (eventType and roiId) to none; the search widens while the
+    filter matches fewer than *k* chunks, and the fused scores of every level that ran are summed
+    (chunks matching the narrower filter rank higher).
+    """
+    if not queries:
+        return []
+    query_vectors = vectorstore.embeddings.embed_documents(queries)  # 필터 단계마다 재사용
+    fused: Dict[str, List[Any]] = {}
+    for where in event_filters(event):
+        results = multi_query_search(vectorstore, queries, k=k, rrf_k=rrf_k, where=where,
+                                     query_vectors=query_vectors)
+        for doc, score in results:
+            fused.setdefault(doc.id, [doc, 0.0])[1] += score
+        # 필터에 맞는 청크가 k 개 미만이면 모든 질의가 그만큼만 받으므로 다음(더 넓은) 필터로
+        if len(results) >= k:
+            break
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda x: x[1], reverse=True)
 
 def check_duplication(
     docs: Iterable[Tuple[Any, ...]],
     seen_contents: Set[str] | None = None,
 ) -> List[Tuple[Any, ...]]:
 
+    """Drop byte-identical page_content (near duplicates are handled by context_builder.build_context)."""
     if seen_contents is None:
         seen_contents = set()
 
-    original_len = len(tuple(docs))  # materialize once if docs is a generator
+    docs = list(docs)  # materialize once so generator inputs are not consumed by len()
+    original_len = len(docs)
     unique_docs: List[Tuple[Any, ...]] = []
 
     logging.info("length of relevant_docs: %d", original_len)
@@ -127,4 +221,4 @@ def check_duplication(
     else:
         logging.info("length of updated relevant_docs: %d", len(unique_docs))
 
-    return unique_docs
\ No newline at end of file
+    return unique_docs
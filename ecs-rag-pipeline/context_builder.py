@@ -0,0 +1,166 @@
+'''
+generate_answer 에 넣을 참고 문서(context)를 토큰 예산 안에서 구성합니다.
+
+1. 중복 제거: 단어 shingle 집합의 Jaccard 유사도(또는 포함도)가 임계값 이상인 청크는 점수가 낮은 쪽을 버림
+   (CHUNK_OVERLAP 로 생긴 거의 같은 청크, 같은 내용의 다른 PDF 등)
+2. MMR 정렬: 검색 점수(RRF)와, 이미 고른 청크와의 shingle 유사도를 함께 고려해 다양한 청크를 앞에 배치
+3. 토큰 예산: MMR 순서대로 예산(CONTEXT_TOKEN_BUDGET)에 들어가는 청크만 담되, 이미 담은 청크와
+   앞뒤가 겹치는 부분(청크 오버랩)은 잘라내고 담음
+'''
+
+import hashlib
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+from langchain_core.documents import Document
+from metrics import estimate_tokens
+
+# Configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DUP_THRESHOLD = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.8"))   # Jaccard/포함도 중복 기준
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))         # 1 이면 점수 순, 0 이면 다양성만
+SHINGLE_SIZE = int(os.getenv("CONTEXT_SHINGLE_SIZE", "5"))                 # 단어 shingle 길이
+MIN_OVERLAP_CHARS = 40      # 이보다 짧은 앞뒤 일치는 우연으로 보고 자르지 않음
+MAX_OVERLAP_CHARS = 1000    # 청크 오버랩(CHUNK_OVERLAP=200)보다 충분히 크게
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+ScoredDoc = Tuple[Document, float]
+
+
+# Fucntions
+def shingles(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[int]:
+    """정규화된 단어 size-gram 의 해시 집합 (짧은 텍스트는 단어 집합)."""
+    words = [w.lower() for w in _WORD_RE.findall(text)]
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return frozenset(int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+                     for g in grams)
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def containment(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    """a 의 shingle 중 b 에도 있는 비율 (a 가 b 에 거의 포함되면 1 에 가까움)."""
+    if not a:
+        return 1.0
+    return len(a & b) / len(a)
+
+def overlap_prefix(previous: str, text: str,
+                   min_chars: int = MIN_OVERLAP_CHARS, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """*text* 의 앞부분 중 *previous* 의 끝부분과 같은 가장 긴 길이 (없으면 0)."""
+    if len(text) < min_chars:
+        return 0
+    head = text[:min_chars]
+    # 겹침은 previous 의 끝 max_chars 안에서 text 의 첫 min_chars 글자로 시작해야 함
+    pos = previous.find(head, max(0, len(previous) - max_chars))
+    while pos != -1:
+        length = len(previous) - pos
+        if length <= len(text) and text.startswith(previous[pos:]):
+            return length
+        pos = previous.find(head, pos + 1)
+    return 0
+
+
+@dataclass
+class ContextResult:
+    docs: List[ScoredDoc]
+    tokens: int
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(doc.page_content for doc, _ in self.docs)
+
+
+def remove_near_duplicates(docs: List[ScoredDoc], signatures: List[FrozenSet[int]],
+                           threshold: float = CONTEXT_DUP_THRESHOLD) -> List[int]:
+    """점수 순으로 보면서 이미 남긴 청크와 거의 같은(또는 거의 포함되는) 청크를 버리고, 남은 인덱스를 반환."""
+    kept: List[int] = []
+    for i in sorted(range(len(docs)), key=lambda i: docs[i][1], reverse=True):
+        if any(jaccard(signatures[i], signatures[j]) >= threshold
+               or containment(signatures[i], signatures[j]) >= threshold for j in kept):
+            continue
+        kept.append(i)
+    return kept
+
+def mmr_order(candidates: List[int], scores: List[float], signatures: List[FrozenSet[int]],
+              lambda_mult: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """Maximal marginal relevance: lambda * relevance - (1 - lambda) * max similarity to already chosen."""
+    top = max((scores[i] for i in candidates), default=0.0) or 1.0
+    remaining, ordered = list(candidates), []
+    while remaining:
+        def marginal(i: int) -> float:
+            redundancy = max((jaccard(signatures[i], signatures[j]) for j in ordered), default=0.0)
+            return lambda_mult * scores[i] / top - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=marginal)
+        ordered.append(best)
+        remaining.remove(best)
+    return ordered
+
+def _truncate_to_budget(text: str, budget: int) -> str:
+    # 예산에 맞을 때까지 문장/줄 경계 우선으로 뒤를 잘라냄
+    while text and estimate_tokens(text) > budget:
+        cut = max(text.rfind("\n", 0, len(text) * 9 // 10), text.rfind(". ", 0, len(text) * 9 // 10))
+        text = text[:cut] if cut > 0 else text[: len(text) * 9 // 10]
+    return text
+
+def build_context(docs: Iterable[ScoredDoc], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  threshold: float = CONTEXT_DUP_THRESHOLD,
+                  lambda_mult: float = CONTEXT_MMR_LAMBDA) -> ContextResult:
+    """
+    (Document, score) 목록에서 중복을 걸러내고 MMR 순서로 정렬한 뒤, 청크 간 오버랩을 잘라내고
+    token_budget 안에 들어가는 만큼 담습니다. 반환되는 Document 는 잘린 본문을 가진 사본입니다.
+    """
+    docs = list(docs)
+    signatures = [shingles(doc.page_content) for doc, _ in docs]
+    scores = [score for _, score in docs]
+
+    kept = remove_near_duplicates(docs, signatures, threshold)
+    ordered = mmr_order(kept, scores, signatures, lambda_mult)
+
+    selected: List[ScoredDoc] = []
+    packed: List[str] = []  # 선택된 청크의 원문 (겹침 비교용)
+    used = trimmed_chars = 0
+    for i in ordered:
+        original = text = docs[i][0].page_content
+        # 이미 담은 청크와 겹치는 앞/뒷부분(청크 오버랩)은 한 번만 보내도록 잘라냄
+        for other in packed:
+            head = overlap_prefix(other, text)
+            if head:
+                text = text[head:]
+            tail = overlap_prefix(text, other)
+            if tail:
+                text = text[:-tail]
+        trimmed_chars += len(original) - len(text)
+        text = text.strip()
+        if not text:
+            continue
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            if selected:
+                continue  # 더 짧은 다음 청크는 들어갈 수 있음
+            text = _truncate_to_budget(text, token_budget)  # 최상위 청크 하나는 잘라서라도 포함
+            cost = estimate_tokens(text)
+        doc = docs[i][0]
+        selected.append((Document(page_content=text, metadata=dict(doc.metadata), id=doc.id), docs[i][1]))
+        packed.append(original)
+        used += cost
+
+    stats = {
+        "candidates": len(docs),
+        "nearDuplicates": len(docs) - len(kept),
+        "trimmedChars": trimmed_chars,
+        "overBudget": len(kept) - len(selected),
+        "inputTokens": sum(estimate_tokens(doc.page_content) for doc, _ in docs),
+    }
+    logging.info("context: %d -> %d chunks, %d tokens (budget %d) %s",
+                 len(docs), len(selected), used, token_budget, stats)
+    return ContextResult(docs=selected, tokens=used, stats=stats)
@@ -0,0 +1,42 @@
+'''
+query_planner 결과(검색 질의 목록) 캐시입니다.
+
+플래너가 만드는 질의는 eventId/ts/deviceId 가 아니라 eventType, roiId, severity 에 의해 결정되므로
+이 세 필드로 정규화한 키에 파싱된 질의 목록을 저장합니다. 디스크(SQLite) LRU 캐시를 사용하므로
+프로세스를 재시작해도 유지됩니다.
+'''
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from disk_cache import DiskLRUCache
+
+# Configuration
+PLANNER_CACHE_PATH = os.getenv("PLANNER_CACHE_PATH", "./data_source/rag_cache/planner.db")
+PLANNER_CACHE_MAX_ENTRIES = int(os.getenv("PLANNER_CACHE_MAX_ENTRIES", "1024"))
+PLANNING_FIELDS = ("eventType", "roiId", "severity")
+
+
+# Fucntions
+def planning_key(event: Dict[str, Any], model: str) -> str:
+    # 모델이 바뀌면 다른 키가 되도록 모델 이름도 포함
+    fields = [str(event.get(f, "")).strip().upper() for f in PLANNING_FIELDS]
+    return "planner:" + json.dumps([model, *fields], ensure_ascii=False)
+
+
+class PlannerCache:
+    def __init__(self, model: str, cache: Optional[DiskLRUCache] = None) -> None:
+        self.model = model
+        self.cache = cache or DiskLRUCache(PLANNER_CACHE_PATH, PLANNER_CACHE_MAX_ENTRIES)
+
+    def get(self, event: Dict[str, Any]) -> Optional[List[str]]:
+        blob = self.cache.get(planning_key(event, self.model))
+        return json.loads(blob.decode("utf-8")) if blob is not None else None
+
+    def put(self, event: Dict[str, Any], queries: List[str]) -> None:
+        if queries:
+            self.cache.put(planning_key(event, self.model), json.dumps(queries, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
@@ -0,0 +1,226 @@
+'''
+ECS 에서 상시 실행되는 RAG 워커 서비스입니다.
+
+작업 큐(job_queue, SQS 대체)에서 분석 대기 이벤트를 가져와 스레드 또는 프로세스 풀에서
+workflow.run_rag_pipeline 을 실행합니다. 실패한 작업은 백오프 후 재시도하고,
+재시도 횟수를 넘기면 DLQ(DEAD) 로 보냅니다.
+이미지 업로드 알림 작업(kind=image)은 image_handler 로 썸네일/이미지 분석을 붙인 뒤 RAG 작업을 등록합니다.
+LOW/MEDIUM 작업은 ADVISOR_BATCH_WAIT_SEC 동안 더 모아 workflow.run_rag_batch 로 한 번에
+처리하고(같은 검색 문맥끼리 한 번의 LLM 호출), HIGH 작업은 바로 단건 스트리밍으로 처리합니다.
+
+    python ecs-rag-pipeline/worker.py --workers 4 --mode thread --metrics-port 9102
+    python ecs-rag-pipeline/worker.py --status
+    python ecs-rag-pipeline/worker.py --redrive
+'''
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+# 저장소 루트의 공용 모듈(event_store, job_queue 등)을 찾을 수 있도록 경로 추가
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from job_queue import IMAGE_JOB, JOB_LEASE_SEC, JobQueue, get_queue
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Configuration
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "2"))
+WORKER_MODE = os.getenv("WORKER_MODE", "thread")  # thread | process
+POLL_INTERVAL_SEC = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+PROGRESS_FLUSH_SEC = float(os.getenv("WORKER_PROGRESS_FLUSH", "0.5"))
+ADVISOR_BATCH_MAX = int(os.getenv("ADVISOR_BATCH_MAX", "8"))                # 0/1: 묶음 처리 끄기
+ADVISOR_BATCH_WAIT_SEC = float(os.getenv("ADVISOR_BATCH_WAIT_SEC", "2.0"))  # 묶음을 채우려고 기다리는 최대 시간
+BATCH_SEVERITIES = ["LOW", "MEDIUM"]
+HEARTBEAT_SEC = float(os.getenv("WORKER_HEARTBEAT_SEC", str(JOB_LEASE_SEC / 3)))  # lease 연장 주기
+
+
+# Fucntions
+def process_image_job(job: dict, queue: JobQueue) -> None:
+    """S3 업로드 알림 작업: image_handler(썸네일 + 이미지 분석) 후 필요하면 RAG 분석 작업을 등록."""
+    import lambda_function_event
+
+    payload = job["payload"]
+    queue.set_progress(job["job_id"], "이미지 분석 중", job["worker"])
+    result = lambda_function_event.image_handler({"Records": [payload["record"]]})
+    failed = result["content"]["failed"]
+    if failed:
+        raise RuntimeError(f"image attach failed for eventId {payload['eventId']}: {failed[0]['reason']}")
+    if payload.get("analyze"):
+        # RAG 는 이미지 분석으로 갱신된 message 를 보도록 첨부가 끝난 뒤에 등록
+        queue.enqueue(result["content"]["items"][0], priority=payload.get("priority", 0))
+
+def process_job(job: dict, queue: JobQueue) -> None:
+    if job["payload"].get("kind") == IMAGE_JOB:
+        return process_image_job(job, queue)
+    import workflow  # 무거운 import 는 실제 작업 시점에
+
+    # 생성 중인 답변을 주기적으로 작업 상태에 기록 → 대시보드가 완료 전에 표시
+    text, flushed_at = "", time.monotonic()
+    for token in workflow.stream_rag_pipeline(job["payload"]):
+        text += token
+        if time.monotonic() - flushed_at >= PROGRESS_FLUSH_SEC:
+            queue.set_progress(job["job_id"], text, job["worker"])
+            flushed_at = time.monotonic()
+
+@contextmanager
+def lease_heartbeat(queue: JobQueue, jobs: List[dict]) -> Iterator[None]:
+    """
+    작업 중에 lease 를 주기적으로 연장합니다. 첫 토큰 전의 검색이나 묶음 생성처럼 진행 기록이
+    한동안 없어도 lease 가 만료되어 다른 worker 가 같은 작업을 다시 가져가지 않도록.
+    """
+    done = threading.Event()
+
+    def beat() -> None:
+        while not done.wait(HEARTBEAT_SEC):
+            for job in jobs:
+                if not queue.set_progress(job["job_id"], None, job["worker"]):
+                    logging.warning("job %s: lease lost by worker %s", job["job_id"], job["worker"])
+
+    beater = threading.Thread(target=beat, daemon=True)
+    beater.start()
+    try:
+        yield
+    finally:
+        done.set()
+        beater.join()
+
+def collect_batch(queue: JobQueue, name: str, first: dict, stop) -> List[dict]:
+    """first 가 LOW/MEDIUM 이면 같은 심각도대의 대기 작업을 ADVISOR_BATCH_MAX 개까지 더 가져옵니다."""
+    jobs = [first]
+    if ADVISOR_BATCH_MAX <= 1 or first["payload"].get("severity") not in BATCH_SEVERITIES:
+        return jobs
+    deadline = time.monotonic() + ADVISOR_BATCH_WAIT_SEC
+    while len(jobs) < ADVISOR_BATCH_MAX and not stop.is_set():
+        jobs += queue.claim_batch(name, ADVISOR_BATCH_MAX - len(jobs), BATCH_SEVERITIES)
+        remaining = deadline - time.monotonic()
+        if len(jobs) >= ADVISOR_BATCH_MAX or remaining <= 0:
+            break
+        stop.wait(min(POLL_INTERVAL_SEC, remaining))
+    return jobs
+
+def process_batch(jobs: List[dict], queue: JobQueue) -> None:
+    import workflow
+
+    for job in jobs:
+        queue.set_progress(job["job_id"], f"배치 분석 중 ({len(jobs)}건)", job["worker"])
+    try:
+        with lease_heartbeat(queue, jobs):
+            errors = workflow.run_rag_batch([job["payload"] for job in jobs])
+    except Exception:
+        errors = {job["payload"]["eventId"]: traceback.format_exc() for job in jobs}
+    for job in jobs:
+        error = errors.get(job["payload"]["eventId"], "no result from batched generation")
+        if error is None:
+            finish_job(queue, job)
+        else:
+            fail_job(queue, job, error)
+
+def finish_job(queue: JobQueue, job: dict) -> None:
+    if not queue.complete(job["job_id"], job["worker"]):
+        logging.warning("job %s: lease lost by worker %s, result not recorded", job["job_id"], job["worker"])
+
+def fail_job(queue: JobQueue, job: dict, error: str) -> None:
+    status = queue.fail(job["job_id"], error, job["worker"])
+    if status is None:
+        logging.warning("job %s: lease lost by worker %s, failure not recorded", job["job_id"], job["worker"])
+    else:
+        logging.error("job %s failed -> %s\n%s", job["job_id"], status, error)
+
+def worker_loop(name: str, stop) -> None:
+    queue = JobQueue()  # 프로세스 모드에서 부모의 SQLite 연결을 물려받지 않도록 새로 생성
+    logging.info("worker %s started", name)
+    while not stop.is_set():
+        job = queue.claim(name)
+        if job is None:
+            stop.wait(POLL_INTERVAL_SEC)
+            continue
+
+        jobs = collect_batch(queue, name, job, stop)
+        if len(jobs) > 1:
+            logging.info("worker %s: batch of %d jobs (eventIds %s)",
+                         name, len(jobs), ", ".join(j["event_id"] for j in jobs))
+            process_batch(jobs, queue)
+            continue
+
+        logging.info("worker %s: job %s (eventId %s, attempt %d)",
+                     name, job["job_id"], job["event_id"], job["attempts"])
+        try:
+            with lease_heartbeat(queue, [job]):
+                process_job(job, queue)
+        except Exception:
+            fail_job(queue, job, traceback.format_exc())
+        else:
+            finish_job(queue, job)
+    logging.info("worker %s stopped", name)
+
+def run_service(workers: int = WORKER_COUNT, mode: str = WORKER_MODE) -> None:
+    host = socket.gethostname()
+    if mode == "process":
+        stop = multiprocessing.Event()
+        runners: List = [
+            multiprocessing.Process(target=worker_loop, args=(f"{host}-p{i}", stop), daemon=True)
+            for i in range(workers)
+        ]
+    else:
+        stop = threading.Event()
+        runners = [
+            threading.Thread(target=worker_loop, args=(f"{host}-t{i}", stop), daemon=True)
+            for i in range(workers)
+        ]
+
+    # ECS 는 태스크 종료 시 SIGTERM 을 보냄 → 진행 중인 작업을 마치고 종료
+    def _shutdown(signum, frame):
+        logging.info("signal %s received, stopping workers", signum)
+        stop.set()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    for r in runners:
+        r.start()
+    logging.info("RAG worker service running: %d %s workers", workers, mode)
+    while any(r.is_alive() for r in runners):
+        for r in runners:
+            r.join(timeout=1.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SafeGuard AI RAG worker service")
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT)
+    parser.add_argument("--mode", choices=["thread", "process"], default=WORKER_MODE)
+    parser.add_argument("--status", action="store_true", help="print job counts and dead letters")
+    parser.add_argument("--redrive", action="store_true", help="move dead-letter jobs back to the queue")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve per-stage metrics on this port (/metrics, /metrics.json)")
+    parser.add_argument("--metrics-host", default=None,
+                        help="bind address for --metrics-port (default: METRICS_HOST, localhost only)")
+    args = parser.parse_args()
+
+    queue = get_queue()
+    if args.status:
+        dead = [{"jobId": j["job_id"], "eventId": j["event_id"], "error": (j["error"] or "").splitlines()[-1:]}
+                for j in queue.recent(limit=20, statuses=["DEAD"])]
+        print(json.dumps({"counts": queue.counts(), "deadLetters": dead}, ensure_ascii=False, indent=2))
+    elif args.redrive:
+        print(f"redriven: {queue.redrive()}")
+    else:
+        if args.metrics_port:
+            import metrics
+            metrics.serve(args.metrics_port, background=True, host=args.metrics_host or metrics.METRICS_HOST)
+        run_service(args.workers, args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,33 @@
 import operator
+import os
+import re
 import chat
 import json
+import threading
+import time
 import traceback
 import logging
 
-from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
 from typing_extensions import Annotated, TypedDict
 from typing import List, Tuple 
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import START, END, StateGraph
+from answer_cache import AnswerCache, event_signature
+from context_builder import build_context
+from planner_cache import PlannerCache
+from event_store import EVENT_DB_PATH, get_store
+from metrics import estimate_cost, estimate_tokens, observe, timed, usage_tokens
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 MODEL_NAME = "claude_3_5_sonnet"
 RECURSION_LIMIT = 50
 TOP_K = 4           
+FALLBACK_ANSWER = "Sorry, an internal error occurred while generating the answer."
+ADVISOR_BATCH_MAX = int(os.getenv("ADVISOR_BATCH_MAX", "8"))  # 한 번의 호출로 답하는 최대 이벤트 수
+BATCH_EVENT_FIELDS = ("eventId", "deviceId", "ts", "eventType", "severity", "roiId", "message", "incident")
+_SECTION_RE = re.compile(r"^#{2,4}\s*EVENT\s+(\S+?)\s*$", re.MULTILINE)
 
 class State(TypedDict, total=False):
     input: str
@@ -24,132 +36,401 @@ class State(TypedDict, total=False):
     info: Annotated[List[Tuple], operator.add]
     reference_docs: List[Tuple[Any, float]] 
     answer: str
+    timings: Annotated[Dict[str, Dict[str, Any]], operator.or_]  # 노드별 소요 시간/토큰/비용
+
+def _content_text(content: Any) -> str:
+    # Bedrock 스트리밍 청크는 문자열 또는 content block 리스트
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
 
 def _build_prompt(system: str, human: str) -> ChatPromptTemplate:
     return ChatPromptTemplate.from_messages([("system", system), ("human", human)])
 
-def query_planner(state: State) -> Dict[str, Any]:
-    logging.info("###### query plan ######\ninput: %s", state["input"])
-
-    system_msg = (
-        "You are a retrieval query planner for an industrial safety RAG system "
-        "backed by a vector store. "
-        "Given an intrusion/safety event JSON, generate *three* high-recall "
-        "natural-language questions that retrieve the most relevant "
-        "work-instruction documents."
-    )
-    human_msg = "Event JSON:\n{event_json}"
-
-    planner_prompt = _build_prompt(system_msg, human_msg)
-    llm = chat.get_chat(model=MODEL_NAME)
-    response = (planner_prompt | llm).invoke({"event_json": state["input"]})
-    raw_text: str = response.content
-    logging.info("LLM raw response: %s", raw_text)
-
-    queries = [
-        line.strip()
-        for line in raw_text.splitlines()
-        if line.strip()
-        and not line.lower().startswith(("event json", "natural-language questions"))
-    ]
-    logging.info("parsed queries: %s", queries)
-
-    return {"input": state["input"], "plan": queries}
-
-def retriever(state: State) -> Dict[str, Any]:
-    logging.info("###### retriever ######\nplan: %s", state["plan"])
-
-    vectorstore = chat.build_or_load_chroma()
-    retrieved: List[Tuple[Any, float]] = sum(
-        (vectorstore.similarity_search_with_score(q, k=TOP_K) for q in state["plan"]),
-        start=[],
-    )
-
-    logging.info("raw docs: %d", len(retrieved))
-    filtered = chat.check_duplication(retrieved)
-    logging.info("dedup docs: %d", len(filtered))
-
-    return {
-        "input": state["input"],
-        "plan": state["plan"],
-        "past_steps": [state["plan"]],
-        "reference_docs": filtered,
-    }
-
-def generate_answer(state: State) -> Dict[str, Any]:
-    logging.info("#### generating answer ####")
-
-    context = "\n\n".join(doc.page_content for doc, _ in state.get("reference_docs", []))
-    query = state["input"]
-
-    system_msg = (
-        "You will be given a question."
-        "When answering, follow these rules:"
-        "1. Provide a concise answer."
-        "2. Explain your reasoning clearly."
-        "3. If you don’t know the answer, simply say so. "
-        "Present your response in exactly three labeled sections:"
-        "• Risk Level "
-        "• Safety Measures "
-        "• Work Procedure  "
-    )
-    human_msg = "Reference texts:\n{context}\n\nQuestion: {input}"
-    prompt = _build_prompt(system_msg, human_msg)
-
-    llm = chat.get_chat(model=MODEL_NAME)
-    try:
-        response = (prompt | llm).invoke({"context": context, "input": query})
-        answer = response.content
-        logging.info("LLM answer: %s", answer)
-    except Exception:  # 세부 Exception 타입이 있다면 교체
-        logging.error("LLM invocation failed:\n%s", traceback.format_exc())
-        answer = "Sorry, an internal error occurred while generating the answer."
-
-    return {"answer": answer}
+def _record_usage(span: Dict[str, Any], model_id: str, message: Any, prompt_text: str, answer: str) -> None:
+    # Bedrock 이 사용량을 돌려주지 않으면(일부 스트리밍 경로) 글자 수로 근사
+    usage = usage_tokens(message)
+    if not usage["inputTokens"]:
+        usage = {"inputTokens": estimate_tokens(prompt_text), "outputTokens": estimate_tokens(answer)}
+    span.update(usage)
+    span["tokens"] = usage["inputTokens"] + usage["outputTokens"]
+    span["cost"] = round(estimate_cost(model_id, usage["inputTokens"], usage["outputTokens"]), 6)
 
-def run_workflow(query: Dict[str, Any]) -> str:
-    wf = StateGraph(State)
-    wf.add_node("planner", query_planner)
-    wf.add_node("retriever", retriever)
-    wf.add_node("generate", generate_answer)
+class RagPipeline:
+    """
+    Long-lived RAG pipeline: owns the compiled LangGraph workflow, one chat client per model id
+    and one open vector store, and reuses them for every event (ECS 태스크가 이벤트 스트림을 처리할 때
+    이벤트마다 그래프 컴파일/클라이언트 생성/Chroma 재오픈을 하지 않음).
+    """
 
-    wf.set_entry_point("planner")
-    wf.add_edge("planner", "retriever")
-    wf.add_edge("retriever", "generate")
-    wf.add_edge("generate", END)
-    app = wf.compile()
+    def __init__(self, model_name: str = MODEL_NAME) -> None:
+        self.model_name = model_name
+        self._llms: Dict[str, Any] = {}
+        self._llm_lock = threading.Lock()
+        self.vectorstore = chat.build_or_load_chroma()
+        self.app = self._build_graph()
+        self.planner_cache = PlannerCache(model=model_name)
+        self.answer_cache = AnswerCache(embed=chat.get_embedder().embed_query,
+                                        collection_version=chat.collection_version)
 
-    inputs = {"input": query}
-    config = {"recursion_limit": RECURSION_LIMIT}
+    def llm(self, model: str):
+        with self._llm_lock:
+            if model not in self._llms:
+                self._llms[model] = chat.get_chat(model=model)
+            return self._llms[model]
 
-    last_value: Dict[str, Any] = {}
-    for output in app.stream(inputs, config):
-        for key, value in output.items():
-            logging.debug("Finished: %s", key)
-            last_value = value  # END 단계에서 answer 포함
+    def _build_graph(self):
+        wf = StateGraph(State)
+        wf.add_node("planner", self.query_planner)
+        wf.add_node("retriever", self.retriever)
+        wf.add_node("generate", self.generate_answer)
 
-    return last_value.get("answer", "No answer produced.")
+        wf.set_entry_point("planner")
+        wf.add_edge("planner", "retriever")
+        wf.add_edge("retriever", "generate")
+        wf.add_edge("generate", END)
+        return wf.compile()
 
-def run_rag_pipeline(event: Dict[str, Any]) -> None:
-    rag_result = run_workflow(event)
-    logging.info("final:", rag_result)
+    def query_planner(self, state: State) -> Dict[str, Any]:
+        logging.info("###### query plan ######\ninput: %s", state["input"])
+
+        with timed("planner") as span:
+            # 같은 eventType/roiId/severity 에 대해 이미 만든 질의가 있으면 LLM 호출 생략
+            queries = self.planner_cache.get(state["input"])
+            span["hits"] = int(queries is not None)
+            if queries is not None:
+                logging.info("planner cache hit: %s (stats: %s)", queries, self.planner_cache.stats())
+            else:
+                queries = self._plan_queries(state["input"], span)
+            span["items"] = len(queries)
+
+        return {"input": state["input"], "plan": queries, "timings": {"planner": span}}
+
+    def _plan_queries(self, event: Dict[str, Any], span: Dict[str, Any]) -> List[str]:
+        system_msg = (
+            "You are a retrieval query planner for an industrial safety RAG system "
+            "backed by a vector store. "
+            "Given an intrusion/safety event JSON, generate *three* high-recall "
+            "natural-language questions that retrieve the most relevant "
+            "work-instruction documents."
+        )
+        human_msg = "Event JSON:\n{event_json}"
+
+        planner_prompt = _build_prompt(system_msg, human_msg)
+        llm = self.llm(self.model_name)
+        response = (planner_prompt | llm).invoke({"event_json": event})
+        raw_text: str = response.content
+        logging.info("LLM raw response: %s", raw_text)
+        _record_usage(span, chat.MODEL_IDS[self.model_name], response, system_msg + str(event), raw_text)
+
+        queries = [
+            line.strip()
+            for line in raw_text.splitlines()
+            if line.strip()
+            and not line.lower().startswith(("event json", "natural-language questions"))
+        ]
+        logging.info("parsed queries: %s", queries)
+        self.planner_cache.put(event, queries)
+        return queries
+
+    def retriever(self, state: State) -> Dict[str, Any]:
+        logging.info("###### retriever ######\nplan: %s", state["plan"])
+
+        with timed("retriever") as span:
+            # 모든 질의를 한 번에 임베딩/검색하고 chunk id 기준으로 병합 (RRF 점수)
+            # 이벤트의 eventType/roiId 태그로 먼저 좁혀 검색하고, 부족하면 전체 검색으로 넓힘
+            retrieved: List[Tuple[Any, float]] = chat.event_filtered_search(
+                self.vectorstore, state["plan"], state["input"], k=TOP_K)
+
+            logging.info("raw docs: %d", len(retrieved))
+            # 거의 같은/겹치는 청크 제거 → MMR 정렬 → 토큰 예산만큼만 generate 로 전달
+            context = build_context(retrieved)
+            logging.info("context docs: %d (%d tokens)", len(context.docs), context.tokens)
+            span.update(items=len(context.docs), contextTokens=context.tokens, **context.stats)
+
+        return {
+            "input": state["input"],
+            "plan": state["plan"],
+            "past_steps": [state["plan"]],
+            "reference_docs": context.docs,
+            "timings": {"retriever": span},
+        }
+
+    def generate_answer(self, state: State) -> Dict[str, Any]:
+        logging.info("#### generating answer ####")
+
+        context = "\n\n".join(doc.page_content for doc, _ in state.get("reference_docs", []))
+        query = state["input"]
+
+        system_msg = (
+            "You will be given a question."
+            "When answering, follow these rules:"
+            "1. Provide a concise answer."
+            "2. Explain your reasoning clearly."
+            "3. If you don’t know the answer, simply say so. "
+            "Present your response in exactly three labeled sections:"
+            "• Risk Level "
+            "• Safety Measures "
+            "• Work Procedure  "
+        )
+        human_msg = "Reference texts:\n{context}\n\nQuestion: {input}"
+        prompt = _build_prompt(system_msg, human_msg)
+
+        llm = self.llm(self.model_name)
+        with timed("generate") as span:
+            try:
+                response = (prompt | llm).invoke({"context": context, "input": query})
+                answer = response.content
+                logging.info("LLM answer: %s", answer)
+                _record_usage(span, chat.MODEL_IDS[self.model_name], response,
+                              system_msg + context + str(query), _content_text(answer))
+            except Exception:  # 세부 Exception 타입이 있다면 교체
+                logging.error("LLM invocation failed:\n%s", traceback.format_exc())
+                answer = FALLBACK_ANSWER
+
+        return {"answer": answer, "timings": {"generate": span}}
+
+    def run_workflow(self, query: Dict[str, Any]) -> str:
+        inputs = {"input": query}
+        config = {"recursion_limit": RECURSION_LIMIT}
+
+        last_value: Dict[str, Any] = {}
+        for output in self.app.stream(inputs, config):
+            for key, value in output.items():
+                logging.debug("Finished: %s", key)
+                last_value = value  # END 단계에서 answer 포함
+
+        return last_value.get("answer", "No answer produced.")
 
-    anomaly_file = Path("data_source/dynamodb_anomaly_data/dummy_safety_events_2025.json")
-    if not anomaly_file.exists():
-        raise FileNotFoundError(f"{anomaly_file} not found.")
+    def stream_workflow(self, query: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """
+        Run the graph and yield ("token", text) as the generate node produces answer tokens,
+        then ("timings", per-node summary) and ("answer", full_answer) once the graph reaches END.
+        """
+        inputs = {"input": query}
+        config = {"recursion_limit": RECURSION_LIMIT}
 
-    with anomaly_file.open(encoding="utf-8") as fp:
-        records = json.load(fp)
+        answer = None
+        timings: Dict[str, Dict[str, Any]] = {}
+        for mode, chunk in self.app.stream(inputs, config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message, metadata = chunk
+                # planner 의 토큰은 제외하고 답변 생성 토큰만 전달
+                if metadata.get("langgraph_node") == "generate":
+                    text = _content_text(message.content)
+                    if text:
+                        yield "token", text
+            else:
+                for key, value in chunk.items():
+                    logging.debug("Finished: %s", key)
+                    timings.update((value or {}).get("timings", {}))
+                    if key == "generate":
+                        answer = value.get("answer")
 
-    for record in records:
-        if record.get("eventId") == event["eventId"]:
-            record["ragAdvisor"] = rag_result
-            break
-    else:  # runs only if the for‑loop did NOT break
-        raise KeyError(f"eventId {event['eventId']} not found. No changes made.")
+        yield "timings", timings
+        yield "answer", answer or "No answer produced."
+
+    def stream(self, event: Dict[str, Any]) -> Iterator[str]:
+        """Yield the advisor text as it is generated and persist it as ragAdvisor on completion."""
+        started = time.perf_counter()
+        with timed("answer_cache") as cache_span:
+            cached = self.answer_cache.lookup(event)
+            cache_span["hits"] = int(bool(cached))
+        timings: Dict[str, Any] = {"answerCache": cache_span}
+        if cached:
+            rag_result = cached[0]
+            updates = self._cached_updates(cached)
+            yield rag_result
+        else:
+            rag_result = "No answer produced."
+            for kind, value in self.stream_workflow(event):
+                if kind == "token":
+                    yield value
+                elif kind == "timings":
+                    timings.update(value)
+                else:
+                    rag_result = value
+            updates = {"ragAdvisor": rag_result, "ragAdvisorSource": "llm"}
+            if rag_result not in (FALLBACK_ANSWER, "No answer produced."):
+                self.answer_cache.store(event, rag_result)
+        self._save(event, updates, timings, time.perf_counter() - started)
+
+    def _save(self, event: Dict[str, Any], updates: Dict[str, Any], timings: Dict[str, Any],
+              total: float) -> None:
+        """total 은 이 이벤트 처리에 걸린 시간(초)."""
+        logging.info("final (%s): %s", updates["ragAdvisorSource"], updates["ragAdvisor"])
+
+        # 이벤트별 처리 시간/토큰/비용 요약 (대시보드 표시 및 사후 분석용)
+        timings["totalMs"] = round(total * 1000, 1)
+        timings["tokens"] = sum(t.get("tokens", 0) for t in timings.values() if isinstance(t, dict))
+        timings["costUsd"] = round(sum(t.get("cost", 0.0) for t in timings.values() if isinstance(t, dict)), 6)
+        observe("rag_total", total, tokens=timings["tokens"], cost=timings["costUsd"])
+        updates["timings"] = timings
+
+        # UpdateItem: ragAdvisor 속성만 갱신 (다른 파이프라인의 갱신과 충돌하지 않음)
+        get_store().update_item(event["eventId"], updates)
+
+        logging.info(f"ragAdvisor added to eventId {event['eventId']} and saved to '{EVENT_DB_PATH}'")
+
+    @staticmethod
+    def _cached_updates(cached: Tuple[str, str, str]) -> Dict[str, Any]:
+        rag_result, match, source_event_id = cached
+        return {"ragAdvisor": rag_result, "ragAdvisorSource": f"cache:{match}",
+                "ragAdvisorCachedFrom": source_event_id}
+
+    def run(self, event: Dict[str, Any]) -> None:
+        for _ in self.stream(event):
+            pass
+
+    def _generate_batch(self, docs: List[Tuple[Any, float]],
+                        events: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """One LLM call answering every event that shares *docs*; returns ({eventId: advisor}, span)."""
+        context = "\n\n".join(doc.page_content for doc, _ in docs)
+        listing = "\n\n".join(
+            f"### EVENT {event['eventId']}\n"
+            + json.dumps({k: event[k] for k in BATCH_EVENT_FIELDS if k in event}, ensure_ascii=False)
+            for event in events
+        )
+        system_msg = (
+            "You will be given several safety events that share the same reference texts. "
+            "Answer every event separately and follow these rules for each answer:"
+            "1. Provide a concise answer."
+            "2. Explain your reasoning clearly."
+            "3. If you don’t know the answer, simply say so. "
+            "Start each answer with a line containing only `### EVENT <eventId>` and then present it "
+            "in exactly three labeled sections:"
+            "• Risk Level "
+            "• Safety Measures "
+            "• Work Procedure  "
+        )
+        human_msg = "Reference texts:\n{context}\n\nEvents:\n{events}"
+        prompt = _build_prompt(system_msg, human_msg)
+
+        llm = self.llm(self.model_name)
+        with timed("generate_batch", items=len(events)) as span:
+            response = (prompt | llm).invoke({"context": context, "events": listing})
+            text = _content_text(response.content)
+            _record_usage(span, chat.MODEL_IDS[self.model_name], response, system_msg + context + listing, text)
+
+        # "### EVENT <id>" 머리글로 나눠 이벤트별 답변으로 분리 (요청하지 않은 id 는 버림)
+        parts = _SECTION_RE.split(text)
+        wanted = {event["eventId"] for event in events}
+        sections = {event_id.strip("`*:"): body.strip() for event_id, body in zip(parts[1::2], parts[2::2])}
+        return {k: v for k, v in sections.items() if k in wanted and v}, span
+
+    def _generate_single(self, event: Dict[str, Any], docs: List[Tuple[Any, float]],
+                         timings: Dict[str, Any], elapsed: float) -> None:
+        """이미 검색한 docs 로 답변만 생성해 저장 (다시 계획/검색하지 않음)."""
+        started = time.perf_counter()
+        result = self.generate_answer({"input": event, "reference_docs": docs})
+        answer = _content_text(result["answer"])
+        self._save(event, {"ragAdvisor": answer, "ragAdvisorSource": "llm"},
+                   {**timings, **result["timings"]}, elapsed + time.perf_counter() - started)
+        if answer != FALLBACK_ANSWER:
+            self.answer_cache.store(event, answer)
+
+    def run_batch(self, events: List[Dict[str, Any]]) -> Dict[str, str | None]:
+        """
+        Batched advisor generation for low-priority events. Cached answers are reused; the rest
+        are planned/retrieved once per (eventType, roiId, severity), grouped by identical retrieved
+        context, and each group of up to ADVISOR_BATCH_MAX events is answered by one LLM call whose
+        per-event sections are split and saved as ragAdvisor. Events the batch answer misses are
+        answered one by one from the context already retrieved. Returns {eventId: error or None};
+        a failure of one event never fails the others.
+        """
+        errors: Dict[str, str | None] = {}
+        contexts: Dict[Any, Tuple[List[Tuple[Any, float]], Dict[str, Any]]] = {}
+        # 검색 문맥(청크 내용) → (docs, [(event, timings, 지금까지 걸린 시간)])
+        groups: Dict[Tuple[str, ...], Tuple[List[Tuple[Any, float]], List[Tuple[Dict[str, Any], Dict[str, Any], float]]]] = {}
+        for event in events:
+            started = time.perf_counter()
+            try:
+                with timed("answer_cache") as cache_span:
+                    cached = self.answer_cache.lookup(event)
+                    cache_span["hits"] = int(bool(cached))
+                if cached:
+                    self._save(event, self._cached_updates(cached), {"answerCache": cache_span},
+                               time.perf_counter() - started)
+                    errors[event["eventId"]] = None
+                    continue
+                signature = event_signature(event)
+                if signature in contexts:
+                    # 같은 질의/검색 결과를 재사용한 이벤트에는 비용을 다시 매기지 않음
+                    docs, stage_timings = contexts[signature]
+                    stage_timings = {k: {**v, "tokens": 0, "cost": 0.0, "shared": True} for k, v in stage_timings.items()}
+                else:
+                    planned = self.query_planner({"input": event})
+                    retrieved = self.retriever({"input": event, "plan": planned["plan"]})
+                    docs, stage_timings = retrieved["reference_docs"], {**planned["timings"], **retrieved["timings"]}
+                    contexts[signature] = (docs, stage_timings)
+            except Exception:
+                logging.error("event %s failed before generation:\n%s", event.get("eventId"), traceback.format_exc())
+                errors[event["eventId"]] = traceback.format_exc()
+                continue
+            key = tuple(doc.page_content for doc, _ in docs)
+            groups.setdefault(key, (docs, []))[1].append(
+                (event, {"answerCache": cache_span, **stage_timings}, time.perf_counter() - started))
+
+        singles: List[Tuple[Dict[str, Any], List[Tuple[Any, float]], Dict[str, Any], float]] = []
+        for docs, members in groups.values():
+            for i in range(0, len(members), max(1, ADVISOR_BATCH_MAX)):
+                chunk = members[i:i + max(1, ADVISOR_BATCH_MAX)]
+                if len(chunk) == 1:
+                    singles.append((chunk[0][0], docs, chunk[0][1], chunk[0][2]))
+                    continue
+                started = time.perf_counter()
+                try:
+                    answers, span = self._generate_batch(docs, [event for event, _, _ in chunk])
+                except Exception:
+                    logging.error("batched generation failed:\n%s", traceback.format_exc())
+                    answers, span = {}, {}
+                generation = time.perf_counter() - started
+                logging.info("batched generation: %d events, %d answers", len(chunk), len(answers))
+                for event, timings, elapsed in chunk:
+                    answer = answers.get(event["eventId"])
+                    if answer is None:
+                        singles.append((event, docs, timings, elapsed + generation))
+                        continue
+                    # 묶음 호출의 토큰/비용은 이벤트 수로 나눠 기록
+                    share = {**span, "batchSize": len(chunk),
+                             "tokens": span.get("tokens", 0) // len(chunk),
+                             "cost": round(span.get("cost", 0.0) / len(chunk), 6)}
+                    try:
+                        self._save(event, {"ragAdvisor": answer, "ragAdvisorSource": "llm-batch"},
+                                   {**timings, "generate": share}, elapsed + generation)
+                        self.answer_cache.store(event, answer)
+                        errors[event["eventId"]] = None
+                    except Exception:
+                        errors[event["eventId"]] = traceback.format_exc()
+
+        for event, docs, timings, elapsed in singles:
+            try:
+                self._generate_single(event, docs, timings, elapsed)
+                errors[event["eventId"]] = None
+            except Exception:
+                errors[event["eventId"]] = traceback.format_exc()
+        return errors
+
+_pipeline: RagPipeline | None = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline() -> RagPipeline:
+    """Process-wide pipeline, created on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = RagPipeline()
+        return _pipeline
+
+def run_workflow(query: Dict[str, Any]) -> str:
+    return get_pipeline().run_workflow(query)
+
+def run_rag_pipeline(event: Dict[str, Any]) -> None:
+    get_pipeline().run(event)
 
-    with anomaly_file.open("w", encoding="utf-8") as fp:
-        json.dump(records, fp, indent=2, ensure_ascii=False)
+def run_rag_batch(events: List[Dict[str, Any]]) -> Dict[str, str | None]:
+    return get_pipeline().run_batch(events)
 
-    logging.info(f"ragAdvisor added to eventId {event['eventId']} and saved to '{anomaly_file}'")
-    
\ No newline at end of file
+def stream_rag_pipeline(event: Dict[str, Any]) -> Iterator[str]:
+    """Like run_rag_pipeline, but yields answer tokens as they are generated."""
+    return get_pipeline().stream(event)
@@ -0,0 +1,143 @@
+'''
+Bedrock 임베딩 호출을 스레드 풀로 병렬화하는 Embeddings 래퍼입니다.
+
+Titan 임베딩은 요청 하나에 텍스트 하나만 받으므로, 대량 수집 시 순차 호출이 병목이 됩니다.
+동시 요청 수는 AIMD 로 조절합니다.
+- 성공하면 동시성을 조금씩 늘리고 (additive increase)
+- 스로틀링 오류를 받으면 절반으로 줄인 뒤 지수 백오프 후 재시도합니다 (multiplicative decrease).
+결과는 입력 순서대로 반환됩니다.
+'''
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from botocore.exceptions import ClientError
+from langchain_core.embeddings import Embeddings
+from metrics import estimate_tokens, observe
+
+# Configuration
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+EMBED_INITIAL_CONCURRENCY = int(os.getenv("EMBED_INITIAL_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "8"))
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 20.0
+
+THROTTLING_CODES = {
+    "ThrottlingException", "TooManyRequestsException",
+    "ServiceQuotaExceededException", "ServiceUnavailableException",
+}
+
+
+# Fucntions
+def is_throttling_error(exc: BaseException) -> bool:
+    """botocore ClientError 와, langchain 이 이를 감싼 ValueError 모두에서 스로틀링 여부를 판단합니다."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, ClientError):
+            if exc.response.get("Error", {}).get("Code") in THROTTLING_CODES:
+                return True
+        elif any(code in str(exc) for code in THROTTLING_CODES) or "Too many requests" in str(exc):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class AdaptiveLimiter:
+    """AIMD 로 허용 동시성(limit)을 조절하는 세마포어."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = EMBED_MAX_CONCURRENCY) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                # 현재 limit 만큼 성공하면 1 증가 (≈ 왕복 시간당 +1)
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ConcurrentEmbeddings(Embeddings):
+    """embed_documents 를 텍스트 단위 요청으로 나눠 적응형 동시성으로 실행합니다 (embed_query 도 같은 limiter 사용)."""
+
+    def __init__(self, embedder: Embeddings,
+                 max_concurrency: int = EMBED_MAX_CONCURRENCY,
+                 initial_concurrency: int = EMBED_INITIAL_CONCURRENCY,
+                 max_retries: int = EMBED_MAX_RETRIES) -> None:
+        self.embedder = embedder
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(initial_concurrency, maximum=max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self._stats = {"texts": 0, "requests": 0, "throttled": 0, "seconds": 0.0}
+
+    def _limited(self, call: Callable[[], List[float]]) -> List[float]:
+        """limiter 안에서 요청 하나를 실행하고, 스로틀링이면 동시성을 줄인 뒤 백오프 후 재시도합니다."""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                vector = call()
+            except Exception as exc:
+                throttled = is_throttling_error(exc)
+                self.limiter.release(throttled=throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                with self._stats_lock:
+                    self._stats["throttled"] += 1
+                delay = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))  # full jitter
+                continue
+            self.limiter.release()
+            with self._stats_lock:
+                self._stats["requests"] += attempt + 1
+            return vector
+        raise RuntimeError("unreachable")
+
+    def _embed_one(self, text: str) -> List[float]:
+        return self._limited(lambda: self.embedder.embed_documents([text])[0])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        started = time.perf_counter()
+        vectors = list(self._pool.map(self._embed_one, texts))  # map 은 입력 순서를 유지
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self._stats["texts"] += len(texts)
+            self._stats["seconds"] += elapsed
+        observe("embed_batch", elapsed, items=len(texts), tokens=sum(estimate_tokens(t) for t in texts))
+        logging.info(
+            "embedded %d texts in %.2fs (%.1f texts/s, concurrency %.1f)",
+            len(texts), elapsed, len(texts) / elapsed if elapsed else 0.0, self.limiter.limit,
+        )
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # 질의도 같은 limiter 를 거쳐야 수집과 동시에 들어올 때 스로틀링 한도를 함께 지킴
+        return self._limited(lambda: self.embedder.embed_query(text))
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["textsPerSec"] = round(stats["texts"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+        stats["concurrency"] = round(self.limiter.limit, 2)
+        return stats
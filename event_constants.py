@@ -0,0 +1,12 @@
+'''
+이벤트 수집(lambda_function_event)과 RAG 파이프라인/청크 태깅(doc_tags)이 함께 쓰는 이벤트 어휘입니다.
+카메라가 보내는 eventType / roiId / severity 값이 바뀌면 여기만 고칩니다.
+'''
+
+EVENT_TYPES = [
+    "DANGER_ZONE_INTRUSION", "VEHICLE_ENTERED",
+    "UNAUTHORIZED_ACCESS", "FIRE_ALERT", "NO_ENTRY_VIOLATION",
+]
+ROI_IDS = ["TANK-AREA-A", "TANK-AREA-B", "FUEL-STORAGE-AREA",
+           "SECURITY-CHECK-POINT", "LOADING-BAY"]
+SEVERITIES = ["LOW", "MEDIUM", "HIGH"]
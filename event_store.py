@@ -0,0 +1,460 @@
+'''
+DynamoDB `events` 테이블을 대신하는 로컬 이벤트 저장소입니다.
+
+기존에는 이벤트 하나를 기록할 때마다 JSON 파일 전체를 읽고, eventId 중복을 선형 탐색한 뒤
+파일 전체를 다시 썼습니다. 이 모듈은 SQLite(WAL) 파일에 이벤트를 한 행씩 저장하여
+- PutItem(조건: attribute_not_exists(eventId)) 에 해당하는 멱등 put (eventId PRIMARY KEY)
+- UpdateItem 에 해당하는 부분 갱신 (status, ragAdvisor 등)
+- 같은 카메라·유형·구역의 연속 이벤트를 하나의 인시던트로 합치는 put (put_coalesced)
+을 제공하며, 여러 프로세스/스레드가 동시에 기록해도 서로의 갱신을 잃지 않습니다.
+
+최초 실행 시 기존 `dummy_safety_events_2025.json` 데이터를 한 번 가져옵니다.
+'''
+
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Configuration
+EVENT_DB_PATH = Path(os.getenv("EVENT_DB_PATH", "data_source/dynamodb_anomaly_data/safety_events.db"))
+LEGACY_JSON_PATH = Path(os.getenv("LEGACY_EVENT_JSON", "data_source/dynamodb_anomaly_data/dummy_safety_events_2025.json"))
+BUSY_TIMEOUT_SEC = float(os.getenv("EVENT_DB_BUSY_TIMEOUT", "30"))
+INCIDENT_MAX_EVENT_IDS = 100  # 재전송된 이벤트를 다시 세지 않도록 인시던트에 남기는 최근 eventId 수
+SEVERITY_RANK = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+# item 에서 인덱싱용 컬럼으로 뽑아내는 속성 (나머지는 item JSON 에만 저장)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id   TEXT PRIMARY KEY,
+    pk         TEXT NOT NULL,
+    sk         TEXT NOT NULL,
+    device_id  TEXT,
+    event_type TEXT,
+    severity   TEXT,
+    status     TEXT,
+    version    INTEGER NOT NULL,
+    item       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_version ON events (version);
+CREATE INDEX IF NOT EXISTS idx_events_pk_sk ON events (pk, sk);
+CREATE INDEX IF NOT EXISTS idx_events_severity_sk ON events (severity, sk);
+CREATE INDEX IF NOT EXISTS idx_events_event_type_sk ON events (event_type, sk);
+CREATE TABLE IF NOT EXISTS incidents (
+    event_id     TEXT PRIMARY KEY,  -- 인시던트로 기록된 (첫) 이벤트
+    incident_key TEXT NOT NULL,     -- pk|eventType|roiId
+    first_ts     REAL NOT NULL,
+    last_ts      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_key_last ON incidents (incident_key, last_ts);
+"""
+
+# 테이블/GSI 이름 → 파티션 키 컬럼 (정렬 키는 모두 sk)
+INDEXES = {
+    "table":          "pk",
+    "severity-index": "severity",
+    "eventType-index": "event_type",
+}
+# query(filters=...) 에서 허용하는 속성 → 컬럼
+_FILTER_COLUMNS = {
+    "pk":        "pk",
+    "deviceId":  "device_id",
+    "severity":  "severity",
+    "eventType": "event_type",
+    "status":    "status",
+}
+
+
+# Fucntions
+def sk_range(start: Optional[str] = None, end: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """ts 범위를 sk(`EVT#<ts>#ID#<id>`) 범위로 변환합니다. end 는 해당 ts 까지 포함합니다."""
+    return (
+        f"EVT#{start}" if start else None,
+        f"EVT#{end}~" if end else None,  # '~' 는 '#', 숫자, 'Z' 보다 뒤에 정렬됨
+    )
+
+
+def _columns(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "event_id":   item["eventId"],
+        "pk":         item.get("pk") or f"SITE#{item.get('siteId')}#CAM#{item.get('deviceId')}",
+        "sk":         item.get("sk") or f"EVT#{item.get('ts')}#ID#{item['eventId']}",
+        "device_id":  item.get("deviceId"),
+        "event_type": item.get("eventType"),
+        "severity":   item.get("severity"),
+        "status":     item.get("status"),
+        "item":       json.dumps(item, ensure_ascii=False),
+    }
+
+
+def ts_epoch(ts: str) -> float:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+def incident_key(item: Dict[str, Any]) -> str:
+    return f"{_columns(item)['pk']}|{item.get('eventType')}|{item.get('roiId')}"
+
+
+class EventStore:
+    """SQLite 기반 이벤트 테이블. 연결은 스레드마다 하나씩 유지합니다."""
+
+    def __init__(self, db_path: Path | str = EVENT_DB_PATH,
+                 legacy_json: Optional[Path | str] = LEGACY_JSON_PATH) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        if legacy_json is not None:
+            self._import_legacy_json(Path(legacy_json))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: 트랜잭션은 _transaction() 에서 직접 관리
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE 로 쓰기 잠금을 먼저 잡아 read-modify-write 가 직렬화되도록 함
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _next_version(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM events").fetchone()[0]
+
+    def _import_legacy_json(self, path: Path) -> None:
+        if not path.exists():
+            return
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+                return
+            try:
+                with path.open(encoding="utf-8") as fp:
+                    items = json.load(fp)
+            except json.JSONDecodeError:
+                items = []
+            if not isinstance(items, list):
+                items = []
+
+            rows = [
+                {**_columns(item), "version": version}
+                for version, item in enumerate((i for i in items if i.get("eventId")), start=1)
+            ]
+            conn.executemany(
+                "INSERT OR IGNORE INTO events "
+                "(event_id, pk, sk, device_id, event_type, severity, status, version, item) "
+                "VALUES (:event_id, :pk, :sk, :device_id, :event_type, :severity, :status, :version, :item)",
+                rows,
+            )
+        logging.info("Imported %d events from %s into %s", len(rows), path, self.db_path)
+
+    def put_item(self, item: Dict[str, Any]) -> bool:
+        """eventId 가 없을 때만 기록합니다. 이미 존재하면 False 를 반환합니다."""
+        with self._transaction() as conn:
+            row = {**_columns(item), "version": self._next_version(conn)}
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO events "
+                "(event_id, pk, sk, device_id, event_type, severity, status, version, item) "
+                "VALUES (:event_id, :pk, :sk, :device_id, :event_type, :severity, :status, :version, :item)",
+                row,
+            )
+        return cur.rowcount == 1
+
+    def put_items(self, items: List[Dict[str, Any]]) -> List[bool]:
+        """BatchWriteItem: 한 트랜잭션으로 기록합니다. 항목별로 새로 기록되었는지(True) 반환합니다."""
+        if not items:
+            return []
+        with self._transaction() as conn:
+            existing = self._existing_ids(conn, [i["eventId"] for i in items])
+            version = self._next_version(conn)
+            rows, written = [], []
+            for item in items:
+                fresh = item["eventId"] not in existing
+                written.append(fresh)
+                if fresh:
+                    existing.add(item["eventId"])  # 배치 내 중복은 첫 항목만 기록
+                    rows.append({**_columns(item), "version": version})
+                    version += 1
+            conn.executemany(
+                "INSERT INTO events "
+                "(event_id, pk, sk, device_id, event_type, severity, status, version, item) "
+                "VALUES (:event_id, :pk, :sk, :device_id, :event_type, :severity, :status, :version, :item)",
+                rows,
+            )
+        return written
+
+    def put_coalesced(self, items: List[Dict[str, Any]], window_sec: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        버스트 합치기 PutItem. 같은 (pk, eventType, roiId) 의 인시던트 중 [firstTs, lastTs] 가 이벤트 ts 에서
+        window_sec 이내인 것이 있으면 새 항목 대신 그 인시던트(count, firstTs/lastTs, maxSeverity)에 합치고,
+        없으면 새 인시던트로 기록합니다. 배치 전체가 한 트랜잭션이며 인시던트마다 한 번만 기록합니다.
+        입력마다 (action, 인시던트 item) 을 반환합니다. action 은 "created", "merged",
+        "escalated"(합쳐지면서 심각도 상승), "duplicate" 중 하나입니다.
+        """
+        results: List[Tuple[str, Dict[str, Any]]] = []
+        if not items:
+            return results
+        epochs = [ts_epoch(item["ts"]) for item in items]  # 시각 파싱은 트랜잭션(쓰기 잠금) 밖에서
+        with self._transaction() as conn:
+            existing = self._existing_ids(conn, [i["eventId"] for i in items])
+            spans: Dict[str, List[Any]] = {}           # 인시던트 eventId → [incident_key, first_ts, last_ts]
+            incidents: Dict[str, Dict[str, Any]] = {}  # 이번 배치에서 기록할 인시던트 (eventId → item)
+            created: set = set()
+            for item, ts in zip(items, epochs):
+                if item["eventId"] in existing:
+                    results.append(("duplicate", incidents.get(item["eventId"]) or self.get_item(item["eventId"]) or item))
+                    continue
+                key = incident_key(item)
+                incident_id = self._find_incident(conn, spans, key, ts, window_sec)
+
+                if incident_id is None:
+                    incident = dict(item)
+                    incident["incident"] = {"count": 1, "firstTs": item["ts"], "lastTs": item["ts"],
+                                            "maxSeverity": item.get("severity"), "eventIds": [item["eventId"]]}
+                    incidents[item["eventId"]] = incident
+                    created.add(item["eventId"])
+                    spans[item["eventId"]] = [key, ts, ts]
+                    existing.add(item["eventId"])
+                    results.append(("created", incident))
+                    continue
+
+                if incident_id not in incidents:
+                    row = conn.execute("SELECT item FROM events WHERE event_id = ?", (incident_id,)).fetchone()
+                    incidents[incident_id] = json.loads(row[0])
+                incident = incidents[incident_id]
+                summary = incident.setdefault("incident", {
+                    "count": 1, "firstTs": incident["ts"], "lastTs": incident["ts"],
+                    "maxSeverity": incident.get("severity"), "eventIds": [incident_id],
+                })
+                if item["eventId"] in summary["eventIds"]:
+                    results.append(("duplicate", incident))  # 이미 합쳐진 이벤트의 재전송
+                    continue
+                summary["count"] += 1
+                summary["eventIds"] = (summary["eventIds"] + [item["eventId"]])[-INCIDENT_MAX_EVENT_IDS:]
+                span = spans[incident_id]
+                if ts < span[1]:
+                    span[1], summary["firstTs"] = ts, item["ts"]
+                if ts > span[2]:
+                    span[2], summary["lastTs"] = ts, item["ts"]
+                escalated = SEVERITY_RANK.get(item.get("severity"), -1) > SEVERITY_RANK.get(summary["maxSeverity"], -1)
+                if escalated:
+                    summary["maxSeverity"] = incident["severity"] = item["severity"]
+                results.append(("escalated" if escalated else "merged", incident))
+
+            version = self._next_version(conn)
+            for offset, (event_id, incident) in enumerate(incidents.items()):
+                row = {**_columns(incident), "version": version + offset}
+                if event_id in created:
+                    conn.execute(
+                        "INSERT INTO events "
+                        "(event_id, pk, sk, device_id, event_type, severity, status, version, item) "
+                        "VALUES (:event_id, :pk, :sk, :device_id, :event_type, :severity, :status, :version, :item)",
+                        row,
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE events SET severity = :severity, status = :status, version = :version, item = :item "
+                        "WHERE event_id = :event_id",
+                        row,
+                    )
+            conn.executemany(
+                "INSERT OR REPLACE INTO incidents (event_id, incident_key, first_ts, last_ts) VALUES (?, ?, ?, ?)",
+                [(event_id, *spans[event_id]) for event_id in incidents],
+            )
+        return results
+
+    @staticmethod
+    def _find_incident(conn: sqlite3.Connection, spans: Dict[str, List[Any]], key: str, ts: float,
+                       window_sec: float) -> Optional[str]:
+        """ts 가 [first_ts - window, last_ts + window] 에 드는 인시던트 (가장 최근 것). spans 는 배치 내 캐시."""
+        for event_id, (span_key, first, last) in sorted(spans.items(), key=lambda kv: -kv[1][2]):
+            if span_key == key and first - window_sec <= ts <= last + window_sec:
+                return event_id
+        row = conn.execute(
+            "SELECT event_id, first_ts, last_ts FROM incidents "
+            "WHERE incident_key = ? AND last_ts >= ? AND first_ts <= ? ORDER BY last_ts DESC LIMIT 1",
+            (key, ts - window_sec, ts + window_sec),
+        ).fetchone()
+        if row is None or row[0] in spans:
+            return None
+        spans[row[0]] = [key, row[1], row[2]]
+        return row[0]
+
+    @staticmethod
+    def _existing_ids(conn: sqlite3.Connection, event_ids: List[str]) -> set:
+        found = set()
+        unique = list(dict.fromkeys(event_ids))
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            rows = conn.execute(
+                f"SELECT event_id FROM events WHERE event_id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(r[0] for r in rows)
+        return found
+
+    def existing_ids(self, event_ids: List[str]) -> set:
+        return self._existing_ids(self._conn(), event_ids)
+
+    def get_item(self, event_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT item FROM events WHERE event_id = ?", (event_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_item(self, event_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """UpdateItem(SET ...) 처럼 주어진 속성만 덮어쓰고 갱신된 item 을 반환합니다."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT item FROM events WHERE event_id = ?", (event_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"eventId {event_id} not found. No changes made.")
+
+            item = json.loads(row[0])
+            item.update(updates)
+            cols = _columns(item)
+            conn.execute(
+                "UPDATE events SET pk = :pk, sk = :sk, device_id = :device_id, event_type = :event_type, "
+                "severity = :severity, status = :status, version = :version, item = :item "
+                "WHERE event_id = :event_id",
+                {**cols, "version": self._next_version(conn)},
+            )
+        return item
+
+    def query(self, key: str, *, index: str = "table",
+              start: Optional[str] = None, end: Optional[str] = None,
+              newest_first: bool = True, limit: Optional[int] = None,
+              filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        DynamoDB Query 와 같이 파티션 키가 `key` 인 항목을 sk 순으로 반환합니다.
+        `index` 로 severity-index / eventType-index (GSI) 를 지정할 수 있고,
+        `start`/`end` 는 ts 범위, `filters` 는 추가 등호 조건입니다.
+        """
+        if index not in INDEXES:
+            raise ValueError(f"unknown index: {index}")
+
+        clauses = [f"{INDEXES[index]} = ?"]
+        params: List[Any] = [key]
+        sk_from, sk_to = sk_range(start, end)
+        if sk_from:
+            clauses.append("sk >= ?")
+            params.append(sk_from)
+        if sk_to:
+            clauses.append("sk < ?")
+            params.append(sk_to)
+        for attr, value in (filters or {}).items():
+            if attr not in _FILTER_COLUMNS:
+                raise ValueError(f"unsupported filter attribute: {attr}")
+            clauses.append(f"{_FILTER_COLUMNS[attr]} = ?")
+            params.append(value)
+
+        sql = (
+            f"SELECT item FROM events WHERE {' AND '.join(clauses)} "
+            f"ORDER BY sk {'DESC' if newest_first else 'ASC'}"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._conn().execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def query_camera(self, site_id: str, device_id: str,
+                     start: Optional[str] = None, end: Optional[str] = None,
+                     limit: Optional[int] = None, **kwargs: Any) -> List[Dict[str, Any]]:
+        """카메라 하나의 이벤트를 start~end 구간에서 최신순으로 조회합니다."""
+        return self.query(f"SITE#{site_id}#CAM#{device_id}", start=start, end=end, limit=limit, **kwargs)
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        """(pk, deviceId) 목록. pk 인덱스만 읽습니다."""
+        rows = self._conn().execute("SELECT DISTINCT pk, device_id FROM events ORDER BY pk").fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def distinct(self, index: str) -> List[str]:
+        """GSI 의 파티션 키 값 목록 (예: severity-index → LOW/MEDIUM/HIGH)."""
+        column = INDEXES[index]
+        rows = self._conn().execute(
+            f"SELECT DISTINCT {column} FROM events WHERE {column} IS NOT NULL ORDER BY {column}"
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def scan(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT item FROM events ORDER BY version").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def current_version(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(version), 0) FROM events").fetchone()[0]
+
+    def changes_since(self, version: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """version 이후에 기록/갱신된 (version, item) 목록. 쓰기는 직렬화되므로 빠지는 항목이 없습니다."""
+        rows = self._conn().execute(
+            "SELECT version, item FROM events WHERE version > ? ORDER BY version", (version,)
+        ).fetchall()
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+
+class EventView:
+    """
+    저장소의 version 커서를 따라가며 새로 기록/갱신된 이벤트만 반영하는 메모리 뷰입니다.
+    카메라(pk)별로 sk 정렬 상태를 유지하므로 대시보드 rerun 마다 전체를 다시 읽거나 정렬하지 않습니다.
+    """
+
+    def __init__(self, store: EventStore) -> None:
+        self.store = store
+        self.version = 0
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._by_pk: Dict[str, List[Tuple[str, str]]] = {}  # pk -> [(sk, eventId)] 오름차순
+        self._devices: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """마지막 refresh 이후의 변경분만 읽어 반영하고, 반영한 건수를 반환합니다."""
+        with self._lock:
+            changes = self.store.changes_since(self.version)
+            for version, item in changes:
+                cols = _columns(item)
+                old = self._items.get(cols["event_id"])
+                if old is not None:
+                    old_cols = _columns(old)
+                    entries = self._by_pk[old_cols["pk"]]
+                    del entries[bisect.bisect_left(entries, (old_cols["sk"], old_cols["event_id"]))]
+                self._items[cols["event_id"]] = item
+                bisect.insort(self._by_pk.setdefault(cols["pk"], []), (cols["sk"], cols["event_id"]))
+                self._devices[cols["pk"]] = cols["device_id"]
+                self.version = version
+            return len(changes)
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return sorted((pk, dev) for pk, dev in self._devices.items() if self._by_pk.get(pk))
+
+    def severities(self) -> List[str]:
+        with self._lock:
+            return sorted({i["severity"] for i in self._items.values() if i.get("severity")})
+
+    def query(self, pk: str, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """pk 의 이벤트를 최신순으로 반환합니다. filters 는 item 속성 등호 조건입니다."""
+        with self._lock:
+            entries = self._by_pk.get(pk, [])
+            items = (self._items[event_id] for _, event_id in reversed(entries))
+            return [i for i in items if all(i.get(k) == v for k, v in (filters or {}).items())]
+
+
+@lru_cache(maxsize=None)
+def get_store(db_path: str = str(EVENT_DB_PATH)) -> EventStore:
+    return EventStore(db_path)
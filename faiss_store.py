@@ -0,0 +1,445 @@
+'''
+Chroma 대신 사용할 수 있는 FAISS 벡터 저장소입니다 (VECTOR_BACKEND=faiss).
+
+<vector_dir>/faiss/ 아래에 다음 파일을 둡니다.
+
+- CURRENT              현재 세대(generation) 번호. 쓰기가 끝날 때 원자적으로 교체됨
+- index-<gen>.faiss    FAISS 인덱스 (Flat / HNSW / IVF-PQ, FAISS_INDEX 의 index_factory 문자열)
+- ids-<gen>.npy        행 번호 → 청크 ID 맵 (고정 길이 바이트, 삭제된 행은 빈 값)
+- docs.db              청크 본문/메타데이터와 태그(et_*, roi_*) 색인 (SQLite)
+
+읽기 프로세스는 인덱스와 ID 맵을 읽기 전용 mmap 으로 열기 때문에 여러 워커가 같은 페이지 캐시를
+공유하고, 열 때 파일 전체를 메모리로 읽지 않습니다. 쓰기(수집)는 한 프로세스가 메모리에서 변경한 뒤
+persist() 에서 새 세대 파일을 쓰고 CURRENT 를 바꾸므로, 읽는 쪽은 항상 완결된 세대를 보고
+질의할 때 CURRENT 가 바뀌었으면 새 세대로 다시 엽니다. 쓰는 쪽은 첫 변경부터 persist() 까지
+write.lock 을 잡고 있으므로(쓰기 세션) 두 writer 가 같은 행 번호를 쓰거나 서로의 행을 지우지 않습니다.
+잠금을 FAISS_WRITE_LOCK_TIMEOUT_SEC 안에 얻지 못하면 잡고 있는 pid 와 함께 TimeoutError 를 내고,
+끝내지 않을 세션은 rollback() 으로 변경을 버리고 잠금을 놓습니다.
+'''
+
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Configuration
+FAISS_INDEX = os.getenv("FAISS_INDEX", "Flat")                # Flat | HNSW32 | IVF4096,PQ64x4fs ... (faiss.index_factory)
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))  # IVF/PQ 학습에 쓸 최대 벡터 수
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))           # IVF: 질의 시 살펴볼 리스트 수
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))     # HNSW: 질의 시 후보 폭
+FAISS_ID_BYTES = 32                                           # 청크 ID 최대 길이 (chunk_id 는 22자)
+KEEP_GENERATIONS = 2                                          # 이전 세대 하나는 남겨 둠 (열려 있는 읽기용)
+BUSY_TIMEOUT_SEC = 30
+FAISS_WRITE_LOCK_TIMEOUT_SEC = float(os.getenv("FAISS_WRITE_LOCK_TIMEOUT_SEC", "300"))  # 쓰기 세션 잠금 대기 한도
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    row       INTEGER PRIMARY KEY,
+    chunk_id  TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    metadata  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_chunk_id ON docs (chunk_id);
+CREATE TABLE IF NOT EXISTS tags (
+    key  TEXT NOT NULL,
+    row  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tags_key ON tags (key, row);
+"""
+
+
+# Fucntions
+def _faiss():
+    import faiss  # import 에 수백 ms 가 걸리므로 처음 사용할 때
+    return faiss
+
+def _numpy():
+    import numpy
+    return numpy
+
+def _search_params(index: Any, selector: Any) -> Any:
+    faiss = _faiss()
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=FAISS_EF_SEARCH)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=FAISS_NPROBE)
+    return faiss.SearchParameters(sel=selector)
+
+def _where_key(where: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(where, sort_keys=True)
+
+
+class FaissVectorStore:
+    """
+    langchain Chroma 중 이 저장소가 쓰는 부분(embeddings, add_documents, delete, 컬렉션 query/count)을
+    같은 모양으로 제공합니다. read_only=True 면 mmap 으로 열고 쓰기 메서드는 사용할 수 없습니다.
+    """
+
+    def __init__(self, directory: str, embeddings: Embeddings, read_only: bool = False,
+                 index_spec: str = FAISS_INDEX) -> None:
+        self.directory = directory
+        self.embeddings = embeddings
+        self.read_only = read_only
+        self.index_spec = index_spec
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._generation = -1
+        self._index: Any = None
+        self._ids: Optional["np.ndarray"] = None
+        self._tombstones: Optional["np.ndarray"] = None  # 인덱스에서 지울 수 없는(HNSW) 삭제된 행
+        self._count = 0
+        self._selectors: Dict[str, Any] = {}             # where 필터 → IDSelector (세대마다 초기화)
+        # 쓰기 전용 상태
+        self._pending_vectors: List["np.ndarray"] = []   # 학습 전(IVF) 인덱스에 넣을 벡터
+        self._pending_rows: List["np.ndarray"] = []
+        self._pending_deletes: List[int] = []            # persist 후에 docs 에서 지울 행
+        self._dirty = False
+        self._session: Optional[IO[str]] = None          # 쓰기 세션 동안 잡고 있는 write.lock
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+        self._load()
+
+    # -- storage --------------------------------------------------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "docs.db"), timeout=BUSY_TIMEOUT_SEC)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _current_generation(self) -> int:
+        try:
+            with open(self._path("CURRENT"), encoding="utf-8") as fp:
+                return int(fp.read().strip() or -1)
+        except FileNotFoundError:
+            return -1
+
+    def _acquire_session(self) -> None:
+        # 여러 프로세스(람다 수집, 대시보드 업로드, 검색 서비스)의 쓰기를 첫 변경부터 persist 까지 직렬화
+        # flock 은 프로세스가 죽으면 풀리므로, 오래 막히는 것은 살아 있는 writer 가 세션을 끝내지 않은 경우
+        fp = open(self._path("write.lock"), "a+")
+        deadline = time.monotonic() + FAISS_WRITE_LOCK_TIMEOUT_SEC
+        try:
+            while True:
+                try:
+                    fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        fp.seek(0)
+                        raise TimeoutError(f"faiss store {self.directory}: write.lock held by "
+                                           f"{fp.read().strip() or 'unknown'} for over {FAISS_WRITE_LOCK_TIMEOUT_SEC:g}s")
+                    time.sleep(0.05)
+            fp.seek(0)
+            fp.truncate()
+            fp.write(f"pid {os.getpid()} since {time.strftime('%Y-%m-%dT%H:%M:%S')}")
+            fp.flush()
+        except BaseException:
+            fp.close()
+            raise
+        self._session = fp
+
+    def _release_session(self) -> None:
+        if self._session is not None:
+            self._session.truncate(0)
+            fcntl.flock(self._session, fcntl.LOCK_UN)
+            self._session.close()
+            self._session = None
+
+    def _load(self) -> None:
+        np, faiss = _numpy(), _faiss()
+        generation = self._current_generation()
+        if generation < 0:
+            self._index, self._ids = None, np.zeros(0, dtype=f"S{FAISS_ID_BYTES}")
+        else:
+            index_path, ids_path = self._path(f"index-{generation}.faiss"), self._path(f"ids-{generation}.npy")
+            if self.read_only:
+                # IO_FLAG_MMAP_IFC: Flat 계열 벡터 저장소까지 복사 없이 mmap (faiss >= 1.9)
+                flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+                self._index = faiss.read_index(index_path, flags)
+                self._ids = np.load(ids_path, mmap_mode="r")
+            else:
+                self._index = faiss.read_index(index_path)
+                self._ids = np.load(ids_path)
+        self._generation = generation
+        self._reset_tombstones()
+        logging.info("faiss store %s: generation %d, %d rows (%s)",
+                     self.directory, generation, len(self._ids), "mmap" if self.read_only else "writer")
+
+    def _reset_tombstones(self) -> None:
+        np, faiss = _numpy(), _faiss()
+        deleted = self._ids == b""
+        self._count = int(len(self._ids) - np.count_nonzero(deleted))
+        removable = self._index is None or not isinstance(
+            faiss.downcast_index(self._index.index) if hasattr(self._index, "id_map") else self._index, faiss.IndexHNSW)
+        # Flat / IVF 는 삭제한 행이 인덱스에서 빠지므로 tombstone 필터가 필요 없음
+        self._tombstones = np.zeros(0, dtype="int64") if removable else np.flatnonzero(deleted).astype("int64")
+        self._selectors = {}
+
+    def _begin_write(self) -> None:
+        if self.read_only:
+            raise RuntimeError("FaissVectorStore opened read-only")
+        if self._session is not None:
+            return
+        # 쓰기 세션 시작: 잠금을 잡은 뒤 최신 세대에서 시작하고, 중단된 writer 가 남긴 행만 정리
+        self._acquire_session()
+        if self._current_generation() != self._generation:
+            self._load()
+        self._drop_orphans()
+
+    def _refresh(self) -> None:
+        # 읽기: 수집이 새 세대를 썼으면 다시 엶 (stat 한 번이면 되므로 질의마다 확인)
+        if self.read_only and self._current_generation() != self._generation:
+            with self._lock:
+                self._load()
+
+    def _drop_orphans(self) -> None:
+        # 잠금을 잡은 상태에서만 호출: 현재 세대 밖의 행은 persist 전에 중단된 쓰기가 남긴 것
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM docs WHERE row >= ?", (len(self._ids),))
+            conn.execute("DELETE FROM tags WHERE row >= ?", (len(self._ids),))
+
+    # -- Chroma 호환 쓰기 ---------------------------------------------------------------------
+    def add_documents(self, documents: Sequence[Document], ids: Sequence[str]) -> List[str]:
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        return self.add_embeddings(ids, vectors, [doc.page_content for doc in documents],
+                                   [dict(doc.metadata) for doc in documents])
+
+    def add_embeddings(self, ids: Sequence[str], vectors: Sequence[Sequence[float]],
+                       texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> List[str]:
+        """Upsert precomputed vectors (existing chunk ids are replaced by new rows)."""
+        np, faiss = _numpy(), _faiss()
+        if not ids:
+            return []
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype="float32"))
+        faiss.normalize_L2(matrix)  # 내적 = 코사인 유사도
+
+        with self._lock:
+            self._begin_write()
+            if self._index is None:
+                self._index = faiss.index_factory(matrix.shape[1], self.index_spec, faiss.METRIC_INNER_PRODUCT)
+                if not isinstance(self._index, faiss.IndexIVF):
+                    # IVF 는 ID 를 직접 저장. Flat/HNSW 는 행 번호 → 내부 번호 맵으로 감쌈
+                    self._index = faiss.IndexIDMap2(self._index)
+            self._delete_rows(self._rows_for(ids))
+            start = len(self._ids)
+            rows = np.arange(start, start + len(ids), dtype="int64")
+            self._ids = np.concatenate([self._ids, np.asarray([i.encode("utf-8") for i in ids],
+                                                              dtype=f"S{FAISS_ID_BYTES}")])
+            if self._index.is_trained:
+                self._index.add_with_ids(matrix, rows)
+            else:
+                self._pending_vectors.append(matrix)
+                self._pending_rows.append(rows)
+
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO docs (row, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                    [(int(r), cid, text, json.dumps(meta, ensure_ascii=False))
+                     for r, cid, text, meta in zip(rows, ids, texts, metadatas)],
+                )
+                conn.executemany(
+                    "INSERT INTO tags (key, row) VALUES (?, ?)",
+                    [(key, int(r)) for r, meta in zip(rows, metadatas) for key, value in meta.items() if value is True],
+                )
+            self._dirty = True
+        return list(ids)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._begin_write()
+            self._delete_rows(self._rows_for(ids))
+
+    def _rows_for(self, ids: Sequence[str]) -> List[int]:
+        conn, rows = self._conn(), []
+        unique = list(dict.fromkeys(ids))
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            rows += [r for (r,) in conn.execute(
+                f"SELECT row FROM docs WHERE chunk_id IN ({','.join('?' * len(part))})", part)]
+        # 아직 persist 되지 않은 삭제 대상은 제외
+        pending = set(self._pending_deletes)
+        return [r for r in rows if r not in pending and self._ids[r] != b""]
+
+    def _delete_rows(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        np, faiss = _numpy(), _faiss()
+        self._ids[rows] = b""
+        selector = faiss.IDSelectorBatch(np.asarray(rows, dtype="int64"))
+        try:
+            self._index.remove_ids(selector)
+        except RuntimeError:
+            pass  # HNSW 는 삭제를 지원하지 않음 → ID 맵의 빈 값(tombstone)으로 검색에서 제외
+        self._pending_deletes.extend(rows)
+        self._dirty = True
+
+    def _save_ids(self, path: str) -> None:
+        with open(path, "wb") as fp:  # 경로로 주면 np.save 가 .npy 를 덧붙임
+            _numpy().save(fp, self._ids)
+
+    def persist(self) -> int:
+        """Write a new generation (index + id map) and switch CURRENT to it. Returns the generation."""
+        if self.read_only:
+            return self._generation
+        np, faiss = _numpy(), _faiss()
+        with self._lock:
+            if not self._dirty:
+                self._release_session()
+                return self._generation
+            current = self._current_generation()
+            if current != self._generation:
+                raise RuntimeError(f"faiss store {self.directory} was written by another process "
+                                   f"(generation {current}, expected {self._generation})")
+            if self._pending_vectors:
+                matrix, rows = np.concatenate(self._pending_vectors), np.concatenate(self._pending_rows)
+                if not self._index.is_trained:
+                    sample = matrix
+                    if len(matrix) > FAISS_TRAIN_SAMPLE:
+                        sample = matrix[np.random.default_rng(0).choice(len(matrix), FAISS_TRAIN_SAMPLE, replace=False)]
+                    logging.info("training %s on %d vectors", self.index_spec, len(sample))
+                    self._index.train(sample)
+                live = self._ids[rows] != b""  # 학습 전에 추가됐다가 삭제된 행 제외
+                self._index.add_with_ids(matrix[live], rows[live])
+                self._pending_vectors, self._pending_rows = [], []
+
+            generation = current + 1
+            for name, write in ((f"index-{generation}.faiss", lambda p: faiss.write_index(self._index, p)),
+                                (f"ids-{generation}.npy", self._save_ids)):
+                tmp = self._path(name + ".tmp")
+                write(tmp)
+                os.replace(tmp, self._path(name))
+            tmp = self._path("CURRENT.tmp")
+            with open(tmp, "w", encoding="utf-8") as fp:
+                fp.write(str(generation))
+            os.replace(tmp, self._path("CURRENT"))  # 원자적 교체: 읽는 쪽은 이전 또는 새 세대 중 하나만 봄
+
+            # 새 세대에 없는 행은 이제 docs 에서 지워도 됨 (이전 세대를 열고 있는 질의는 해당 행을 건너뜀)
+            conn = self._conn()
+            with conn:
+                conn.executemany("DELETE FROM docs WHERE row = ?", [(r,) for r in self._pending_deletes])
+                conn.executemany("DELETE FROM tags WHERE row = ?", [(r,) for r in self._pending_deletes])
+            self._pending_deletes = []
+            for name in (f"index-{generation - KEEP_GENERATIONS}.faiss", f"ids-{generation - KEEP_GENERATIONS}.npy"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))  # mmap 으로 열려 있어도 POSIX 에서는 안전
+
+            self._generation = generation
+            self._reset_tombstones()
+            self._dirty = False
+            self._release_session()
+        logging.info("faiss store %s: persisted generation %d (%d vectors)",
+                     self.directory, generation, self._index.ntotal)
+        return generation
+
+    def rollback(self) -> None:
+        """Discard unpersisted writes and release write.lock (docs rows left behind are dropped as orphans)."""
+        with self._lock:
+            if self._session is None:
+                return
+            self._pending_vectors, self._pending_rows, self._pending_deletes = [], [], []
+            self._dirty = False
+            self._load()
+            self._drop_orphans()
+            self._release_session()
+        logging.warning("faiss store %s: rolled back unpersisted writes", self.directory)
+
+    # -- Chroma 컬렉션 호환 읽기 ---------------------------------------------------------------
+    def count(self) -> int:
+        self._refresh()
+        return self._count
+
+    def _rows_matching(self, where: Dict[str, Any]) -> set:
+        if "$and" in where:
+            sets = [self._rows_matching(w) for w in where["$and"]]
+            return set.intersection(*sets) if sets else set()
+        if "$or" in where:
+            return set().union(*(self._rows_matching(w) for w in where["$or"]))
+        (key, value), = where.items()
+        conn = self._conn()
+        if value is True:
+            return {r for (r,) in conn.execute("SELECT row FROM tags WHERE key = ?", (key,))}
+        # 태그가 아닌 값은 메타데이터 JSON 에서 비교 (전체 스캔)
+        return {r for (r,) in conn.execute(
+            "SELECT row FROM docs WHERE json_extract(metadata, '$.' || ?) = ?",
+            (key, json.dumps(value) if isinstance(value, bool) else value))}
+
+    def _selector(self, where: Optional[Dict[str, Any]]) -> Any:
+        key = _where_key(where)
+        if key not in self._selectors:
+            np, faiss = _numpy(), _faiss()
+            if where:
+                rows = np.fromiter(self._rows_matching(where), dtype="int64")
+                rows = rows[rows < len(self._ids)]  # 현재 세대 이후에 추가된 행 제외
+                selector = faiss.IDSelectorBatch(rows)
+                keep = (rows,)
+            elif len(self._tombstones):
+                inner = faiss.IDSelectorBatch(self._tombstones)
+                selector, keep = faiss.IDSelectorNot(inner), (inner,)
+            else:
+                selector, keep = None, ()
+            self._selectors[key] = (selector, keep)  # keep: SWIG 객체가 먼저 해제되지 않도록
+        return self._selectors[key][0]
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 4,
+              where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, List[List[Any]]]:
+        """Same result shape as chromadb Collection.query (one list per query vector)."""
+        self._refresh()
+        np, faiss = _numpy(), _faiss()
+        empty = {"ids": [[] for _ in query_embeddings], "documents": [[] for _ in query_embeddings],
+                 "metadatas": [[] for _ in query_embeddings], "distances": [[] for _ in query_embeddings]}
+        with self._lock:
+            index, ids = self._index, self._ids
+            if index is None or index.ntotal == 0 or not len(query_embeddings):
+                return empty
+            matrix = np.ascontiguousarray(np.asarray(query_embeddings, dtype="float32"))
+            faiss.normalize_L2(matrix)
+            selector = self._selector(where)
+            params = _search_params(index, selector)  # 필터가 없어도 nprobe / efSearch 적용
+            scores, rows = index.search(matrix, n_results, params=params)
+
+        wanted = sorted({int(r) for r in rows.ravel() if r >= 0})
+        docs: Dict[int, Tuple[str, str]] = {}
+        if wanted:
+            conn = self._conn()
+            for i in range(0, len(wanted), 500):
+                part = wanted[i:i + 500]
+                docs.update((r, (text, meta)) for r, text, meta in conn.execute(
+                    f"SELECT row, text, metadata FROM docs WHERE row IN ({','.join('?' * len(part))})", part))
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for score_row, id_row in zip(scores, rows):
+            out_ids, out_docs, out_metas, out_dist = [], [], [], []
+            for score, r in zip(score_row, id_row):
+                if int(r) not in docs:
+                    continue  # 결과 없음(-1) / 이전 세대로 질의하는 동안 삭제된 행
+                out_ids.append(ids[r].decode("utf-8"))
+                text, meta = docs[int(r)]
+                out_docs.append(text)
+                out_metas.append(json.loads(meta))
+                out_dist.append(float(1.0 - score))  # 코사인 거리 (Chroma 처럼 작을수록 가까움)
+            result["ids"].append(out_ids)
+            result["documents"].append(out_docs)
+            result["metadatas"].append(out_metas)
+            result["distances"].append(out_dist)
+        return result
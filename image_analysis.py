@@ -0,0 +1,265 @@
+'''
+이벤트 이미지를 생성형 AI(비전 모델)로 분석해 현재 상황을 한 문장(message)으로 기록합니다.
+
+- 전처리: 모델 입력에 맞게 줄이고(긴 변 ANALYSIS_MAX_PX) JPEG 로 다시 인코딩해 전송량/이미지 토큰을 줄임
+- 캐시:   이미지 내용 해시(perceptual dHash)로 분석 결과를 저장. 카메라가 거의 같은 프레임을 다시
+          보내면 (재인코딩·압축 잡음은 해시 몇 비트 차이이므로) 모델을 호출하지 않음
+- 배치:   한 번에 들어온 이미지들(S3 알림 묶음)은 해시로 중복을 제거하고 ANALYSIS_BATCH_SIZE 장씩
+          한 번의 호출로 분석 (응답은 imageId → 설명 JSON)
+'''
+
+import base64
+import io
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from disk_cache import DiskLRUCache
+from metrics import estimate_cost, estimate_tokens, timed, usage_tokens
+
+# Configuration
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "claude_3_5_haiku")      # chat.MODEL_IDS 키
+ANALYSIS_MAX_PX = int(os.getenv("ANALYSIS_MAX_PX", "1092"))          # Claude 비전 입력 권장 최대 크기(1:1)
+ANALYSIS_JPEG_QUALITY = int(os.getenv("ANALYSIS_JPEG_QUALITY", "85"))
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "4"))     # 호출당 이미지 수
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))   # 동시에 보내는 배치 수
+ANALYSIS_HASH_SIZE = int(os.getenv("ANALYSIS_HASH_SIZE", "16"))      # dHash 격자 (16 → 256비트)
+ANALYSIS_NEAR_BITS = int(os.getenv("ANALYSIS_NEAR_BITS", "8"))       # 이 비트 수 이하로 다르면 같은 프레임 (0: 완전 일치만)
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "./data_source/analysis_cache/analysis.db")
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+PROMPT_VERSION = 1  # 프롬프트가 바뀌면 올려서 이전 분석 결과를 쓰지 않게 함
+
+SYSTEM_PROMPT = (
+    "You are a safety camera image analyst at an industrial site. For every image, describe in one "
+    "sentence what is currently happening (people, vehicles, fire/smoke, PPE, restricted areas). "
+    "Respond with a single JSON object mapping each imageId to its description and nothing else."
+)
+
+
+@dataclass
+class AnalysisRequest:
+    image_id: str              # 응답과 결과를 맞추는 키 (보통 eventId)
+    data: bytes                # 원본 이미지 바이트
+    hint: Dict[str, Any]       # eventType / roiId 등 카메라가 보낸 메타데이터
+
+
+# Fucntions
+def image_hash(data: bytes, size: int = ANALYSIS_HASH_SIZE) -> str:
+    """
+    Difference hash of the image: grayscale, shrunk to (size+1) x size, one bit per
+    horizontally adjacent pixel pair. Re-encoded or slightly noisy copies of a frame
+    differ in only a few bits (see ANALYSIS_NEAR_BITS), a different scene in about half.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # draft(축소 디코딩)는 JPEG/PNG 사이에 결과가 달라지므로 쓰지 않음
+        gray = ImageOps.exif_transpose(image).convert("L").resize((size + 1, size), Image.Resampling.BOX)
+    pixels = gray.tobytes()
+    bits = 0
+    for row in range(size):
+        line = pixels[row * (size + 1):(row + 1) * (size + 1)]
+        for col in range(size):
+            bits = (bits << 1) | (line[col] > line[col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def _bands(digest: str) -> List[str]:
+    # 해시를 ANALYSIS_NEAR_BITS + 1 개 구간으로 나눔: 다른 비트가 그보다 적으면 어느 한 구간은 같음
+    count = ANALYSIS_NEAR_BITS + 1
+    bits, width = int(digest, 16), -(-len(digest) * 4 // count)
+    return [f"{i}:{(bits >> (i * width)) & ((1 << width) - 1):x}" for i in range(count)]
+
+def prepare_image(data: bytes, max_px: int = ANALYSIS_MAX_PX,
+                  quality: int = ANALYSIS_JPEG_QUALITY) -> Tuple[bytes, Tuple[int, int]]:
+    """모델 입력 크기로 줄인 JPEG 바이트와 크기. 이미 작으면 확대하지 않음."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (max_px, max_px))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_px, max_px), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue(), image.size
+
+def _parse_descriptions(text: str) -> Dict[str, str]:
+    # 코드 블록이나 앞뒤 설명이 붙어도 첫 JSON 객체만 사용
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    return {str(k): str(v).strip() for k, v in parsed.items() if isinstance(v, str) and v.strip()}
+
+def _default_model() -> Any:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "ecs-rag-pipeline"))
+    import chat
+    return chat.get_chat(model=ANALYSIS_MODEL)
+
+
+class ImageAnalyzer:
+    """이미지 묶음을 (캐시 → 중복 제거 → 배치 호출) 순서로 분석합니다. 여러 스레드에서 함께 사용할 수 있습니다."""
+
+    def __init__(self, model: Any = None, cache: Optional[DiskLRUCache] = None,
+                 batch_size: int = ANALYSIS_BATCH_SIZE, concurrency: int = ANALYSIS_CONCURRENCY) -> None:
+        self._model = model
+        self.model_id = getattr(model, "model_id", ANALYSIS_MODEL)
+        self.cache = cache or DiskLRUCache(ANALYSIS_CACHE_PATH, ANALYSIS_CACHE_MAX_ENTRIES)
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            self._model = _default_model()
+            self.model_id = getattr(self._model, "model_id", ANALYSIS_MODEL)
+        return self._model
+
+    def _cache_key(self, digest: str) -> str:
+        return f"{ANALYSIS_MODEL}:v{PROMPT_VERSION}:{ANALYSIS_MAX_PX}:{digest}"
+
+    def _band_key(self, band: str) -> str:
+        return f"{ANALYSIS_MODEL}:v{PROMPT_VERSION}:{ANALYSIS_MAX_PX}:band:{band}"
+
+    def _messages(self, batch: Sequence[Tuple[str, bytes, Dict[str, Any]]]) -> List[Any]:
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        content: List[Dict[str, Any]] = []
+        for image_id, jpeg, hint in batch:
+            meta = ", ".join(f"{k}: {v}" for k, v in hint.items() if v)
+            content.append({"type": "text", "text": f"imageId: {image_id} ({meta})"})
+            content.append({"type": "image_url", "image_url": {
+                "url": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")}})
+        content.append({"type": "text", "text": "Return the JSON object now."})
+        return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=content)]
+
+    def _invoke(self, batch: Sequence[Tuple[str, bytes, Dict[str, Any]]], pixels: int) -> Dict[str, str]:
+        with timed("image_analysis_call", items=len(batch)) as span:
+            message = self.model.invoke(self._messages(batch))
+            text = message.content if isinstance(message.content, str) else "".join(
+                block.get("text", "") for block in message.content if isinstance(block, dict))
+            usage = usage_tokens(message)
+            if not usage["inputTokens"]:
+                # Claude 비전 입력 토큰 근사: (너비 x 높이) / 750
+                usage = {"inputTokens": pixels // 750 + estimate_tokens(SYSTEM_PROMPT),
+                         "outputTokens": estimate_tokens(text)}
+            span["tokens"] = usage["inputTokens"] + usage["outputTokens"]
+            span["cost"] = round(estimate_cost(self.model_id, usage["inputTokens"], usage["outputTokens"]), 6)
+        descriptions = _parse_descriptions(text)
+        missing = [image_id for image_id, _, _ in batch if image_id not in descriptions]
+        if missing:
+            logging.warning("image analysis returned no description for %s", ", ".join(missing))
+        return descriptions
+
+    def _lookup(self, digests: Sequence[str]) -> Dict[str, Tuple[str, int]]:
+        """캐시된 분석 결과 {digest: (설명, 해밍 거리)} — 같은 해시, 없으면 ANALYSIS_NEAR_BITS 이내의 가까운 해시."""
+        keys = {digest: self._cache_key(digest) for digest in digests}
+        exact = self.cache.get_many(list(keys.values()))
+        found = {d: (exact[k].decode("utf-8"), 0) for d, k in keys.items() if k in exact}
+        rest = [d for d in digests if d not in found]
+        if not ANALYSIS_NEAR_BITS or not rest:
+            return found
+
+        # 밴드 중 하나라도 같은 해시만 후보로 (거리가 ANALYSIS_NEAR_BITS 이하면 반드시 한 밴드는 일치)
+        band_keys = {d: [self._band_key(band) for band in _bands(d)] for d in rest}
+        bands = self.cache.get_many([k for ks in band_keys.values() for k in ks])
+        nearest: Dict[str, Tuple[int, str]] = {}
+        for d, ks in band_keys.items():
+            candidates = {bands[k].decode("ascii") for k in ks if k in bands}
+            best = min(((hamming(d, c), c) for c in candidates), default=None)
+            if best and best[0] <= ANALYSIS_NEAR_BITS:
+                nearest[d] = best
+        texts = self.cache.get_many([self._cache_key(c) for _, c in nearest.values()])
+        for d, (distance, c) in nearest.items():
+            if self._cache_key(c) in texts:
+                found[d] = (texts[self._cache_key(c)].decode("utf-8"), distance)
+        return found
+
+    def _store(self, fresh: Dict[str, str]) -> None:
+        entries: Dict[str, bytes] = {}
+        for digest, text in fresh.items():
+            entries[self._cache_key(digest)] = text.encode("utf-8")
+            if ANALYSIS_NEAR_BITS:
+                entries.update({self._band_key(band): digest.encode("ascii") for band in _bands(digest)})
+        self.cache.put_many(entries)
+
+    def analyze(self, requests: Sequence[AnalysisRequest]) -> Dict[str, Dict[str, Any]]:
+        """
+        Return {image_id: {"description", "imageHash", "cached", "distance", "inputBytes", "modelBytes"}}
+        for every request the model (or the cache) could describe. Near-identical images in the
+        cache or in the same burst share a single model call.
+        """
+        with timed("image_analysis", items=len(requests)) as span:
+            digests = {r.image_id: image_hash(r.data) for r in requests}
+            resolved = self._lookup(list(dict.fromkeys(digests.values())))
+
+            # 캐시에 없는 이미지는 (묶음 안에서도 거의 같은 프레임끼리 묶어) 대표 요청 하나만 모델로 보냄
+            pending: Dict[str, AnalysisRequest] = {}
+            representative: Dict[str, str] = {}
+            for r in requests:
+                digest = digests[r.image_id]
+                if digest in resolved or digest in representative:
+                    continue
+                rep = next((p for p in pending if hamming(p, digest) <= ANALYSIS_NEAR_BITS), None)
+                if rep is None:
+                    pending[digest] = r
+                representative[digest] = rep or digest
+
+            prepared: List[Tuple[str, bytes, Dict[str, Any]]] = []
+            pixels: List[int] = []
+            model_bytes: Dict[str, int] = {}
+            with timed("image_prepare", items=len(pending)):
+                for digest, r in pending.items():
+                    jpeg, size = prepare_image(r.data)
+                    prepared.append((digest[:16], jpeg, r.hint))
+                    pixels.append(size[0] * size[1])
+                    model_bytes[digest] = len(jpeg)
+
+            fresh: Dict[str, str] = {}
+            batches = [(prepared[i:i + self.batch_size], sum(pixels[i:i + self.batch_size]))
+                       for i in range(0, len(prepared), self.batch_size)]
+            if batches:
+                short_ids = {digest[:16]: digest for digest in pending}
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                    for descriptions in pool.map(lambda b: self._invoke(*b), batches):
+                        fresh.update({short_ids[k]: v for k, v in descriptions.items() if k in short_ids})
+                self._store(fresh)
+
+            results: Dict[str, Dict[str, Any]] = {}
+            for r in requests:
+                digest = digests[r.image_id]
+                if digest in resolved:
+                    text, distance = resolved[digest]
+                else:
+                    rep = representative[digest]
+                    text, distance = fresh.get(rep), hamming(rep, digest)
+                if text is None:
+                    continue
+                results[r.image_id] = {
+                    "description": text,
+                    "imageHash": digest,
+                    "cached": digest in resolved,
+                    "distance": distance,
+                    "inputBytes": len(r.data),
+                    "modelBytes": model_bytes.get(digest, 0),
+                }
+            span["hits"] = sum(1 for r in requests if digests[r.image_id] in resolved)
+        logging.info("image analysis: %d images, %d cached, %d sent to the model in %d calls",
+                     len(requests), span["hits"], len(pending), len(batches))
+        return results
+
+
+@lru_cache(maxsize=None)
+def get_analyzer() -> ImageAnalyzer:
+    return ImageAnalyzer()
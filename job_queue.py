@@ -0,0 +1,285 @@
+'''
+SQS/EventBridge 를 대신하는 로컬 작업 큐입니다 (SQLite 파일).
+
+- enqueue: 이벤트를 RAG 분석 작업으로 등록 (같은 eventId 의 대기 작업이 있으면 payload 를 최신으로 바꿔 재사용)
+           priority 가 높은 작업(HIGH 이벤트)이 먼저 처리됨
+- enqueue_image: 이미지 업로드(S3:ObjectCreated) 알림을 이미지 분석 작업으로 등록. 워커가 image_handler 를
+           실행한 뒤 analyze 면 (이미지 분석이 반영된 이벤트로) RAG 분석 작업을 등록
+- claim:   PENDING 작업 또는 visibility timeout(lease) 이 지난 RUNNING 작업을 가져감
+           (claim_batch: 지정한 severity 의 작업을 여러 개 한 번에 — 묶음 분석용)
+- set_progress: 중간 결과 기록 + lease 연장(heartbeat). complete / fail 은 작업을 잡고 있는 worker 만 가능
+- fail:    max_attempts 미만이면 백오프 후 재시도, 초과하면 DEAD(DLQ) 로 이동
+- redrive: DLQ 작업을 다시 PENDING 으로 (재처리 잡)
+'''
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Configuration
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "data_source/job_queue/jobs.db")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SEC = float(os.getenv("JOB_LEASE_SEC", "300"))
+RETRY_BACKOFF_SEC = float(os.getenv("JOB_RETRY_BACKOFF_SEC", "5"))
+BUSY_TIMEOUT_SEC = 30
+
+PENDING, RUNNING, DONE, DEAD = "PENDING", "RUNNING", "DONE", "DEAD"
+PRIORITY_NORMAL, PRIORITY_HIGH = 0, 10
+IMAGE_JOB = "image"  # payload["kind"]: 이미지 분석 작업 (없으면 RAG 분석 작업)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id     TEXT,
+    payload      TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_until  REAL,
+    worker       TEXT,
+    error        TEXT,
+    progress     TEXT,
+    priority     INTEGER NOT NULL DEFAULT 0,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_event_id ON jobs (event_id);
+"""
+
+
+# Fucntions
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+
+def image_job_key(event_id: str) -> str:
+    # RAG 작업(event_id = eventId)과 겹치지 않는 이미지 분석 작업 키
+    return f"{event_id}:{IMAGE_JOB}"
+
+
+class JobQueue:
+    def __init__(self, db_path: str = JOB_DB_PATH) -> None:
+        self.db_path = db_path
+        dirname = os.path.dirname(db_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # progress 컬럼이 없던 기존 큐 파일 마이그레이션
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        if "priority" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def enqueue(self, payload: Dict[str, Any], event_id: Optional[str] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS, priority: int = PRIORITY_NORMAL) -> int:
+        event_id = event_id or payload.get("eventId")
+        now = time.time()
+        body = json.dumps(payload, ensure_ascii=False)
+        with self._transaction() as conn:
+            if event_id:
+                row = conn.execute(
+                    "SELECT job_id, status, payload FROM jobs WHERE event_id = ? AND status IN (?, ?) "
+                    "ORDER BY job_id DESC LIMIT 1",
+                    (event_id, PENDING, RUNNING),
+                ).fetchone()
+                if row and row["status"] == PENDING:
+                    # 아직 실행 전: 최신 payload(예: 인시던트 심각도 상승)로 바꿔서 한 번만 분석
+                    conn.execute("UPDATE jobs SET payload = ?, priority = MAX(priority, ?), updated_at = ? "
+                                 "WHERE job_id = ?", (body, priority, now, row["job_id"]))
+                    return row["job_id"]
+                if row and row["payload"] == body:
+                    return row["job_id"]
+                # 실행 중인 작업과 payload 가 다르면 끝난 뒤 다시 분석하도록 새 작업으로 등록
+            cur = conn.execute(
+                "INSERT INTO jobs (event_id, payload, status, max_attempts, priority, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (event_id, body, PENDING, max_attempts, priority, now, now, now),
+            )
+            return cur.lastrowid
+
+    def enqueue_image(self, event_id: str, record: Dict[str, Any], analyze: bool,
+                      priority: int = PRIORITY_NORMAL) -> int:
+        payload = {"kind": IMAGE_JOB, "eventId": event_id, "record": record, "analyze": analyze, "priority": priority}
+        return self.enqueue(payload, event_id=image_job_key(event_id), priority=priority)
+
+    def claim(self, worker: str, lease_sec: float = JOB_LEASE_SEC) -> Optional[Dict[str, Any]]:
+        """우선순위가 가장 높고 가장 오래된 실행 가능 작업을 RUNNING 으로 바꾸고 반환합니다. 없으면 None."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) "
+                "ORDER BY priority DESC, available_at, job_id LIMIT 1",
+                (PENDING, now, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?, "
+                "progress = NULL, updated_at = ? WHERE job_id = ?",
+                (RUNNING, now + lease_sec, worker, now, row["job_id"]),
+            )
+        job = _row_to_job(row)
+        job.update(status=RUNNING, attempts=job["attempts"] + 1, worker=worker, progress=None)
+        return job
+
+    def claim_batch(self, worker: str, limit: int, severities: List[str],
+                    lease_sec: float = JOB_LEASE_SEC) -> List[Dict[str, Any]]:
+        """claim 과 같지만 payload 의 severity 가 severities 중 하나인 작업을 최대 limit 개 가져옵니다."""
+        if limit <= 0 or not severities:
+            return []
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)) "
+                f"AND json_extract(payload, '$.severity') IN ({','.join('?' * len(severities))}) "
+                "ORDER BY available_at, job_id LIMIT ?",
+                (PENDING, now, RUNNING, now, *severities, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?, "
+                "progress = NULL, updated_at = ? WHERE job_id = ?",
+                [(RUNNING, now + lease_sec, worker, now, row["job_id"]) for row in rows],
+            )
+        jobs = [_row_to_job(row) for row in rows]
+        for job in jobs:
+            job.update(status=RUNNING, attempts=job["attempts"] + 1, worker=worker, progress=None)
+        return jobs
+
+    def complete(self, job_id: int, worker: Optional[str] = None) -> bool:
+        """
+        DONE 으로 옮깁니다. worker 를 주면 그 worker 가 아직 잡고 있는(RUNNING) 작업일 때만 바꾸고,
+        lease 가 만료되어 다른 worker 가 다시 가져간 작업이면 건드리지 않고 False 를 반환합니다.
+        """
+        owner, params = self._owner_clause(worker)
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL, error = NULL, updated_at = ? WHERE job_id = ?" + owner,
+                (DONE, time.time(), job_id, *params),
+            )
+        return cur.rowcount > 0
+
+    def set_progress(self, job_id: int, progress: Optional[str], worker: Optional[str] = None,
+                     lease_sec: float = JOB_LEASE_SEC) -> bool:
+        """
+        진행 중 작업의 중간 결과(스트리밍 중인 답변 등)를 기록하고 lease 를 연장합니다(heartbeat).
+        progress 가 None 이면 lease 만 연장합니다. 작업을 잃었으면 False.
+        """
+        owner, params = self._owner_clause(worker)
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET progress = COALESCE(?, progress), lease_until = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = ?" + owner,
+                (progress, now + lease_sec, now, job_id, RUNNING, *params),
+            )
+        return cur.rowcount > 0
+
+    def fail(self, job_id: int, error: str, worker: Optional[str] = None) -> Optional[str]:
+        """
+        재시도 가능하면 PENDING(백오프), 아니면 DEAD 로 옮기고 새 상태를 반환합니다.
+        worker 를 주면 complete 와 같이 소유권을 확인하고, 작업을 잃었으면 None 을 반환합니다.
+        """
+        owner, params = self._owner_clause(worker)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE job_id = ?" + owner,
+                               (job_id, *params)).fetchone()
+            if row is None:
+                if worker is not None:
+                    return None
+                raise KeyError(f"job {job_id} not found")
+            if row["attempts"] >= row["max_attempts"]:
+                status, available_at = DEAD, now
+            else:
+                status, available_at = PENDING, now + RETRY_BACKOFF_SEC * 2 ** (row["attempts"] - 1)
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (status, available_at, error[-2000:], now, job_id),
+            )
+        return status
+
+    @staticmethod
+    def _owner_clause(worker: Optional[str]) -> Tuple[str, Tuple[Any, ...]]:
+        # lease 만료 후 다른 worker 가 다시 가져간 작업을 이전 worker 가 덮어쓰지 않도록
+        if worker is None:
+            return "", ()
+        return " AND worker = ? AND status = ?", (worker, RUNNING)
+
+    def redrive(self, job_id: Optional[int] = None) -> int:
+        """DLQ(DEAD) 작업을 다시 PENDING 으로 돌립니다. job_id 가 없으면 전체."""
+        now = time.time()
+        with self._transaction() as conn:
+            if job_id is None:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? WHERE status = ?",
+                    (PENDING, now, now, DEAD),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? "
+                    "WHERE status = ? AND job_id = ?",
+                    (PENDING, now, now, DEAD, job_id),
+                )
+        return cur.rowcount
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def latest_for_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM jobs WHERE event_id = ? ORDER BY job_id DESC LIMIT 1", (event_id,)
+        ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def recent(self, limit: int = 20, statuses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        sql, params = "SELECT * FROM jobs", []
+        if statuses:
+            sql += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += " ORDER BY job_id DESC LIMIT ?"
+        params.append(limit)
+        return [_row_to_job(r) for r in self._conn().execute(sql, params).fetchall()]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+
+@lru_cache(maxsize=None)
+def get_queue(db_path: str = JOB_DB_PATH) -> JobQueue:
+    return JobQueue(db_path)
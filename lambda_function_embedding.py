@@ -1,18 +1,26 @@
+import hashlib
 import json
 import logging
 import os
 import pathlib
-import uuid
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List
-
-import boto3
-from botocore.config import Config
-from langchain_aws.embeddings import BedrockEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader
-from langchain_chroma import Chroma
+from functools import lru_cache
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
 from dotenv import load_dotenv 
+from doc_tags import TAG_VERSION, DocumentTagger
+from provider_config import use_local_provider
+from metrics import timed
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from faiss_store import FaissVectorStore
+    from retrieval_service import RemoteVectorStore
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,7 +31,10 @@ def getenv(key: str, default: str) -> str:
 
 os.environ['AWS_BEARER_TOKEN_BEDROCK'] = getenv('BEDROCK_API_KEY', '')
 
-VECTOR_DIR = getenv("VECTOR_DIR", "./data_source/opensearch_vector_store")
+LOCAL_PROVIDER = use_local_provider()  # BEDROCK_PROVIDER=local 이면 AWS 없이 해시 임베딩 사용 (local_providers.py)
+VECTOR_DIR = getenv("VECTOR_DIR", "./data_source/local_vector_store" if LOCAL_PROVIDER else "./data_source/opensearch_vector_store")
+VECTOR_BACKEND = getenv("VECTOR_BACKEND", "chroma").lower()  # chroma | faiss (faiss_store.py, <VECTOR_DIR>/faiss)
+RETRIEVAL_SERVICE_URL = getenv("RETRIEVAL_SERVICE_URL", "")  # 설정하면 공유 검색 서비스가 단일 writer (retrieval_service.py)
 PDF_DIR = getenv("PDF_DIR", "./data_source/s3_work_instruction_pdf")
 COLLECTION_NAME = getenv("COLLECTION_NAME", "work_instructions")
 MODEL_ID = getenv("MODEL_ID", "amazon.titan-embed-text-v2:0")
@@ -31,97 +42,387 @@ AWS_REGION = getenv("AWS_REGION", "ap-northeast-2")
 PROFILE_NAME = getenv("PROFILE_NAME", "default")  
 CHUNK_SIZE = int(getenv("CHUNK_SIZE", "1500"))
 CHUNK_OVERLAP = int(getenv("CHUNK_OVERLAP", "200"))
+MANIFEST_NAME = "ingest_manifest.json"
+INGEST_WORKERS = int(getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))  # PDF 파싱 프로세스 수
+PAGES_PER_TASK = int(getenv("PAGES_PER_TASK", "16"))       # 파싱 작업 하나가 맡는 페이지 수
+STREAM_BATCH_SIZE = int(getenv("STREAM_BATCH_SIZE", "64"))  # 임베딩/upsert 배치 크기
 
 
 # AWS clients / Embedding model
-_session = (
-    boto3.Session(profile_name=PROFILE_NAME, region_name=AWS_REGION)
-    if PROFILE_NAME
-    else boto3.Session(region_name=AWS_REGION)
-)
+# boto3, langchain_aws, langchain_chroma, 텍스트 분할기, pymupdf 는 실제로 쓰일 때 import/생성 (콜드 스타트 단축)
+@lru_cache(maxsize=None)
+def get_bedrock_client():
+    import boto3
+    from botocore.config import Config
+
+    session = (
+        boto3.Session(profile_name=PROFILE_NAME, region_name=AWS_REGION)
+        if PROFILE_NAME
+        else boto3.Session(region_name=AWS_REGION)
+    )
+    return session.client(
+        "bedrock-runtime",
+        config=Config(region_name=AWS_REGION, retries={"max_attempts": 3})
+    )
 
-_bedrock_client = _session.client(
-    "bedrock-runtime",
-    config=Config(region_name=AWS_REGION, retries={"max_attempts": 3})
-)
+@lru_cache(maxsize=None)
+def get_embedder():
+    from disk_cache import CachedEmbeddings
+    from embedding_executor import ConcurrentEmbeddings
 
-EMBEDDER = BedrockEmbeddings(model_id=MODEL_ID, client=_bedrock_client)
+    if LOCAL_PROVIDER:
+        from local_providers import HashEmbeddings
+        base_embedder = HashEmbeddings()
+    else:
+        from langchain_aws.embeddings import BedrockEmbeddings
+        base_embedder = BedrockEmbeddings(model_id=MODEL_ID, client=get_bedrock_client())
+
+    # (모델 ID, 텍스트 해시) 기준 디스크 캐시를 거쳐 변경된 텍스트만 Bedrock 으로 전송 (적응형 동시 호출)
+    return CachedEmbeddings(
+        ConcurrentEmbeddings(base_embedder),
+        model_id=("local:" if LOCAL_PROVIDER else "") + MODEL_ID,
+    )
 
 
 # Fucntions
 def load_documents_from_directory(directory: str) -> List[dict]:
+    from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader
     loader = DirectoryLoader(directory, glob="**/*.pdf", loader_cls=PyMuPDFLoader, show_progress=True)
     docs = loader.load()
     logging.info("Loaded %d PDF documents from %s", len(docs), directory)
     return docs
 
 def load_documents_from_file(file_path: str) -> List[dict]:
+    from langchain_community.document_loaders import PyMuPDFLoader
     loader = PyMuPDFLoader(file_path)
     docs = loader.load()
     logging.info("Loaded %d PDF documents from %s", len(docs), file_path)
     return docs
 
-def split_documents(documents: List[dict]) -> List[dict]:
-    splitter = RecursiveCharacterTextSplitter(
+@lru_cache(maxsize=None)
+def _splitter() -> "RecursiveCharacterTextSplitter":
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
         separators=["\n## ", "\n### ", "\n- ", "\n", " "],
     )
-    chunks = splitter.split_documents(documents)
+
+def split_documents(documents: List[dict]) -> List[dict]:
+    chunks = _splitter().split_documents(documents)
+    tagger = DocumentTagger()
+    for chunk in chunks:
+        chunk.metadata.update(tagger.tag(chunk.metadata.get("source", ""), chunk.page_content))
     logging.info("Split into %d chunks", len(chunks))
     return chunks
 
 
-def upsert_chunks(chunks: List[dict], vector_dir: str = VECTOR_DIR) -> int:
-    """Add *chunks* to Chroma collection (creates collection on first run)."""
+@lru_cache(maxsize=None)
+def get_vectorstore(vector_dir: str = VECTOR_DIR) -> Union["Chroma", "FaissVectorStore", "RemoteVectorStore"]:
+    """Open (or create) the persistent Chroma collection / FAISS index; reused across warm invocations."""
+    if RETRIEVAL_SERVICE_URL:
+        from retrieval_service import RemoteVectorStore
+        return RemoteVectorStore(RETRIEVAL_SERVICE_URL, get_embedder())
     vec_path = pathlib.Path(vector_dir)
     vec_path.mkdir(parents=True, exist_ok=True)
-
-    # Create or load collection
-    vectorstore = Chroma(
+    if VECTOR_BACKEND == "faiss":
+        from faiss_store import FaissVectorStore
+        return FaissVectorStore(str(vec_path / "faiss"), get_embedder())
+    from langchain_chroma import Chroma
+    return Chroma(
         persist_directory=str(vec_path),
-        embedding_function=EMBEDDER,
+        embedding_function=get_embedder(),
         collection_name=COLLECTION_NAME,
     )
 
-    existing = vectorstore.get()["ids"]
-    logging.info("Collection '%s' currently holds %d vectors", COLLECTION_NAME, len(existing))
+def collection_count(vectorstore: "Chroma") -> int:
+    # count() 는 메타데이터/벡터를 읽지 않음 (get() 은 컬렉션 전체를 메모리로 가져옴)
+    return getattr(vectorstore, "_collection", vectorstore).count()
 
-    if existing:
-        vectorstore.add_documents(chunks)
-    else:
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=EMBEDDER,
-            persist_directory=str(vec_path),
-            collection_name=COLLECTION_NAME,
-        )
-
-    # vectorstore.persist()
-    total = len(vectorstore.get()["ids"])
-    logging.info("Persisted collection now holds %d vectors", total)
+def commit(vectorstore: "Chroma", manifest: dict) -> None:
+    # Chroma 는 add/delete 때 이미 기록됨. FAISS / 검색 서비스는 수집이 끝난 뒤 새 세대를 한 번에 기록한 다음 manifest 저장
+    if VECTOR_BACKEND == "faiss" or RETRIEVAL_SERVICE_URL:
+        vectorstore.persist()
+    save_manifest(manifest)
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(file_hash: str, ordinal: int) -> str:
+    # 내용 해시 + 청크 순번: 같은 파일을 다시 넣어도 같은 ID 로 덮어씀
+    return f"{file_hash[:16]}-{ordinal:05d}"
+
+def chunk_ids(file_hash: str, count: int) -> List[str]:
+    return [chunk_id(file_hash, i) for i in range(count)]
+
+
+# Streaming PDF parsing (process pool)
+PdfSource = Union[str, bytes]  # 파일 경로 또는 업로드된 PDF 바이트
+
+def _open_pdf(source: PdfSource):
+    import pymupdf
+    return pymupdf.open(stream=source, filetype="pdf") if isinstance(source, bytes) else pymupdf.open(source)
+
+def _page_ranges(source: PdfSource) -> List[Tuple[int, int]]:
+    with _open_pdf(source) as pdf:
+        total = pdf.page_count
+    return [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+
+def _parse_pdf_pages(source: PdfSource, source_path: str, start: int, stop: int) -> List[Document]:
+    """Worker: extract pages [start, stop) as Documents (PyMuPDFLoader 와 같은 메타데이터)."""
+    with _open_pdf(source) as pdf:
+        meta = {k: v for k, v in (pdf.metadata or {}).items() if isinstance(v, (str, int, float)) and v}
+        return [
+            Document(
+                page_content=pdf[i].get_text(),
+                metadata={**meta, "source": source_path, "file_path": source_path,
+                          "page": i, "total_pages": pdf.page_count},
+            )
+            for i in range(start, stop)
+        ]
+
+def _ordered_map(executor: Optional[Executor], fn: Callable, tasks: Iterable[tuple],
+                 window: int) -> Iterator[Any]:
+    """Apply *fn* to *tasks* with at most *window* in flight, yielding results in task order."""
+    if executor is None:
+        for task in tasks:
+            yield fn(*task)
+        return
+    pending: Deque[Future] = deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_chunks(sources: List[Tuple[str, PdfSource]],
+                executor: Optional[Executor] = None) -> Iterator[Tuple[str, Document]]:
+    """
+    Stream (name, chunk) for each PDF in *sources*, in file and page order.
+    페이지 묶음 단위로 파싱하므로 메모리에는 window 만큼의 페이지만 올라갑니다.
+    """
+    tasks = (
+        (name, src, os.path.join(PDF_DIR, name), start, stop)
+        for name, src in sources
+        for start, stop in _page_ranges(src)
+    )
+    splitter = _splitter()
+    tagger = DocumentTagger()  # eventType/roiId/원본 문서 메타데이터 (검색 시 사전 필터)
+    window = 2 * INGEST_WORKERS
+    for name, pages in _ordered_map(executor, _parse_named, tasks, window):
+        for chunk in splitter.split_documents(pages):
+            chunk.metadata.update(tagger.tag(name, chunk.page_content))
+            yield name, chunk
+
+def _parse_named(name: str, source: PdfSource, source_path: str,
+                 start: int, stop: int) -> Tuple[str, List[Document]]:
+    return name, _parse_pdf_pages(source, source_path, start, stop)
+
+def _timed_batches(iterable: Iterable[Any], size: int, stage: str) -> Iterator[List[Any]]:
+    # 배치를 기다린 시간 = 파싱(+분할) 시간. 임베딩/upsert 시간은 포함하지 않음
+    it = iter(iterable)
+    while True:
+        with timed(stage) as span:
+            batch = list(islice(it, size))
+            span["items"] = len(batch)
+        if not batch:
+            return
+        yield batch
+
+@contextmanager
+def ingest_executor(workers: int = INGEST_WORKERS) -> Iterator[Optional[Executor]]:
+    """Process pool for PDF parsing; falls back to in-process parsing where pools are unavailable (e.g. Lambda)."""
+    if workers <= 1:
+        yield None
+        return
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    except (OSError, NotImplementedError):
+        logging.warning("Process pool unavailable, parsing PDFs in-process")
+        yield None
+        return
+    with executor:
+        yield executor
+
+
+# Ingestion manifest: {"files": {file_name: {"sha256": ..., "chunkIds": [...], "tagVersion": ...}}}
+def manifest_path(vector_dir: str = VECTOR_DIR) -> pathlib.Path:
+    return pathlib.Path(vector_dir) / MANIFEST_NAME
+
+def load_manifest(vector_dir: str = VECTOR_DIR) -> dict:
+    path = manifest_path(vector_dir)
+    if not path.exists():
+        return {"files": {}}
+    with path.open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+def save_manifest(manifest: dict, vector_dir: str = VECTOR_DIR) -> None:
+    path = manifest_path(vector_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest["updatedAt"] = datetime.utcnow().isoformat() + "Z"
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)  # 원자적 교체
+
+def _unreferenced(ids: List[str], manifest: dict, exclude: str) -> List[str]:
+    # 내용이 같은 다른 파일이 같은 청크 ID 를 쓰고 있으면 지우지 않음
+    in_use = {
+        cid
+        for name, entry in manifest["files"].items() if name != exclude
+        for cid in entry["chunkIds"]
+    }
+    return [cid for cid in ids if cid not in in_use]
+
+
+def upsert_chunks(chunks: List[dict], ids: List[str], vectorstore: "Chroma") -> int:
+    """Write *chunks* under deterministic *ids* (existing ids are overwritten, not duplicated)."""
+    if chunks:
+        with timed("ingest_upsert", items=len(chunks)):  # 임베딩 + Chroma 기록
+            vectorstore.add_documents(chunks, ids=ids)
+    total = collection_count(vectorstore)
+    logging.info("Collection '%s' now holds %d vectors", COLLECTION_NAME, total)
     return total
 
+def ingest_files(sources: List[Tuple[str, PdfSource]], vectorstore: "Chroma", manifest: dict,
+                 executor: Optional[Executor] = None) -> List[dict]:
+    """
+    Index PDFs given as (name, path or bytes). Unchanged files are skipped, changed files replace
+    only their own chunks. Changed files are parsed in *executor* and embedded/upserted in
+    STREAM_BATCH_SIZE batches as chunks come out of the splitter.
+    """
+    with timed("ingest_total") as span:
+        results = _ingest_files(sources, vectorstore, manifest, executor)
+        span["items"] = sum(r["indexedChunks"] for r in results)
+    return results
 
-# Lambda handler
-def lambda_handler(event, context):
-    logging.info("Event received: %s", json.dumps(event))
+def _ingest_files(sources: List[Tuple[str, PdfSource]], vectorstore: "Chroma", manifest: dict,
+                  executor: Optional[Executor]) -> List[dict]:
+    results: Dict[str, dict] = {}
+    hashes: Dict[str, str] = {}
+    to_parse: List[Tuple[str, PdfSource]] = []
+    aliases: Dict[str, str] = {}  # 같은 실행에서 내용이 같은 파일 → 먼저 파싱되는 파일 이름
 
-    file_name = event.get("file_name")
-    if '.pdf' in file_name:
-        local_pdf_path = f"./{PDF_DIR}/{file_name}"
-        documents = load_documents_from_file(local_pdf_path)
-    else:
-        documents = load_documents_from_directory(PDF_DIR)
-    chunks = split_documents(documents)
-    total_vectors = upsert_chunks(chunks)
+    for name, src in sources:
+        with timed("ingest_hash", items=1):
+            file_hash = hashlib.sha256(src).hexdigest() if isinstance(src, bytes) else file_sha256(src)
+        hashes[name] = file_hash
+        previous = manifest["files"].get(name)
+        # 태깅 규칙이 바뀐 파일은 내용이 같아도 다시 색인 (임베딩은 캐시에서 재사용)
+        if previous and previous["sha256"] == file_hash and previous.get("tagVersion") == TAG_VERSION:
+            logging.info("Unchanged, skipping: %s", name)
+            results[name] = {"file": name, "indexedChunks": 0, "deletedChunks": 0, "skipped": True}
+            continue
+
+        # 동일한 내용이 이미 다른 이름으로 색인됨 → 임베딩 없이 manifest 만 기록
+        same_content = next((e for e in manifest["files"].values()
+                             if e["sha256"] == file_hash and e.get("tagVersion") == TAG_VERSION), None)
+        first = next((n for n, _ in to_parse if hashes[n] == file_hash), None)
+        if same_content:
+            results[name] = {"file": name, "chunkIds": list(same_content["chunkIds"]), "indexedChunks": 0}
+        elif first:
+            aliases[name] = first
+        else:
+            to_parse.append((name, src))
+            results[name] = {"file": name, "chunkIds": [], "indexedChunks": 0}
+
+    for batch in _timed_batches(iter_chunks(to_parse, executor), STREAM_BATCH_SIZE, "ingest_parse"):
+        ids = []
+        for name, _ in batch:
+            entry = results[name]
+            ids.append(chunk_id(hashes[name], len(entry["chunkIds"])))
+            entry["chunkIds"].append(ids[-1])
+            entry["indexedChunks"] += 1
+        upsert_chunks([chunk for _, chunk in batch], ids, vectorstore)
+
+    for name, first in aliases.items():
+        results[name] = {"file": name, "chunkIds": list(results[first]["chunkIds"]), "indexedChunks": 0}
+
+    for name, _ in sources:
+        entry = results[name]
+        if entry.get("skipped"):
+            continue
+        ids = entry.pop("chunkIds")
+        previous = manifest["files"].get(name)
+        keep = set(ids)
+        stale = _unreferenced(previous["chunkIds"], manifest, exclude=name) if previous else []
+        stale = [cid for cid in stale if cid not in keep]
+        if stale:
+            with timed("ingest_delete", items=len(stale)):
+                vectorstore.delete(ids=stale)
+        manifest["files"][name] = {"sha256": hashes[name], "chunkIds": ids, "tagVersion": TAG_VERSION}
+        entry.update({"deletedChunks": len(stale), "skipped": False})
 
+    return [results[name] for name, _ in sources]
+
+def ingest_file(file_path: str, vectorstore: "Chroma", manifest: dict,
+                executor: Optional[Executor] = None) -> dict:
+    """Index one PDF; unchanged files are skipped and changed files replace only their own chunks."""
+    name = os.path.relpath(file_path, PDF_DIR)
+    return ingest_files([(name, file_path)], vectorstore, manifest, executor)[0]
+
+def remove_file(name: str, vectorstore: "Chroma", manifest: dict) -> int:
+    entry = manifest["files"].get(name)
+    if entry is None:
+        return 0
+    stale = _unreferenced(entry["chunkIds"], manifest, exclude=name)
+    if stale:
+        vectorstore.delete(ids=stale)
+    del manifest["files"][name]
+    logging.info("Removed %s (%d chunks)", name, len(stale))
+    return len(stale)
+
+def sync_directory(directory: str, vectorstore: "Chroma", manifest: dict,
+                   executor: Optional[Executor] = None) -> List[dict]:
+    """Bring the collection in line with *directory*: add/replace changed PDFs, drop removed ones."""
+    paths = sorted(str(p) for p in pathlib.Path(directory).glob("**/*.pdf"))
+    sources = [(os.path.relpath(p, PDF_DIR), p) for p in paths]
+    results = ingest_files(sources, vectorstore, manifest, executor)
+
+    present = {name for name, _ in sources}
+    for name in [n for n in manifest["files"] if n not in present]:
+        results.append({"file": name, "indexedChunks": 0,
+                        "deletedChunks": remove_file(name, vectorstore, manifest), "skipped": False})
+    return results
+
+def _response(results: List[dict], vectorstore: "Chroma") -> dict:
     body = {
-        "indexedChunks": len(chunks),
-        "totalVectors": total_vectors,
+        "indexedChunks": sum(r["indexedChunks"] for r in results),
+        "deletedChunks": sum(r["deletedChunks"] for r in results),
+        "skippedFiles": sum(1 for r in results if r["skipped"]),
+        "totalVectors": collection_count(vectorstore),
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "collection": COLLECTION_NAME,
     }
-
     return {"statusCode": 200, "body": json.dumps(body)}
 
+def ingest_upload(file_name: str, data: bytes) -> dict:
+    """Index an uploaded PDF straight from memory (대시보드 업로드용, 디스크에서 다시 읽지 않음)."""
+    vectorstore = get_vectorstore()
+    manifest = load_manifest()
+    results = ingest_files([(file_name, data)], vectorstore, manifest)
+    commit(vectorstore, manifest)
+    return _response(results, vectorstore)
+
+
+# Lambda handler
+def lambda_handler(event, context):
+    logging.info("Event received: %s", json.dumps(event))
+
+    vectorstore = get_vectorstore()
+    manifest = load_manifest()
+
+    file_name = event.get("file_name") or ""
+    with ingest_executor() as executor:
+        if '.pdf' in file_name:
+            results = [ingest_file(os.path.join(PDF_DIR, file_name), vectorstore, manifest, executor)]
+        else:
+            results = sync_directory(PDF_DIR, vectorstore, manifest, executor)
+    commit(vectorstore, manifest)
+
+    return _response(results, vectorstore)
@@ -51,11 +51,15 @@ Lambda를 통해 AI 카메라 디바이스가 MQTT로 보낸 이벤트를 받아
 | `eventType` | string | `DANGER_ZONE_INTRUSION` | 이벤트 유형 |
 | `severity` | string | `HIGH` | 심각도 |
 | `message` | string | `작업자 A가 탱크구역 A 폴리곤 내부 진입` | 자유 텍스트 설명(이미지분석) |
+| `deviceMessage` | string | `작업자 A가 탱크구역 A 폴리곤 내부 진입` | 이미지 분석 전 카메라가 보낸 원래 message |
+| `imageAnalysis` | map | `{ "imageHash":"9c3e...", "cached":false, "modelBytes":151234 }` | 이미지 분석 메타(image_analysis.py) |
 | `roiId` | string | `TANK-AREA-A` | 지오펜스/구역 ID |
 | `model` | map | `{ "name":"yolov8n", "ver":"1.3.2", "conf":0.82 }` | 추론 모델 메타 |
 | `image.required` | bool | `true` | 이미지 필요 여부 |
 | `image.s3Key` | string | `OCTANK-1/3F-07/2025/07/27/542991.jpg` | 사전 결정 S3 키 |
-| `thumbKey` | string | `.../542991_thumb.jpg` | 썸네일 S3 키(선택) |
+| `imageS3Key` | string | `OCTANK-1/3F-07/2025/07/27/542991.jpg` | 업로드된 원본 이미지 키 (`imageS3Bucket` 버킷) |
+| `thumbKey` | string | `3f/3fa1...c9.webp` | 썸네일 키(선택, 원본 내용 해시 기반 — thumbnails.py) |
+| `incident` | map | `{ "count":14, "firstTs":"...", "lastTs":"...", "maxSeverity":"HIGH", "eventIds":[...] }` | 합쳐진 버스트 요약 |
 | `status` | string | `PENDING_IMAGE → IMAGE_ATTACHED` | 상태 머신 |
 | `createdAt` | string | `2025-07-27T08:15:23.900Z` | 레코드 생성 시각 |
 
@@ -63,42 +67,49 @@ Lambda를 통해 AI 카메라 디바이스가 MQTT로 보낸 이벤트를 받아
 - 입력: IoT Rule 이벤트(JSON)
 - 동작:
     - PutItem(조건: attribute_not_exists(eventId))로 멱등 선기록
+    - 같은 (pk, eventType, roiId) 이벤트가 INCIDENT_WINDOW_SEC 안에 이어지면 새 항목 대신 기존 인시던트의
+      count / firstTs·lastTs / maxSeverity 만 갱신 (RAG 분석은 인시던트 생성·심각도 상승 때만)
     - S3 Presigned PUT URL 생성
     - 디바이스 응답 토픽에 URL 발송
 - 출력: { eventId, s3Key, url, expireSec }
 
-- 트리거: S3:ObjectCreated:*
+- 트리거: S3:ObjectCreated:* (image_handler, 로컬에서는 object_store.py 가 S3, 작업 큐 + worker.py 가 알림 전달 역할)
 - 동작:
-    - UpdateItem으로 status=IMAGE_ATTACHED, imageS3Key 갱신
+    - 썸네일 생성(WebP/JPEG, 같은 이미지는 재인코딩 없이 캐시 사용)
+    - 이미지 분석: 모델 입력 크기로 줄여 JPEG 재인코딩, 이미지 해시로 결과 캐시(같은 프레임은 재추론 없음),
+      한 번에 들어온 이미지들은 묶어서 호출 → message 갱신
+    - UpdateItem으로 status=IMAGE_ATTACHED, imageS3Key, thumbKey, message 갱신
     - 실패 시: DLQ(SQS) 로 이동, 재처리 잡 제공
 '''
 
 import json
+import logging
 import os
 import random
 import uuid
 from datetime import datetime, timedelta, timezone
-from pathlib import Path
-from typing import Any, Dict, List, TypedDict
+from typing import Any, Dict, List, Tuple, TypedDict
+from urllib.parse import unquote_plus
+
+from event_constants import EVENT_TYPES, ROI_IDS, SEVERITIES
+from event_store import get_store
 
 # Configuration
 BUCKET_NAME = os.getenv("BUCKET_NAME", "SAMPLE")
-DUMMY_DB_PATH = Path("data_source/dynamodb_anomaly_data/dummy_safety_events_2025.json")
 PRESIGNED_EXP_SEC = 300
+IMAGE_DIR = os.getenv("IMAGE_DIR", "data_source/s3_anomaly_images")  # 유형별 예시 이미지 (카메라 흉내)
+IMAGE_ANALYSIS = os.getenv("IMAGE_ANALYSIS", "on").lower() != "off"  # off 면 썸네일만 붙이고 message 유지
+INCIDENT_WINDOW_SEC = float(os.getenv("INCIDENT_WINDOW_SEC", "60"))  # 같은 카메라/유형/구역 이벤트를 합치는 간격 (0: 끄기)
 
 DEVICE_IDS = [
     "1F-01", "1F-03", "1F-06", "2F-02", "2F-04", "2F-07",
     "3F-03", "3F-05", "3F-07", "3F-11", "4F-07", "4F-12",
     "5F-01", "5F-08",
 ]
-EVENT_TYPES = [
-    "DANGER_ZONE_INTRUSION", "VEHICLE_ENTERED",
-    "UNAUTHORIZED_ACCESS", "FIRE_ALERT", "NO_ENTRY_VIOLATION",
-]
-SEVERITIES = ["LOW", "MEDIUM", "HIGH"]
+REQUIRED_FIELDS = ["siteId", "deviceId", "eventType", "severity", "message", "roiId", "model"]
+FIELD_TYPES = {"siteId": str, "deviceId": str, "eventId": str, "ts": str, "eventType": str,
+               "severity": str, "message": str, "roiId": str, "model": dict}  # imageRequired 는 bool() 로 변환
 MODEL_INFO = {"name": "yolov8n", "ver": "1.3.2", "conf": 0.82}
-ROI_IDS = ["TANK-AREA-A", "TANK-AREA-B", "FUEL-STORAGE-AREA",
-           "SECURITY-CHECK-POINT", "LOADING-BAY"]
 WORKERS = ["A", "B", "C", "D"]
 VEHICLES = ["Truck", "Forklift", "Van"]
 LOCATIONS = ["Tank Area A", "Fuel Storage Area", "Loading Bay",
@@ -122,6 +133,12 @@ class EventItem(TypedDict, total=False):
     roiId: str
     model: Dict[str, Any]
     image: ImageInfo
+    incident: Dict[str, Any]
+    imageS3Bucket: str
+    imageS3Key: str
+    thumbKey: str
+    deviceMessage: str
+    imageAnalysis: Dict[str, Any]
     status: str
     createdAt: str
 
@@ -134,25 +151,10 @@ def random_timestamp(start: datetime, end: datetime) -> str:
     rand_sec = random.randint(0, int(delta.total_seconds()))
     return (start + timedelta(seconds=rand_sec)).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def ensure_db_path(path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-
-def load_db(path: Path) -> List[EventItem]:
-    if not path.exists():
-        return []
-    try:
-        with path.open(encoding="utf-8") as fp:
-            data = json.load(fp)
-            return data if isinstance(data, list) else []
-    except json.JSONDecodeError:
-        return []
-
-def save_db(path: Path, items: List[EventItem]) -> None:
-    with path.open("w", encoding="utf-8") as fp:
-        json.dump(items, fp, ensure_ascii=False, indent=2)
-
-def build_s3_key(event_type: str) -> str:
-    return f"data_source/anomaly_images_s3/{event_type}.png"
+def build_s3_key(site_id: str, device_id: str, ts: str, event_id: str) -> str:
+    # raw: {siteId}/{deviceId}/{YYYY}/{MM}/{DD}/{eventId}.jpg
+    yyyy, mm, dd = ts[:10].split("-")
+    return f"{site_id}/{device_id}/{yyyy}/{mm}/{dd}/{event_id}.jpg"
 
 def generate_message(event_type: str, roi_id: str, worker: str,
                      vehicle: str, location: str) -> str:
@@ -165,33 +167,31 @@ def generate_message(event_type: str, roi_id: str, worker: str,
     }
     return templates[event_type]
 
-def append_to_dummy_db(item: EventItem) -> None:
-    ensure_db_path(DUMMY_DB_PATH)
-    items = load_db(DUMMY_DB_PATH)
-
-    if any(d.get("eventId") == item["eventId"] for d in items):  # dedupe
-        return
-
-    items.append(item)
-    save_db(DUMMY_DB_PATH, items)
-
-# Lambda handler
-def lambda_handler(event: Dict[str, Any] | str,
-                   context: Any = None) -> Dict[str, Any]:
-
-    if isinstance(event, str):
-        event = json.loads(event)
-
+def append_to_dummy_db(item: EventItem) -> bool:
+    # PutItem(조건: attribute_not_exists(eventId)) — 이미 있으면 False
+    return get_store().put_item(item)
+
+def ingest_items(items: List[EventItem]) -> List[Tuple[str, EventItem]]:
+    """
+    Store a batch of events, folding bursts of the same (pk, eventType, roiId) within
+    INCIDENT_WINDOW_SEC into one incident. Returns (action, incident item) per event; only
+    "created" and "escalated" incidents need a (new) RAG analysis.
+    """
+    if INCIDENT_WINDOW_SEC <= 0:
+        written = get_store().put_items(items)
+        return [("created" if fresh else "duplicate", item) for fresh, item in zip(written, items)]
+    return get_store().put_coalesced(items, INCIDENT_WINDOW_SEC)
+
+def build_item(event: Dict[str, Any]) -> EventItem:
     site_id    = event["siteId"]
     device_id  = event["deviceId"]
     event_id   = event.get("eventId", str(uuid.uuid4()))
     ts         = event.get("ts", now_iso())
     event_type = event["eventType"]
-
-    s3_key     = build_s3_key(event_type)
+    parse_ts(ts)  # 잘못된 ts 는 기록(트랜잭션) 전에 이 레코드만 실패시킴
 
     # Build DynamoDB item (metadata) 
-    item: EventItem = {
+    return {
         "pk": f"SITE#{site_id}#CAM#{device_id}",
         "sk": f"EVT#{ts}#ID#{event_id}",
         "eventId":   event_id,
@@ -205,15 +205,13 @@ def lambda_handler(event: Dict[str, Any] | str,
         "model":     event["model"],
         "image": {
             "required": bool(event.get("imageRequired", True)),
-            "s3Key": s3_key,
+            "s3Key": build_s3_key(site_id, device_id, ts, event_id),
         },
         "status":    "ACTIVATE",
         "createdAt": now_iso(),
     }
 
-    # Actual implementation would call boto3 DynamoDB here
-    append_to_dummy_db(item)
-
+def build_presigned_response(item: EventItem) -> Dict[str, Any]:
     # Generate (mock) presigned URL
     presigned_url = (
         "https://{bucket}.s3.amazonaws.com/example-image.jpg"
@@ -221,20 +219,225 @@ def lambda_handler(event: Dict[str, Any] | str,
         "&Signature=eb84dde12739d5e86aedea70a143ddde685d7300e76029e49909ce51faeebd70"
     ).format(bucket=BUCKET_NAME)
 
+    return {
+        "eventId":   item["eventId"],
+        "s3Bucket":  BUCKET_NAME,
+        "s3Key":     item["image"]["s3Key"],
+        "url":       presigned_url,
+        "item":      item,
+        "headers":   {"Content-Type": "image/jpeg"},
+        "expireSec": PRESIGNED_EXP_SEC,
+    }
+
+def build_ingest_response(item: EventItem, action: str, incident: EventItem) -> Dict[str, Any]:
+    if incident["eventId"] == item["eventId"]:
+        response = build_presigned_response(incident)
+    else:
+        # 기존 인시던트에 합쳐진 이벤트: 이미지 업로드(presigned URL) 없이 인시던트만 알려줌
+        response = {"eventId": item["eventId"], "coalescedInto": incident["eventId"], "item": incident, "url": None}
+    response.update(action=action, analyze=action in ("created", "escalated"))
+    return response
+
+def parse_ts(ts: str) -> datetime:
+    """ISO-8601 시각 파싱 (끝의 Z 는 UTC). 형식이 틀리면 ValueError."""
+    if not isinstance(ts, str):
+        raise ValueError(f"invalid ts: {ts!r}")
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"invalid ts: {ts!r}") from None
+
+def validate_event(event: Dict[str, Any]) -> List[str]:
+    """Return validation errors for one IoT event (empty list if valid)."""
+    if not isinstance(event, dict):
+        return [f"event must be a JSON object, got {type(event).__name__}"]
+    # 존재 여부와 타입을 따로 검사: model: {} 같은 빈 값은 유효
+    errors = [f"missing field: {f}" for f in REQUIRED_FIELDS if event.get(f) is None]
+    for f, expected in FIELD_TYPES.items():
+        if event.get(f) is not None and not isinstance(event[f], expected):
+            errors.append(f"invalid type for {f}: {type(event[f]).__name__}")
+    if isinstance(event.get("severity"), str) and event["severity"] not in SEVERITIES:
+        errors.append(f"invalid severity: {event['severity']}")
+    if isinstance(event.get("eventType"), str) and event["eventType"] not in EVENT_TYPES:
+        errors.append(f"invalid eventType: {event['eventType']}")
+    if event.get("ts") is not None:
+        try:
+            parse_ts(event["ts"])
+        except ValueError as exc:
+            errors.append(str(exc))
+    return errors
+
+# Lambda handler
+def lambda_handler(event: Dict[str, Any] | str,
+                   context: Any = None) -> Dict[str, Any]:
+
+    if isinstance(event, str):
+        event = json.loads(event)
+
+    errors = validate_event(event)
+    if errors:
+        event_id = event.get("eventId") if isinstance(event, dict) else None
+        return {"statusCode": 400, "content": {"eventId": event_id, "errors": errors}}
+    item = build_item(event)
+
+    # Actual implementation would call boto3 DynamoDB here
+    action, incident = ingest_items([item])[0]
+
     return {
         "statusCode": 200,
+        "content": build_ingest_response(item, action, incident),
+    }
+
+def batch_handler(event: Dict[str, Any] | List[Dict[str, Any]],
+                  context: Any = None) -> Dict[str, Any]:
+    """
+    Batch entry point (SQS / IoT Rule batch). Accepts {"Records": [{"messageId", "body"}, ...]}
+    or a plain list of events. Validates the whole batch, dedupes and coalesces bursts into
+    incidents in one transaction (one write per incident), lists the incidents that need RAG
+    analysis (`analyze`) and returns SQS partial batch failures (`batchItemFailures`) for
+    records that could not be processed.
+    """
+    if isinstance(event, list):
+        records = [{"messageId": str(i), "body": e} for i, e in enumerate(event)]
+    else:
+        records = event.get("Records", [])
+
+    failures: List[Dict[str, str]] = []
+    items: List[EventItem] = []
+    item_records: List[str] = []
+    for i, record in enumerate(records):
+        message_id = record.get("messageId", str(i)) if isinstance(record, dict) else str(i)
+        try:
+            body = record["body"]
+            payload = json.loads(body) if isinstance(body, str) else body
+            # "[1,2]" / "null" / "123" 처럼 JSON 이지만 객체가 아닌 본문은 이 레코드만 실패
+            if not isinstance(payload, dict):
+                raise ValueError(f"event must be a JSON object, got {type(payload).__name__}")
+            errors = validate_event(payload)
+            if errors:
+                raise ValueError("; ".join(errors))
+            items.append(build_item(payload))
+            item_records.append(message_id)
+        except (KeyError, TypeError, ValueError) as exc:
+            failures.append({"itemIdentifier": message_id, "reason": str(exc)})
+
+    # BatchWriteItem (이미 있는 eventId 는 건너뛰고, 같은 인시던트의 이벤트는 합쳐서 기록)
+    try:
+        results = ingest_items(items)
+    except Exception as exc:
+        # 기록 자체가 실패하면 검증을 통과한 레코드 전부를 재시도 대상으로 돌려줌
+        logging.exception("ingest failed for %d events", len(items))
+        failures += [{"itemIdentifier": message_id, "reason": f"ingest failed: {exc}"} for message_id in item_records]
+        items, results = [], []
+    actions = [action for action, _ in results]
+
+    return {
+        "statusCode": 200,
+        "batchItemFailures": [{"itemIdentifier": f["itemIdentifier"]} for f in failures],
+        "content": {
+            "written":    actions.count("created"),
+            "merged":     actions.count("merged") + actions.count("escalated"),
+            "duplicates": actions.count("duplicate"),
+            "failed":     failures,
+            "analyze":    list(dict.fromkeys(incident["eventId"] for action, incident in results
+                                             if action in ("created", "escalated"))),
+            "responses":  [build_ingest_response(item, action, incident)
+                           for item, (action, incident) in zip(items, results)],
+        },
+    }
+
+def attach_images(uploads: List[Tuple[EventItem, str, str, bytes]]) -> List[Tuple[EventItem, bool]]:
+    """
+    Image-attached stage for a burst of uploads [(item, bucket, key, image bytes), ...]:
+    thumbnails, one batched image analysis for the whole burst (cached by image hash), then one
+    UpdateItem per event. Returns [(updated item, analysed)]; analysed is False when the model
+    gave no description, so the caller can retry just those uploads.
+    """
+    import thumbnails  # Pillow 은 이미지가 올라올 때만 로드
+
+    analyses: Dict[str, Dict[str, Any]] = {}
+    if IMAGE_ANALYSIS:
+        import image_analysis
+        requests = [image_analysis.AnalysisRequest(item["eventId"], data,
+                                                   {"eventType": item.get("eventType"), "roiId": item.get("roiId")})
+                    for item, _, _, data in uploads]
+        try:
+            analyses = image_analysis.get_analyzer().analyze(requests)
+        except Exception:
+            # 모델 장애여도 이미지/썸네일은 붙이고, 분석만 재시도 대상으로 남김
+            logging.exception("image analysis failed for %d uploads", len(uploads))
+
+    results: List[Tuple[EventItem, bool]] = []
+    for item, bucket, key, data in uploads:
+        updates: Dict[str, Any] = {
+            "imageS3Bucket": bucket,
+            "imageS3Key":    key,
+            "thumbKey":      thumbnails.make_thumbnail(data),
+            "status":        "IMAGE_ATTACHED",
+        }
+        analysis = analyses.get(item["eventId"])
+        if analysis:
+            # 카메라가 보낸 원래 문구는 deviceMessage 로 보존하고 message 를 이미지 분석 결과로 교체
+            updates["deviceMessage"] = item.get("deviceMessage", item.get("message"))
+            updates["message"] = analysis["description"]
+            updates["imageAnalysis"] = {k: analysis[k] for k in ("imageHash", "cached", "modelBytes")}
+        results.append((get_store().update_item(item["eventId"], updates), bool(analysis) or not IMAGE_ANALYSIS))
+    return results
+
+def image_handler(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """
+    S3:ObjectCreated entry point (directly or via an SQS batch). Each record names the
+    uploaded object (`s3.bucket.name`, `s3.object.key`); the eventId is the key's file stem
+    (`.../542991.jpg`) unless given explicitly. Returns `batchItemFailures` for records that
+    could not be attached or analysed.
+    """
+    from object_store import get_object_store
+
+    store = get_object_store()
+    failures: List[Dict[str, str]] = []
+    uploads: List[Tuple[EventItem, str, str, bytes]] = []
+    record_ids: Dict[str, str] = {}
+    for i, record in enumerate(event.get("Records", [])):
+        record_id = record.get("messageId", str(i))
+        try:
+            body = json.loads(record["body"]) if "body" in record else record  # SQS 로 감싼 S3 알림
+            s3 = (body["Records"][0] if "Records" in body else body)["s3"]
+            bucket, key = s3["bucket"]["name"], unquote_plus(s3["object"]["key"])
+            event_id = body.get("eventId") or os.path.splitext(os.path.basename(key))[0]
+            item = get_store().get_item(event_id)
+            if item is None:
+                raise KeyError(f"eventId {event_id} not found")
+            uploads.append((item, bucket, key, store.get_object(bucket, key)))
+            record_ids[event_id] = record_id
+        except (KeyError, TypeError, OSError, ValueError) as exc:
+            failures.append({"itemIdentifier": record_id, "reason": str(exc)})
+
+    attached = attach_images(uploads) if uploads else []
+    for item, analysed in attached:
+        if not analysed:
+            failures.append({"itemIdentifier": record_ids[item["eventId"]], "reason": "image analysis unavailable"})
+
+    return {
+        "statusCode": 200,
+        "batchItemFailures": [{"itemIdentifier": f["itemIdentifier"]} for f in failures],
         "content": {
-            "eventId":   event_id,
-            "s3Bucket":  BUCKET_NAME,
-            "s3Key":     s3_key,
-            "url":       presigned_url,
-            "item":      item,
-            "headers":   {"Content-Type": "image/jpeg"},
-            "expireSec": PRESIGNED_EXP_SEC,
+            "attached": len(attached),
+            "failed":   failures,
+            "items":    [item for item, _ in attached],
         },
     }
 
-# Synthetic event generator for local testing 
+def camera_frame(event_type: str) -> bytes:
+    """카메라가 업로드하는 JPEG 프레임 흉내 (유형별 예시 이미지를 JPEG 로 인코딩)."""
+    import io
+    from PIL import Image
+
+    with Image.open(f"{IMAGE_DIR}/{event_type}.png") as image:
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=90)
+        return out.getvalue()
+
+# Synthetic event generator for local testing
 def generate_event_data() -> Dict[str, Any]:
     start = datetime(2025, 7, 20, tzinfo=timezone.utc)
     end   = datetime(2025, 7, 27, 23, 59, 59, tzinfo=timezone.utc)
@@ -259,4 +462,13 @@ def generate_event_data() -> Dict[str, Any]:
     }
 
     # Immediately invoke handler for easy manual testing
-    return lambda_handler(event_payload, None)
+    response = lambda_handler(event_payload, None)
+    # 카메라 업로드 흉내: presigned 키로 객체 저장소에 올리고 S3:ObjectCreated 알림(imageRecord)을 돌려줌.
+    # 알림은 호출한 쪽이 작업 큐로 보내고 워커가 image_handler 를 실행 (모델 호출을 여기서 기다리지 않음)
+    from object_store import get_object_store
+    content = response["content"]
+    if content.get("coalescedInto"):
+        return response
+    content["imageRecord"] = get_object_store().put_object(
+        content["s3Bucket"], content["s3Key"], camera_frame(event_type), content["headers"]["Content-Type"])
+    return response
@@ -0,0 +1,262 @@
+'''
+AWS 없이 파이프라인을 실행/측정하기 위한 Bedrock 대체 모델입니다.
+
+- HashEmbeddings:     Titan v2 와 같은 1024 차원의 결정적(해시 기반) 임베딩
+- ScriptedChatModel:  스크립트(규칙)에 따라 답하는 채팅 모델 (스트리밍 지원)
+
+두 모델 모두 호출 지연 분포, 토큰 생성 속도, 스로틀링 오류(ThrottlingException) 주입을 설정할 수 있어
+노트북/CI 에서도 실제 서비스와 비슷한 조건으로 수집·RAG 처리량을 벤치마크할 수 있습니다.
+BEDROCK_PROVIDER=local 이면 chat.py / lambda_function_embedding.py 가 이 모델들을 사용합니다.
+'''
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from provider_config import use_local_provider  # noqa: F401  (기존 import 경로 호환)
+
+# Configuration
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "1024"))  # amazon.titan-embed-text-v2:0 기본 차원
+LOCAL_LATENCY = os.getenv("LOCAL_LATENCY", "lognormal")       # none | constant | uniform | lognormal
+LOCAL_EMBED_LATENCY_MS = float(os.getenv("LOCAL_EMBED_LATENCY_MS", "0"))   # 임베딩 호출 지연 중앙값
+LOCAL_CHAT_LATENCY_MS = float(os.getenv("LOCAL_CHAT_LATENCY_MS", "0"))     # 첫 토큰까지 지연 중앙값
+LOCAL_LATENCY_SIGMA = float(os.getenv("LOCAL_LATENCY_SIGMA", "0.5"))       # lognormal 분산 / uniform 폭 비율
+LOCAL_TOKENS_PER_SEC = float(os.getenv("LOCAL_TOKENS_PER_SEC", "0"))       # 0 이면 지연 없이 출력
+LOCAL_THROTTLE_RATE = float(os.getenv("LOCAL_THROTTLE_RATE", "0"))         # 호출당 ThrottlingException 확률
+LOCAL_CHAT_SCRIPT = os.getenv("LOCAL_CHAT_SCRIPT", "")                     # [{"match": regex, "response": text}] JSON
+LOCAL_SEED = os.getenv("LOCAL_SEED", "")
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+# Fucntions
+@dataclass
+class LatencyModel:
+    """호출 지연 분포. median_ms 가 0 이거나 distribution 이 none 이면 지연 없음."""
+    median_ms: float = 0.0
+    distribution: str = LOCAL_LATENCY
+    sigma: float = LOCAL_LATENCY_SIGMA
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_ms <= 0 or self.distribution == "none":
+            return 0.0
+        if self.distribution == "constant":
+            seconds = self.median_ms
+        elif self.distribution == "uniform":
+            seconds = rng.uniform(self.median_ms * (1 - self.sigma), self.median_ms * (1 + self.sigma))
+        else:  # lognormal: 대부분 중앙값 근처, 가끔 긴 꼬리 (p99 지연 재현)
+            seconds = rng.lognormvariate(math.log(self.median_ms), self.sigma)
+        return max(0.0, seconds) / 1000.0
+
+
+class ServiceSimulator:
+    """지연과 스로틀링을 주입합니다. 여러 스레드에서 함께 사용할 수 있습니다."""
+
+    def __init__(self, latency: LatencyModel, throttle_rate: float = LOCAL_THROTTLE_RATE,
+                 operation: str = "InvokeModel", seed: Optional[str] = LOCAL_SEED or None) -> None:
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.operation = operation
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def _attempt(self) -> None:
+        with self._lock:
+            self.calls += 1
+            throttle = self._rng.random() < self.throttle_rate
+            delay = self.latency.sample(self._rng)
+            if throttle:
+                self.throttled += 1
+        if throttle:
+            # 스로틀링은 빠르게 거절되므로 지연의 일부만 소모
+            time.sleep(delay * 0.1)
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."},
+                 "ResponseMetadata": {"HTTPStatusCode": 429}},
+                self.operation,
+            )
+        time.sleep(delay)
+
+    def call(self, max_attempts: int = 1) -> None:
+        """
+        요청 하나를 흉내냅니다. max_attempts > 1 이면 botocore 재시도 설정처럼
+        스로틀링 시 지수 백오프 후 다시 시도하고, 모두 실패하면 마지막 오류를 던집니다.
+        """
+        for attempt in range(max_attempts):
+            try:
+                return self._attempt()
+            except ClientError:
+                if attempt == max_attempts - 1:
+                    raise
+                time.sleep(self._rng.uniform(0, 0.05 * 2 ** attempt))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "throttled": self.throttled}
+
+
+def hash_vector(text: str, dim: int = LOCAL_EMBED_DIM) -> List[float]:
+    """
+    Feature hashing of word and character-trigram features, L2-normalized (Titan v2 처럼).
+    같은 텍스트는 항상 같은 벡터, 단어가 겹치는 텍스트는 코사인 유사도가 높습니다.
+    """
+    vector = [0.0] * dim
+    tokens = [t.lower() for t in _TOKEN_RE.findall(text)]
+    features = tokens + [t[i:i + 3] for t in tokens if len(t) > 3 for i in range(len(t) - 2)]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        # 빈 텍스트도 0 벡터가 아닌 고정 단위 벡터로 (코사인 거리 계산 시 NaN 방지)
+        return [1.0] + [0.0] * (dim - 1)
+    return [x / norm for x in vector]
+
+
+class HashEmbeddings(Embeddings):
+    """BedrockEmbeddings 대체: 텍스트 하나당 호출 하나로 간주해 지연/스로틀링을 주입합니다."""
+
+    def __init__(self, dim: int = LOCAL_EMBED_DIM,
+                 simulator: Optional[ServiceSimulator] = None) -> None:
+        self.dim = dim
+        self.simulator = simulator or ServiceSimulator(LatencyModel(LOCAL_EMBED_LATENCY_MS))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            self.simulator.call()
+            vectors.append(hash_vector(text, self.dim))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_script(path: str = LOCAL_CHAT_SCRIPT) -> List[Dict[str, str]]:
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _event_from_prompt(prompt: str) -> Dict[str, Any]:
+    # 프롬프트에 들어 있는 이벤트 JSON(dict repr 포함)에서 주요 필드만 추출
+    fields = {}
+    for key in ("eventType", "roiId", "severity", "deviceId", "message"):
+        match = re.search(rf"['\"]{key}['\"]\s*:\s*['\"]([^'\"]*)['\"]", prompt)
+        if match:
+            fields[key] = match.group(1)
+    return fields
+
+def default_response(prompt: str) -> str:
+    """스크립트에 맞는 규칙이 없을 때: 플래너 질의 3개 또는 3개 섹션의 어드바이저 답변."""
+    event = _event_from_prompt(prompt)
+    event_type = event.get("eventType", "safety event")
+    roi = event.get("roiId", "the monitored zone")
+    severity = event.get("severity", "MEDIUM")
+    if "image analyst" in prompt:
+        # 이미지 분석: 프롬프트의 "imageId: <id> (eventType: ..., roiId: ...)" 마다 한 문장 설명
+        descriptions = {}
+        for image_id, meta in re.findall(r"imageId: (\w+) \(([^)]*)\)", prompt):
+            hint = dict(part.split(": ", 1) for part in meta.split(", ") if ": " in part)
+            descriptions[image_id] = (f"Camera frame shows {hint.get('eventType', 'activity')} "
+                                      f"in {hint.get('roiId', 'the monitored zone')}.")
+        return json.dumps(descriptions)
+    if "several safety events" in prompt:
+        # 묶음 어드바이저: 프롬프트의 "### EVENT <id>" 마다 그 아래 이벤트 JSON 으로 답변 섹션 생성
+        parts = re.split(r"^### EVENT (\S+)$", prompt.split("Events:", 1)[-1], flags=re.MULTILINE)
+        return "\n\n".join(f"### EVENT {event_id}\n{default_response(body)}"
+                             for event_id, body in zip(parts[1::2], parts[2::2]))
+    if "query planner" in prompt:
+        return "\n".join([
+            f"What is the work instruction for responding to {event_type} in {roi}?",
+            f"Which protective equipment and access rules apply to {roi}?",
+            f"What escalation steps are required for a {severity} severity {event_type}?",
+        ])
+    return (
+        f"• Risk Level\n{severity} - {event_type} detected in {roi}.\n\n"
+        f"• Safety Measures\nStop nearby work, secure {roi} and confirm protective equipment.\n\n"
+        f"• Work Procedure\n1. Notify the safety manager. 2. Inspect {roi} on site. "
+        f"3. Record the action taken in the event log."
+    )
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    ChatBedrock 대체. script 의 규칙(정규식)과 프롬프트가 처음 일치하는 응답을 돌려주고,
+    없으면 default_response 를 사용합니다. 첫 토큰 지연과 토큰 속도, 스로틀링을 흉내냅니다.
+    """
+
+    model_id: str = "local-scripted"
+    script: List[Dict[str, str]] = []
+    tokens_per_sec: float = LOCAL_TOKENS_PER_SEC
+    max_attempts: int = 3  # chat.py 의 bedrock-runtime 재시도 설정과 동일
+    simulator: Any = None
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if self.simulator is None:
+            self.simulator = ServiceSimulator(LatencyModel(LOCAL_CHAT_LATENCY_MS), operation="InvokeModelWithResponseStream")
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-scripted-chat"
+
+    @staticmethod
+    def _text(message: BaseMessage) -> str:
+        # 멀티모달 메시지는 텍스트 블록만 사용 (이미지 base64 는 규칙 매칭/토큰 수에서 제외)
+        if isinstance(message.content, str):
+            return message.content
+        return "\n".join(block.get("text", "") for block in message.content if isinstance(block, dict))
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(self._text(m) for m in messages)
+        for rule in self.script:
+            if re.search(rule["match"], prompt):
+                return rule["response"]
+        return default_response(prompt)
+
+    def _tokens(self, text: str) -> Iterator[str]:
+        # 공백을 앞 토큰에 붙여 나눔 (이어 붙이면 원문과 동일)
+        for match in re.finditer(r"\s*\S+", text):
+            yield match.group(0)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        chunks = list(self._stream(messages, stop, run_manager, **kwargs))
+        text = "".join(chunk.message.content for chunk in chunks)
+        usage = chunks[-1].message.usage_metadata if chunks else None
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.simulator.call(self.max_attempts)  # 첫 토큰까지의 지연 (또는 스로틀링)
+        interval = 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        tokens = list(self._tokens(self._respond(messages)))
+        input_tokens = sum(len(list(self._tokens(self._text(m)))) for m in messages)
+        for i, token in enumerate(tokens):
+            if interval:
+                time.sleep(interval)
+            # Bedrock 스트리밍처럼 사용량은 마지막 청크에만 포함
+            usage = ({"input_tokens": input_tokens, "output_tokens": len(tokens),
+                      "total_tokens": input_tokens + len(tokens)} if i == len(tokens) - 1 else None)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,263 @@
+'''
+RAG/수집 파이프라인의 단계별 처리 시간·토큰·비용 계측입니다.
+
+각 단계(planner, retriever, generate, 임베딩 배치, Chroma 질의, 수집 단계)는 관측값 하나를
+SQLite 파일에 기록하므로 워커·대시보드·Lambda 가 같은 값을 집계할 수 있습니다.
+집계는 Prometheus 텍스트 형식(히스토그램) 또는 JSON 으로 내보냅니다.
+
+    python metrics.py --port 9102     # GET /metrics (Prometheus), GET /metrics.json — 기본은 localhost 만
+    python metrics.py --host 0.0.0.0  # 다른 호스트의 Prometheus 가 수집해야 할 때
+    python metrics.py --json          # 요약을 한 번 출력
+'''
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Configuration
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "data_source/metrics/metrics.db")
+METRICS_RETENTION_SEC = float(os.getenv("METRICS_RETENTION_SEC", str(7 * 24 * 3600)))
+METRICS_WINDOW_SEC = float(os.getenv("METRICS_WINDOW_SEC", str(24 * 3600)))  # 요약/백분위 집계 구간
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # 외부 수집이 필요할 때만 0.0.0.0
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+BUSY_TIMEOUT_SEC = 30
+PRUNE_EVERY = 1000  # 관측값 N 개마다 보존 기간이 지난 행 삭제
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 1K 토큰당 USD (입력, 출력) - Bedrock 온디맨드 가격
+MODEL_PRICES_PER_1K = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (0.003, 0.015),
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "amazon.titan-embed-text-v2:0": (0.00002, 0.0),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage    TEXT NOT NULL,
+    seconds  REAL NOT NULL,
+    tokens   INTEGER NOT NULL DEFAULT 0,
+    items    INTEGER NOT NULL DEFAULT 0,
+    hits     INTEGER NOT NULL DEFAULT 0,
+    cost     REAL NOT NULL DEFAULT 0,
+    created  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_observations_stage_created ON observations (stage, created);
+CREATE INDEX IF NOT EXISTS idx_observations_created ON observations (created);
+"""
+
+
+# Fucntions
+def estimate_tokens(text: str) -> int:
+    # 사용량 정보를 주지 않는 호출(임베딩 등)용 근사치: 영문은 약 4자당 1토큰, 한글 등 비 ASCII 는 약 1.5자당 1토큰
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return max(1, round((len(text) - non_ascii) / 4 + non_ascii / 1.5))
+
+def estimate_cost(model_id: str, input_tokens: int, output_tokens: int = 0) -> float:
+    price_in, price_out = MODEL_PRICES_PER_1K.get(model_id, (0.0, 0.0))
+    return input_tokens / 1000 * price_in + output_tokens / 1000 * price_out
+
+def usage_tokens(message: Any) -> Dict[str, int]:
+    """AIMessage.usage_metadata 에서 입력/출력 토큰 수를 꺼냅니다 (없으면 0)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {"inputTokens": int(usage.get("input_tokens", 0)), "outputTokens": int(usage.get("output_tokens", 0))}
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class MetricsStore:
+    def __init__(self, db_path: str = METRICS_DB_PATH) -> None:
+        self.db_path = db_path
+        dirname = os.path.dirname(db_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def observe(self, stage: str, seconds: float, tokens: int = 0, items: int = 0,
+                hits: int = 0, cost: float = 0.0) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO observations (stage, seconds, tokens, items, hits, cost, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stage, seconds, tokens, items, hits, cost, now),
+        )
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM observations WHERE created < ?", (now - METRICS_RETENTION_SEC,))
+
+    def summary(self, window_sec: float = METRICS_WINDOW_SEC) -> List[Dict[str, Any]]:
+        """단계별 건수, p50/p95/p99(ms), 토큰·항목·캐시 적중·비용 합계."""
+        rows = self._conn().execute(
+            "SELECT stage, seconds, tokens, items, hits, cost FROM observations WHERE created >= ? "
+            "ORDER BY stage, seconds",
+            (time.time() - window_sec,),
+        ).fetchall()
+        stages: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            s = stages.setdefault(row["stage"], {"seconds": [], "tokens": 0, "items": 0, "hits": 0, "cost": 0.0})
+            s["seconds"].append(row["seconds"])
+            s["tokens"] += row["tokens"]
+            s["items"] += row["items"]
+            s["hits"] += row["hits"]
+            s["cost"] += row["cost"]
+
+        result = []
+        for stage, s in stages.items():
+            values = s["seconds"]
+            result.append({
+                "stage": stage,
+                "count": len(values),
+                "p50Ms": round(percentile(values, 0.50) * 1000, 1),
+                "p95Ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99Ms": round(percentile(values, 0.99) * 1000, 1),
+                "meanMs": round(sum(values) / len(values) * 1000, 1),
+                "tokens": s["tokens"],
+                "items": s["items"],
+                "cacheHits": s["hits"],
+                "costUsd": round(s["cost"], 6),
+            })
+        return result
+
+    def histograms(self, window_sec: float = METRICS_WINDOW_SEC) -> Dict[str, Dict[str, Any]]:
+        bucket_sql = ", ".join(f"SUM(seconds <= {b})" for b in BUCKETS)
+        rows = self._conn().execute(
+            f"SELECT stage, COUNT(*), SUM(seconds), SUM(tokens), SUM(items), SUM(hits), SUM(cost), {bucket_sql} "
+            "FROM observations WHERE created >= ? GROUP BY stage ORDER BY stage",
+            (time.time() - window_sec,),
+        ).fetchall()
+        return {
+            row[0]: {
+                "count": row[1], "sum": row[2], "tokens": row[3], "items": row[4], "hits": row[5], "cost": row[6],
+                "buckets": list(zip(BUCKETS, row[7:])),
+            }
+            for row in rows
+        }
+
+    def prometheus_text(self, window_sec: float = METRICS_WINDOW_SEC) -> str:
+        lines = [
+            "# HELP safeguard_stage_seconds Wall time per pipeline stage.",
+            "# TYPE safeguard_stage_seconds histogram",
+        ]
+        histograms = self.histograms(window_sec)
+        for stage, h in histograms.items():
+            for bound, count in h["buckets"]:
+                lines.append(f'safeguard_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'safeguard_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h["count"]}')
+            lines.append(f'safeguard_stage_seconds_sum{{stage="{stage}"}} {h["sum"]}')
+            lines.append(f'safeguard_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+        for name, key, help_text in (
+            ("safeguard_stage_tokens_total", "tokens", "Model tokens consumed per stage."),
+            ("safeguard_stage_items_total", "items", "Chunks, texts or queries processed per stage."),
+            ("safeguard_stage_cache_hits_total", "hits", "Cache hits per stage."),
+            ("safeguard_stage_cost_usd_total", "cost", "Estimated Bedrock cost per stage in USD."),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{stage="{stage}"}} {h[key]}' for stage, h in histograms.items()]
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_metrics(db_path: str = METRICS_DB_PATH) -> MetricsStore:
+    return MetricsStore(db_path)
+
+def observe(stage: str, seconds: float, **fields: Any) -> None:
+    """관측값을 기록합니다. 계측 실패가 파이프라인을 멈추지 않도록 오류는 로그만 남깁니다."""
+    if not METRICS_ENABLED:
+        return
+    try:
+        get_metrics().observe(stage, seconds, **fields)
+    except Exception as exc:
+        logging.warning("metrics: failed to record %s: %s", stage, exc)
+
+@contextmanager
+def timed(stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    블록의 실행 시간을 *stage* 로 기록합니다. 블록 안에서 span["tokens"], ["items"], ["hits"], ["cost"]
+    를 채울 수 있고, 종료 후 span["ms"] 에 소요 시간이 들어갑니다 (이벤트별 요약에 사용).
+    """
+    span: Dict[str, Any] = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        seconds = time.perf_counter() - started
+        span["ms"] = round(seconds * 1000, 1)
+        observe(stage, seconds, **{k: span[k] for k in ("tokens", "items", "hits", "cost") if k in span})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        store = get_metrics()
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(store.summary(), ensure_ascii=False).encode("utf-8"), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = store.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.debug("metrics endpoint: " + format, *args)
+
+def serve(port: int = METRICS_PORT, background: bool = False, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    logging.info("metrics endpoint listening on %s:%d (/metrics, /metrics.json)", host, port)
+    if background:
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SafeGuard AI pipeline metrics")
+    parser.add_argument("--host", default=METRICS_HOST, help="bind address (default: localhost only)")
+    parser.add_argument("--port", type=int, default=METRICS_PORT)
+    parser.add_argument("--json", action="store_true", help="print the per-stage summary and exit")
+    parser.add_argument("--prometheus", action="store_true", help="print Prometheus text and exit")
+    args = parser.parse_args()
+
+    if args.json:
+        print(json.dumps(get_metrics().summary(), ensure_ascii=False, indent=2))
+    elif args.prometheus:
+        print(get_metrics().prometheus_text(), end="")
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        serve(args.port, host=args.host)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+'''
+S3 를 대신하는 로컬 객체 저장소입니다 (버킷 = 디렉토리, 키 = 상대 경로).
+
+- put_object: 객체를 원자적으로 기록하고 S3:ObjectCreated:Put 알림 레코드를 돌려줌
+              (Records 로 묶어 lambda_function_event.image_handler 에 전달)
+- get_object: 객체 바이트 읽기
+- path:       대시보드가 이미지를 바로 읽을 수 있는 로컬 경로
+'''
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+# Configuration
+OBJECT_STORE_DIR = os.getenv("OBJECT_STORE_DIR", "data_source/object_store")
+
+
+class LocalObjectStore:
+    def __init__(self, root: str = OBJECT_STORE_DIR) -> None:
+        self.root = root
+
+    def path(self, bucket: str, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        # 키에 ../ 가 있어도 버킷 밖으로 나가지 않도록
+        if not path.startswith(os.path.normpath(os.path.join(self.root, bucket)) + os.sep):
+            raise ValueError(f"invalid object key: {key}")
+        return path
+
+    def put_object(self, bucket: str, key: str, body: bytes,
+                   content_type: Optional[str] = None) -> Dict[str, Any]:
+        path = self.path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(body)
+        os.replace(tmp, path)
+        return {
+            "eventSource": "aws:s3",
+            "eventName": "ObjectCreated:Put",
+            "eventTime": datetime.now(timezone.utc).isoformat(),
+            "s3": {
+                "bucket": {"name": bucket},
+                "object": {"key": key, "size": len(body), "eTag": hashlib.md5(body).hexdigest(),
+                           "contentType": content_type},
+            },
+        }
+
+    def get_object(self, bucket: str, key: str) -> bytes:
+        with open(self.path(bucket, key), "rb") as fp:
+            return fp.read()
+
+    def exists(self, bucket: str, key: str) -> bool:
+        return os.path.exists(self.path(bucket, key))
+
+
+@lru_cache(maxsize=None)
+def get_object_store(root: str = OBJECT_STORE_DIR) -> LocalObjectStore:
+    return LocalObjectStore(root)
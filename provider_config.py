@@ -0,0 +1,14 @@
+'''
+Bedrock / 로컬 대체 모델 선택 스위치입니다 (BEDROCK_PROVIDER=bedrock | local).
+
+가벼운 모듈이어야 하므로 표준 라이브러리만 import 합니다. 로컬 대체 모델 자체(local_providers.py)는
+botocore / langchain_core 를 불러오므로, 실제로 로컬 모델을 만들 때만 import 합니다.
+'''
+
+import os
+
+
+# Fucntions
+def use_local_provider() -> bool:
+    # 호출 시점에 읽으므로 load_dotenv() 로 읽은 .env 값도 반영됨
+    return os.getenv("BEDROCK_PROVIDER", "bedrock").lower() == "local"
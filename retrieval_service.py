@@ -0,0 +1,450 @@
+'''
+여러 대시보드 세션 / ECS 워커 / 수집 람다가 함께 쓰는 상시 실행 검색(retrieval) 서비스입니다.
+
+벡터 저장소(Chroma 또는 FAISS)를 이 프로세스 하나만 열어 메모리에 한 벌만 두고, 클라이언트는
+localhost HTTP 또는 Unix 소켓으로 질의 벡터를 보냅니다. 임베딩은 클라이언트가 (디스크 캐시를 거쳐)
+계산하므로 서비스는 Bedrock 을 호출하지 않습니다.
+
+- 질의 합치기: 짧은 시간(RETRIEVAL_COALESCE_MS) 안에 들어온 질의들을 where 필터별로 모아
+  컬렉션 query 한 번으로 처리한 뒤 요청별로 나눠 돌려줍니다.
+- 단일 writer: upsert / delete / commit 은 서비스 안에서 하나씩 실행됩니다. 쓰기 요청은 클라이언트가
+  붙인 요청 ID(X-Request-Id)로 한 번만 실행되므로 타임아웃 후 재시도해도 두 번 적용되지 않고,
+  RETRIEVAL_WRITER_IDLE_SEC 동안 commit 없이 멈춘 FAISS 쓰기 세션은 되돌려 write.lock 을 놓습니다.
+- 스냅샷 읽기 (VECTOR_BACKEND=faiss): 쓰기는 별도 writer 에 쌓였다가 commit 때 새 세대로 기록되고,
+  질의는 mmap 으로 연 현재 세대만 봅니다. 수집 도중에도 질의는 이전 세대를 온전히 봅니다.
+  Chroma 는 자체적으로 호출 단위로만 일관성을 보장합니다.
+
+    python retrieval_service.py --port 9110
+    python retrieval_service.py --socket /tmp/safeguard-retrieval.sock
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:9110 streamlit run app.py
+    RETRIEVAL_SERVICE_URL=unix:///tmp/safeguard-retrieval.sock python ecs-rag-pipeline/worker.py
+'''
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from provider_config import use_local_provider
+
+# Configuration
+LOCAL_PROVIDER = use_local_provider()
+VECTOR_DIR = os.getenv("VECTOR_DIR", "./data_source/local_vector_store" if LOCAL_PROVIDER else "./data_source/opensearch_vector_store")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()       # chroma | faiss
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "work_instructions")
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL", "")      # http://127.0.0.1:9110 | unix:///path.sock
+RETRIEVAL_PORT = int(os.getenv("RETRIEVAL_PORT", "9110"))
+RETRIEVAL_COALESCE_MS = float(os.getenv("RETRIEVAL_COALESCE_MS", "2"))  # 첫 질의 후 더 기다리는 시간
+RETRIEVAL_MAX_BATCH = int(os.getenv("RETRIEVAL_MAX_BATCH", "64"))       # 한 번에 합칠 최대 질의 벡터 수
+RETRIEVAL_TIMEOUT_SEC = float(os.getenv("RETRIEVAL_TIMEOUT_SEC", "60"))
+RETRIEVAL_WRITER_IDLE_SEC = float(os.getenv("RETRIEVAL_WRITER_IDLE_SEC", "600"))  # 버려진 쓰기 세션을 되돌리는 시간
+WRITE_DEDUP_SIZE = 1024                                                           # 기억해 둘 최근 쓰기 요청 ID 수
+
+QueryFn = Callable[[List[List[float]], int, Optional[Dict[str, Any]]], Dict[str, List[List[Any]]]]
+
+
+# Fucntions
+class QueryCoalescer:
+    """
+    여러 스레드에서 동시에 들어온 질의를 모아 같은 where 필터끼리 query_fn 한 번으로 처리합니다.
+    첫 질의가 도착하면 window_ms 만큼(또는 max_vectors 가 찰 때까지) 더 모은 뒤 실행합니다.
+    묶음 하나가 실패해도 그 묶음의 질의만 예외로 끝나고 합치기 스레드는 계속 동작합니다.
+    """
+
+    def __init__(self, query_fn: QueryFn, window_ms: float = RETRIEVAL_COALESCE_MS,
+                 max_vectors: int = RETRIEVAL_MAX_BATCH, timeout: float = RETRIEVAL_TIMEOUT_SEC) -> None:
+        self.query_fn = query_fn
+        self.window = window_ms / 1000.0
+        self.max_vectors = max_vectors
+        self.timeout = timeout
+        self._pending: List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]] = []
+        self._cond = threading.Condition()
+        self.requests = self.batches = self.vectors = 0
+        threading.Thread(target=self._loop, name="retrieval-coalescer", daemon=True).start()
+
+    def submit(self, vectors: List[List[float]], k: int, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        future: Future = Future()
+        item = (vectors, k, where, future)
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 아직 실행 전이면 대기열에서 빼서 결과 없이 실행되지 않도록
+            with self._cond:
+                self._pending = [p for p in self._pending if p is not item]
+            future.cancel()
+            raise TimeoutError(f"retrieval query not answered within {self.timeout}s") from None
+
+    def _take(self) -> List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while sum(len(v) for v, *_ in self._pending) < self.max_vectors:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            taken, size = [], 0
+            while self._pending and (not taken or size + len(self._pending[0][0]) <= self.max_vectors):
+                taken.append(self._pending.pop(0))
+                size += len(taken[-1][0])
+            return taken
+
+    @staticmethod
+    def _fail(items: List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]], exc: BaseException) -> None:
+        for *_, future in items:
+            if not future.done():  # 이미 결과를 받았거나 시간 초과로 취소된 질의는 제외
+                future.set_exception(exc)
+
+    def _loop(self) -> None:
+        while True:
+            taken: List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]] = []
+            try:
+                taken = self._take()
+                groups: Dict[str, List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]]] = {}
+                for item in taken:
+                    groups.setdefault(json.dumps(item[2], sort_keys=True), []).append(item)
+            except Exception as e:
+                logging.exception("retrieval coalescer: batching %d queries failed", len(taken))
+                self._fail(taken, e)
+                continue
+            for items in groups.values():
+                try:
+                    self._run(items)
+                except Exception as e:
+                    # query_fn / 벡터 합치기 / 결과 나누기 중 어디서 실패해도 이 묶음만 실패 처리
+                    logging.exception("retrieval coalescer: batch of %d queries failed", len(items))
+                    self._fail(items, e)
+
+    def _run(self, items: List[Tuple[List[List[float]], int, Optional[Dict[str, Any]], Future]]) -> None:
+        items = [item for item in items if not item[3].done()]
+        if not items:
+            return
+        vectors = [v for item in items for v in item[0]]
+        k = max(item[1] for item in items)
+        result = self.query_fn(vectors, k, items[0][2])
+        # 합친 질의는 가장 큰 k 로 실행했으므로 요청별 k 만큼 잘라서 반환 (모두 나눈 뒤에 결과 전달)
+        parts, offset = [], 0
+        for item_vectors, item_k, _, _ in items:
+            part = slice(offset, offset + len(item_vectors))
+            parts.append({key: [row[:item_k] for row in rows[part]] for key, rows in result.items()})
+            offset += len(item_vectors)
+        self.requests += len(items)
+        self.batches += 1
+        self.vectors += len(vectors)
+        for (*_, future), part_result in zip(items, parts):
+            if not future.done():
+                future.set_result(part_result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "batches": self.batches, "vectors": self.vectors,
+                "requestsPerBatch": round(self.requests / self.batches, 2) if self.batches else 0.0}
+
+
+class RetrievalService:
+    """벡터 저장소를 한 번만 열어 두고 질의(합치기)와 쓰기(단일 writer)를 처리합니다."""
+
+    def __init__(self, backend: str = VECTOR_BACKEND, vector_dir: str = VECTOR_DIR) -> None:
+        self.backend = backend
+        self.vector_dir = vector_dir
+        self._write_lock = threading.Lock()
+        self._writer: Any = None
+        self._writer_used_at = 0.0
+        self._writer_expired = False  # 되돌린 세션이 있으면 다음 commit 이 알림 (변경 일부가 사라졌으므로)
+        self._requests: "OrderedDict[str, Future]" = OrderedDict()  # 요청 ID → 결과 (재시도 중복 제거)
+        self._requests_lock = threading.Lock()
+        if backend == "faiss":
+            from faiss_store import FaissVectorStore
+            self._reader = FaissVectorStore(os.path.join(vector_dir, "faiss"), None, read_only=True)
+            self._collection = self._reader
+        else:
+            from langchain_chroma import Chroma
+            os.makedirs(vector_dir, exist_ok=True)
+            # 임베딩은 클라이언트가 보내므로 embedding_function 없이 컬렉션만 사용
+            self._collection = Chroma(collection_name=COLLECTION_NAME, persist_directory=vector_dir)._collection
+        self.coalescer = QueryCoalescer(self._query)
+        if backend == "faiss":
+            threading.Thread(target=self._reap_idle_writer, name="retrieval-writer-reaper", daemon=True).start()
+        logging.info("retrieval service: %s store at %s (%d vectors)", backend, vector_dir, self.count())
+
+    def _query(self, vectors: List[List[float]], k: int, where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        result = self._collection.query(query_embeddings=vectors, n_results=k, where=where,
+                                        include=["documents", "metadatas", "distances"])
+        return {key: result[key] for key in ("ids", "documents", "metadatas", "distances")}
+
+    def query(self, vectors: List[List[float]], k: int = 4, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.coalescer.submit(vectors, k, where)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def generation(self) -> int:
+        return self._reader._generation if self.backend == "faiss" else 0
+
+    # -- 단일 writer --------------------------------------------------------------------------
+    def _faiss_writer(self) -> Any:
+        if self._writer is None:
+            from faiss_store import FaissVectorStore
+            self._writer = FaissVectorStore(os.path.join(self.vector_dir, "faiss"), None)
+        self._writer_used_at = time.monotonic()
+        return self._writer
+
+    def _reap_idle_writer(self) -> None:
+        # 수집 클라이언트가 commit 전에 죽으면 서비스가 write.lock 을 계속 잡고 있게 되므로 세션을 되돌림
+        while True:
+            time.sleep(max(RETRIEVAL_WRITER_IDLE_SEC / 4, 0.05))
+            with self._write_lock:
+                if self._writer is not None and time.monotonic() - self._writer_used_at >= RETRIEVAL_WRITER_IDLE_SEC:
+                    logging.warning("retrieval service: writer idle for %gs without commit, rolling back",
+                                    RETRIEVAL_WRITER_IDLE_SEC)
+                    self._writer.rollback()
+                    self._writer = None
+                    self._writer_expired = True
+
+    def run_once(self, request_id: Optional[str], write: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """같은 요청 ID 의 쓰기는 한 번만 실행하고, 재시도에는 (진행 중이면 기다렸다가) 같은 결과를 돌려줍니다."""
+        if not request_id:
+            return write()
+        with self._requests_lock:
+            future = self._requests.get(request_id)
+            first = future is None
+            if first:
+                future = self._requests[request_id] = Future()
+                while len(self._requests) > WRITE_DEDUP_SIZE:
+                    self._requests.popitem(last=False)
+        if first:
+            try:
+                future.set_result(write())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]) -> int:
+        with self._write_lock:
+            if self.backend == "faiss":
+                self._faiss_writer().add_embeddings(ids, embeddings, documents, metadatas)
+            else:
+                self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        return len(ids)
+
+    def delete(self, ids: List[str]) -> int:
+        with self._write_lock:
+            if self.backend == "faiss":
+                self._faiss_writer().delete(ids)
+            elif ids:
+                self._collection.delete(ids=ids)
+        return len(ids)
+
+    def commit(self) -> int:
+        """FAISS: 쌓인 쓰기를 새 세대로 기록하고 writer 를 닫아 메모리에는 읽기용 인덱스 한 벌만 남김."""
+        with self._write_lock:
+            if self._writer_expired:
+                self._writer_expired = False
+                if self._writer is not None:
+                    self._writer.rollback()
+                    self._writer = None
+                raise RuntimeError(f"writer session idle for over {RETRIEVAL_WRITER_IDLE_SEC:g}s was rolled back; "
+                                   "re-run the ingestion")
+            if self.backend == "faiss" and self._writer is not None:
+                self._writer.persist()
+                self._writer = None
+        return self.generation()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "count": self.count(), "generation": self.generation(),
+                "writerOpen": self._writer is not None, **self.coalescer.stats()}
+
+
+class _RetrievalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 클라이언트가 연결을 재사용
+    disable_nagle_algorithm = True  # 헤더/본문을 따로 쓰므로 TCP 지연 ACK 로 ~40ms 씩 늦어지지 않도록
+    service: RetrievalService
+
+    def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/healthz") or self.path.startswith("/stats"):
+            self._reply(200, self.service.stats())
+        elif self.path.startswith("/count"):
+            self._reply(200, {"count": self.service.count()})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        service = self.service
+        request_id = self.headers.get("X-Request-Id")
+        try:
+            if self.path == "/query":
+                payload = service.query(request["queryEmbeddings"], request.get("nResults", 4), request.get("where"))
+            elif self.path == "/upsert":
+                payload = service.run_once(request_id, lambda: {"upserted": service.upsert(
+                    request["ids"], request["embeddings"], request["documents"], request["metadatas"])})
+            elif self.path == "/delete":
+                payload = service.run_once(request_id, lambda: {"deleted": service.delete(request["ids"])})
+            elif self.path == "/commit":
+                payload = service.run_once(request_id, lambda: {"generation": service.commit()})
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+                return
+        except Exception as e:
+            logging.exception("retrieval service: %s failed", self.path)
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.debug("retrieval service: " + format, *args)
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128  # 워커/세션이 한꺼번에 연결해도 거절되지 않도록 (기본값 5)
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        conn, _ = super().get_request()
+        return conn, ("unix", 0)  # BaseHTTPRequestHandler 는 (host, port) 를 기대
+
+def serve(service: Optional[RetrievalService] = None, port: int = RETRIEVAL_PORT, socket_path: str = "",
+          background: bool = False) -> socketserver.BaseServer:
+    # TCP_NODELAY 는 Unix 소켓에서 지원되지 않음
+    handler = type("RetrievalHandler", (_RetrievalHandler,),
+                   {"service": service or RetrievalService(), "disable_nagle_algorithm": not socket_path})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server: socketserver.BaseServer = _UnixHTTPServer(socket_path, handler)
+        logging.info("retrieval service listening on unix://%s", socket_path)
+    else:
+        server = _TCPHTTPServer(("127.0.0.1", port), handler)  # 같은 호스트의 클라이언트만
+        logging.info("retrieval service listening on http://127.0.0.1:%d", port)
+    if background:
+        threading.Thread(target=server.serve_forever, name="retrieval-http", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+# Client
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class RemoteVectorStore:
+    """
+    검색 서비스 클라이언트. FaissVectorStore 처럼 embeddings, add_documents, delete, persist 와
+    chromadb 컬렉션 모양의 query/count 를 제공하므로 chat.py / lambda_function_embedding.py 가 그대로 사용합니다.
+    """
+
+    def __init__(self, url: str, embeddings: Embeddings, timeout: float = RETRIEVAL_TIMEOUT_SEC) -> None:
+        self.url = url
+        self.embeddings = embeddings
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            if parsed.scheme == "unix":
+                conn = _UnixHTTPConnection(parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or RETRIEVAL_PORT, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+              write: bool = False) -> Dict[str, Any]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        if write:
+            # 응답 전에 끊겨(타임아웃 등) 다시 보내도 서비스가 요청 ID 로 한 번만 적용
+            headers["X-Request-Id"] = uuid.uuid4().hex
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = json.loads(response.read() or b"{}")
+                break
+            except (ConnectionError, http.client.HTTPException, OSError):
+                # 서비스 재시작 등으로 끊긴 keep-alive 연결은 한 번 다시 연결
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"retrieval service {path} failed ({response.status}): {data.get('error')}")
+        return data
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 4,
+              where: Optional[Dict[str, Any]] = None, include: Sequence[str] = ()) -> Dict[str, List[List[Any]]]:
+        return self._call("POST", "/query", {"queryEmbeddings": [list(map(float, v)) for v in query_embeddings],
+                                             "nResults": n_results, "where": where})
+
+    def count(self) -> int:
+        return self._call("GET", "/count")["count"]
+
+    def add_documents(self, documents: Sequence[Document], ids: Sequence[str]) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embeddings.embed_documents(texts)
+        self._call("POST", "/upsert", {"ids": list(ids), "embeddings": vectors, "documents": texts,
+                                       "metadatas": [dict(doc.metadata) for doc in documents]}, write=True)
+        return list(ids)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        self._call("POST", "/delete", {"ids": list(ids)}, write=True)
+
+    def persist(self) -> int:
+        return self._call("POST", "/commit", {}, write=True)["generation"]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call("GET", "/stats")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared retrieval service for the SafeGuard AI RAG pipeline")
+    parser.add_argument("--port", type=int, default=RETRIEVAL_PORT)
+    parser.add_argument("--socket", default="", help="listen on a Unix socket instead of localhost HTTP")
+    parser.add_argument("--backend", choices=["chroma", "faiss"], default=VECTOR_BACKEND)
+    parser.add_argument("--vector-dir", default=VECTOR_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(RetrievalService(args.backend, args.vector_dir), port=args.port, socket_path=args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "ecs-rag-pipeline")]
+
+
+@pytest.fixture
+def event_store(tmp_path, monkeypatch):
+    """임시 SQLite 이벤트 테이블로 바꾼 get_store()."""
+    import event_store as store_module
+    import lambda_function_event
+
+    store = store_module.EventStore(tmp_path / "events.db", legacy_json=None)
+    monkeypatch.setattr(lambda_function_event, "get_store", lambda: store)
+    return store
@@ -0,0 +1,61 @@
+import lambda_function_event as lfe
+from job_queue import PRIORITY_HIGH, JobQueue
+
+
+def make_event(event_id: str, ts: str, severity: str):
+    return {
+        "siteId": "OCTANK-1", "deviceId": "3F-07", "eventId": event_id, "ts": ts, "eventType": "FIRE_ALERT",
+        "severity": severity, "message": f"{severity} fire alert", "roiId": "TANK-AREA-A", "model": lfe.MODEL_INFO,
+    }
+
+
+def test_escalation_before_claim_updates_pending_payload(tmp_path, event_store, monkeypatch):
+    monkeypatch.setattr(lfe, "INCIDENT_WINDOW_SEC", 60)
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+
+    first = lfe.lambda_handler(make_event("1", "2025-07-27T08:00:00Z", "MEDIUM"))["content"]
+    job_id = queue.enqueue(first["item"])
+
+    # 같은 인시던트에 HIGH 이벤트가 합쳐짐 (작업은 아직 PENDING)
+    escalated = lfe.lambda_handler(make_event("2", "2025-07-27T08:00:20Z", "HIGH"))["content"]
+    assert escalated["action"] == "escalated" and escalated["coalescedInto"] == "1"
+    assert queue.enqueue(escalated["item"], priority=PRIORITY_HIGH) == job_id
+
+    job = queue.claim("w0")
+    assert job["job_id"] == job_id and job["priority"] == PRIORITY_HIGH
+    assert job["payload"]["severity"] == "HIGH"
+    assert job["payload"]["incident"]["count"] == 2
+    assert queue.counts() == {"RUNNING": 1}
+
+
+def test_changed_payload_while_running_is_queued_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.enqueue({"eventId": "1", "severity": "MEDIUM"})
+    queue.claim("w0")
+    assert queue.enqueue({"eventId": "1", "severity": "MEDIUM"}) == job_id
+    assert queue.enqueue({"eventId": "1", "severity": "HIGH"}) != job_id
+
+
+def test_expired_lease_is_not_finished_by_previous_worker(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.enqueue({"eventId": "1", "severity": "MEDIUM"})
+    queue.claim("w0", lease_sec=0)
+
+    # lease 가 만료되어 w1 이 다시 가져간 뒤에는 w0 의 heartbeat / complete / fail 이 반영되지 않음
+    assert queue.claim("w1")["job_id"] == job_id
+    assert not queue.set_progress(job_id, "stale", "w0")
+    assert not queue.complete(job_id, "w0")
+    assert queue.fail(job_id, "boom", "w0") is None
+    assert queue.counts() == {"RUNNING": 1}
+
+    assert queue.set_progress(job_id, "partial", "w1")
+    assert queue.complete(job_id, "w1")
+    assert queue.counts() == {"DONE": 1}
+
+
+def test_progress_extends_lease(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.enqueue({"eventId": "1", "severity": "MEDIUM"})
+    queue.claim("w0", lease_sec=0)
+    assert queue.set_progress(job_id, None, "w0", lease_sec=60)
+    assert queue.claim("w1") is None
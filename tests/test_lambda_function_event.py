@@ -0,0 +1,48 @@
+import json
+
+import lambda_function_event as lfe
+
+
+def make_event(event_id: str, **overrides):
+    event = {
+        "siteId": "OCTANK-1", "deviceId": "3F-07", "eventId": event_id, "ts": "2025-07-27T08:15:23Z",
+        "eventType": "FIRE_ALERT", "severity": "LOW", "message": "Fire alert triggered at Tank Area A.",
+        "roiId": "TANK-AREA-A", "model": lfe.MODEL_INFO,
+    }
+    event.update(overrides)
+    return event
+
+
+def test_validate_event_accepts_empty_values_and_rejects_bad_ts():
+    assert lfe.validate_event(make_event("1", model={}, message="")) == []
+    assert lfe.validate_event(make_event("1", ts="not-a-time")) == ["invalid ts: 'not-a-time'"]
+    assert lfe.validate_event([1, 2]) == ["event must be a JSON object, got list"]
+
+
+def test_batch_handler_reports_non_object_bodies_per_record(event_store, monkeypatch):
+    monkeypatch.setattr(lfe, "INCIDENT_WINDOW_SEC", 0)
+    records = [
+        {"messageId": "good-1", "body": json.dumps(make_event("1"))},
+        {"messageId": "list", "body": "[1,2]"},
+        {"messageId": "null", "body": "null"},
+        {"messageId": "int", "body": "123"},
+        {"messageId": "bad-ts", "body": json.dumps(make_event("2", ts="not-a-time"))},
+        {"messageId": "good-2", "body": make_event("3", roiId="LOADING-BAY")},
+    ]
+    response = lfe.batch_handler({"Records": records})
+
+    assert response["statusCode"] == 200
+    assert [f["itemIdentifier"] for f in response["batchItemFailures"]] == ["list", "null", "int", "bad-ts"]
+    assert response["content"]["written"] == 2
+    assert event_store.get_item("1") is not None and event_store.get_item("3") is not None
+
+
+def test_lambda_handler_rejects_non_object_event(event_store):
+    response = lfe.lambda_handler("[1,2]")
+    assert response["statusCode"] == 400
+
+
+def test_image_required_is_still_coerced():
+    item = lfe.build_item(make_event("1", imageRequired="true"))
+    assert lfe.validate_event(make_event("1", imageRequired=1)) == []
+    assert item["image"]["required"] is True
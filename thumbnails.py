@@ -0,0 +1,98 @@
+'''
+이벤트 이미지의 썸네일(thumbKey)을 만들고 내용 주소(content-addressed) 캐시에 저장합니다.
+
+썸네일 경로는 (원본 바이트 + 썸네일 설정)의 SHA-256 으로 정해지므로, 같은 이미지가 여러 이벤트에
+붙거나(카메라가 같은 장면을 반복 전송) 다시 업로드되어도 한 번만 인코딩합니다.
+설정(크기/형식/품질)이 바뀌면 다른 키가 되어 새로 만들어집니다.
+
+    python thumbnails.py data_source/s3_anomaly_images/FIRE_ALERT.png
+'''
+
+import hashlib
+import logging
+import os
+import sys
+from typing import Dict, Optional, Tuple
+
+from metrics import timed
+
+# Configuration
+THUMB_DIR = os.getenv("THUMB_DIR", "./data_source/s3_anomaly_thumbs")
+THUMB_MAX_PX = int(os.getenv("THUMB_MAX_PX", "320"))        # 긴 변 기준 최대 픽셀
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp").lower()    # webp | jpeg
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "75"))
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+# Fucntions
+def _format() -> str:
+    from PIL import features
+    # WebP 를 지원하지 않는 Pillow 빌드에서는 JPEG 로
+    return THUMB_FORMAT if THUMB_FORMAT != "webp" or features.check("webp") else "jpeg"
+
+def thumb_key(data: bytes, max_px: int = THUMB_MAX_PX, fmt: Optional[str] = None,
+              quality: int = THUMB_QUALITY) -> str:
+    """원본 바이트와 설정으로 정해지는 썸네일 키 (THUMB_DIR 기준 상대 경로)."""
+    fmt = fmt or _format()
+    digest = hashlib.sha256(data)
+    digest.update(f"|{max_px}|{fmt}|{quality}".encode("ascii"))
+    name = digest.hexdigest()
+    return f"{name[:2]}/{name}.{_EXTENSIONS[fmt]}"
+
+def thumb_path(key: str, thumb_dir: str = THUMB_DIR) -> str:
+    return os.path.join(thumb_dir, key)
+
+def encode_thumbnail(data: bytes, max_px: int = THUMB_MAX_PX, fmt: Optional[str] = None,
+                     quality: int = THUMB_QUALITY) -> Tuple[bytes, Tuple[int, int]]:
+    import io
+    from PIL import Image, ImageOps
+
+    fmt = fmt or _format()
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG 는 디코딩 단계에서 1/2~1/8 로 줄여 읽음 (전체 해상도 디코딩 생략)
+        image.draft("RGB", (max_px, max_px))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGB")
+        image.thumbnail((max_px, max_px), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        out = io.BytesIO()
+        if fmt == "webp":
+            image.save(out, "WEBP", quality=quality, method=4)
+        else:
+            image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue(), image.size
+
+def make_thumbnail(data: bytes, thumb_dir: str = THUMB_DIR, max_px: int = THUMB_MAX_PX,
+                   fmt: Optional[str] = None, quality: int = THUMB_QUALITY) -> str:
+    """
+    Return the thumbKey for image *data*, encoding and storing the thumbnail only if this
+    content (with these settings) has not been seen before.
+    """
+    fmt = fmt or _format()
+    key = thumb_key(data, max_px, fmt, quality)
+    path = thumb_path(key, thumb_dir)
+    with timed("thumbnail", items=1) as span:
+        if os.path.exists(path):
+            span["hits"] = 1
+            return key
+        thumb, size = encode_thumbnail(data, max_px, fmt, quality)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(thumb)
+        os.replace(tmp, path)  # 원자적 교체: 동시에 같은 이미지를 처리해도 안전
+    logging.info("thumbnail %s: %d -> %d bytes (%dx%d %s)", key, len(data), len(thumb), size[0], size[1], fmt)
+    return key
+
+def make_thumbnail_for_file(image_path: str, thumb_dir: str = THUMB_DIR) -> str:
+    with open(image_path, "rb") as fp:
+        return make_thumbnail(fp.read(), thumb_dir)
+
+def cache_stats(thumb_dir: str = THUMB_DIR) -> Dict[str, int]:
+    files = [os.path.join(root, f) for root, _, names in os.walk(thumb_dir) for f in names]
+    return {"thumbnails": len(files), "bytes": sum(os.path.getsize(f) for f in files)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for arg in sys.argv[1:]:
+        print(arg, "->", thumb_path(make_thumbnail_for_file(arg)))